@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import config
+
+# 对语义几乎没有影响的疑问套话，归一化时直接去掉，
+# 使 "什么是SQL注入" 与 "SQL注入是什么？" 得到相同的键
+FILLER_PHRASES = ["请问", "什么是", "是什么", "什么叫", "是指什么"]
+# 句末语气词只在末尾去掉（"吗啡" 中的 "吗" 不是语气词）
+FINAL_PARTICLES = ("吗", "呢")
+
+# 只去掉空白与句读标点；+ # . - / _ 等符号保留，它们常是技术名词的一部分
+# （"C++"、"C#"、"TLS1.3"、"TCP/IP" 去掉后会与 "C"、"TLS13" 等别的问题共用一个键）
+_PUNCT_RE = re.compile(r"[\s,!?;:'\"`()\[\]{}<>~，。！？、；：“”‘’（）《》〈〉【】「」『』…—·]+")
+# 句末的英文句号（"What is XSS."）与语气词一样只在末尾去掉
+_FINAL_PUNCT = "."
+
+# 每个缓存条目除文本外的固定开销估计（字节）
+_ENTRY_OVERHEAD = 256
+
+
+def normalize_question(text: str) -> str:
+    """全角转半角、小写、去掉空白与句读标点、疑问套话与句末语气词（技术符号保留）"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    for phrase in FILLER_PHRASES:
+        text = text.replace(phrase, "")
+    text = _PUNCT_RE.sub("", text)
+    while text.endswith(FINAL_PARTICLES) or text.endswith(_FINAL_PUNCT):
+        text = text[:-1]
+    return text
+
+
+class AnswerCache:
+    """
+    问答结果缓存，键为 (人格类型, 归一化问题)，只有归一化后完全相同的问题才命中。
+    不做相似度匹配：安全问答中一字之差往往就是另一个问题（"对称加密" 与 "非对称加密"、
+    相邻的 CVE 编号），近似命中会把别的问题的回答返回给用户。
+    淘汰策略为 LRU + TTL，并同时受条目数与估算内存上限约束。线程安全。
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl: float = None):
+        self.max_entries = max_entries if max_entries is not None else config.ANSWER_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else config.ANSWER_CACHE_MAX_BYTES
+        self.ttl = ttl if ttl is not None else config.ANSWER_CACHE_TTL
+
+        # key -> (answer, size, expires_at)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question: str, personality_type: str) -> Optional[str]:
+        """查找缓存的回答，未命中返回 None"""
+        normalized = normalize_question(question)
+        if not normalized:
+            return None
+        key = (personality_type, normalized)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, question: str, personality_type: str, answer: str):
+        """写入一条回答，必要时按 LRU 淘汰旧条目"""
+        normalized = normalize_question(question)
+        if not normalized or not answer:
+            return
+        key = (personality_type, normalized)
+        size = len(answer.encode("utf-8")) + len(normalized.encode("utf-8")) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (answer, size, time.time() + self.ttl)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中计数与当前占用"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: Tuple[str, str]):
+        """删除条目并维护内存计数（调用方需持有锁）"""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
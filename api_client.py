@@ -1,14 +1,206 @@
+import json
+import logging
+import random
+import threading
+import time
 import requests
-from typing import Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Iterator, Optional, TypeVar
 from config import config
+from search_cache import SearchCache
+from data_processor import merge_results
+from hedging import HedgePolicy, hedged_call
+from transport import PooledTransport, get_transport
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class APIError(Exception):
+    """上游接口调用失败（非 200 响应、超时或连接错误）"""
+
+    def __init__(self, message: str, endpoint: str = None, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.status_code = status_code
+
+    @property
+    def retryable(self) -> bool:
+        """超时、连接错误、429 与 5xx 视为暂时性故障，可以重试"""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class CircuitOpenError(APIError):
+    """熔断器处于打开状态，请求未发出即失败"""
+
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    连续失败计数熔断器，线程安全。
+    - closed: 正常放行，连续失败 failure_threshold 次后打开
+    - open: 直接拒绝，reset_timeout 秒后进入 half_open
+    - half_open: 只放行一个探测请求，成功则关闭，失败则重新打开
+    探测请求被放弃（调用被取消、抛出 BaseException）时，调用方用 release_probe() 释放探测名额；
+    漏掉释放时，超过 reset_timeout 仍未返回的探测视为已失效，下一个请求接替探测。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold if failure_threshold is not None else config.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout if reset_timeout is not None else config.CIRCUIT_RESET_TIMEOUT
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.opened_count = 0
+        self.rejected = 0
+
+    def before_call(self) -> bool:
+        """
+        请求发出前调用；熔断打开时抛出 CircuitOpenError。
+        :return: 本次请求是否为 half_open 状态下的探测请求
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CIRCUIT_OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+            if self.state == CIRCUIT_CLOSED:
+                return False
+            if self.state == CIRCUIT_HALF_OPEN and (
+                    not self._probe_in_flight or now - self._probe_started >= self.reset_timeout):
+                self._probe_in_flight = True
+                self._probe_started = now
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} upstream unavailable (circuit open)", endpoint=self.name)
+
+    def release_probe(self):
+        """探测请求没有结果就被放弃时调用：释放探测名额，保持 half_open，由下一个请求重新探测"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CIRCUIT_CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == CIRCUIT_HALF_OPEN or (
+                    self.state == CIRCUIT_CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+                self.opened_count += 1
+                logger.warning(f"Circuit for {self.name} opened after {self.consecutive_failures} consecutive failures")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened_count": self.opened_count,
+                "rejected": self.rejected,
+            }
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次（从 0 开始）重试前的等待时间：带随机抖动的指数退避（full jitter）"""
+    return random.uniform(0, min(config.RETRY_BACKOFF_MAX, config.RETRY_BACKOFF_BASE * 2 ** attempt))
 
 
 class APIClient:
-    def __init__(self):
+    def __init__(self, search_cache=None, transport: PooledTransport = None):
+        """
+        :param search_cache: 检索结果缓存，需提供 get/put/invalidate 方法；
+                             默认按配置创建 SearchCache，SEARCH_CACHE_ENABLED 关闭时不缓存
+        :param transport: HTTP 传输层，默认使用进程内共享的连接池
+        """
         self.base_url = config.BASE_URL
         self.token = config.TOKEN
-        self.session = requests.Session()
-        self.session.headers.update({"Content-Type": "application/json"})
+        self.transport = transport or get_transport()
+        if search_cache is None and config.SEARCH_CACHE_ENABLED:
+            search_cache = SearchCache()
+        self.search_cache = search_cache
+        # 线程池的线程按需创建，在这里一次性创建执行器，避免多个线程并发初始化时各建一个
+        self._search_executor = ThreadPoolExecutor(max_workers=config.SEARCH_MANY_WORKERS)
+        self.timeouts = {
+            "search": (config.SEARCH_CONNECT_TIMEOUT, config.SEARCH_READ_TIMEOUT),
+            "dialogue": (config.DIALOGUE_CONNECT_TIMEOUT, config.DIALOGUE_READ_TIMEOUT),
+        }
+        self.breakers = {endpoint: CircuitBreaker(endpoint) for endpoint in self.timeouts}
+        self.hedge_policy = HedgePolicy() if config.HEDGE_ENABLED else None
+        self._hedge_executor = ThreadPoolExecutor(max_workers=config.HEDGE_WORKERS) if config.HEDGE_ENABLED else None
+
+    @property
+    def session(self) -> requests.Session:
+        """当前线程的 Session（共享连接池）"""
+        return self.transport.session()
+
+    def _post(self, endpoint: str, url: str, payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """
+        经熔断器发起一次 POST（带该接口的连接 / 读取超时），非 200 响应抛出 APIError。
+        超时、连接错误、429 与 5xx 计为上游故障；其余 4xx 是请求本身的问题，不影响熔断状态。
+        """
+        breaker = self.breakers[endpoint]
+        probe = breaker.before_call()
+        try:
+            resp = self.session.post(url, json=payload, timeout=self.timeouts[endpoint], stream=stream)
+        except requests.RequestException as e:
+            breaker.record_failure()
+            raise APIError(f"{endpoint.capitalize()} API error: {e}", endpoint=endpoint) from e
+        except BaseException:
+            # 没有得到结果（如 KeyboardInterrupt），不计入熔断状态，但不能一直占着探测名额
+            if probe:
+                breaker.release_probe()
+            raise
+
+        if resp.status_code != 200:
+            error = APIError(f"{endpoint.capitalize()} API error: {resp.text}", endpoint=endpoint,
+                             status_code=resp.status_code)
+            resp.close()
+            if error.retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise error
+        breaker.record_success()
+        return resp
+
+    def _with_retries(self, endpoint: str, attempt: Callable[[], T]) -> T:
+        """
+        幂等请求的重试：attempt 执行一次请求，暂时性故障按带随机抖动的指数退避重试（full jitter），
+        熔断打开时不再重试
+        """
+        for attempt_no in range(config.SEARCH_MAX_RETRIES + 1):
+            try:
+                return attempt()
+            except CircuitOpenError:
+                raise
+            except APIError as e:
+                if not e.retryable or attempt_no >= config.SEARCH_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt_no)
+                logger.warning(f"{endpoint} attempt {attempt_no + 1} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def hedge_stats(self) -> Optional[Dict]:
+        """检索对冲请求的统计（未启用时为 None）"""
+        return self.hedge_policy.stats() if self.hedge_policy is not None else None
+
+    def circuit_stats(self) -> Dict[str, Dict]:
+        """各上游接口的熔断器状态"""
+        return {endpoint: breaker.stats() for endpoint, breaker in self.breakers.items()}
 
     def search(self, db_name: str, query: str, top_k: int = None, expr: str = None) -> Dict[str, Any]:
         """
@@ -30,26 +222,105 @@ class APIClient:
         if expr:
             payload["expr"] = expr
 
-        resp = self.session.post(url, json=payload)
-        if resp.status_code != 200:
-            raise Exception(f"Search API error: {resp.text}")
+        cache_key = (db_name, query, final_top_k, config.DEFAULT_METRIC_TYPE, expr)
+        if self.search_cache is not None:
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "files": list(cached["files"])}
+
+        def request_once():
+            return self._post("search", url, payload).json()
+
+        # 对冲包在单次请求外、重试包在对冲外：延迟样本只含单次请求的耗时（不含退避等待），
+        # 一次对冲也只多发一个请求，而不是一整条重试链
+        if self.hedge_policy is not None:
+            def attempt():
+                return hedged_call(request_once, self.hedge_policy, self._hedge_executor)
+        else:
+            attempt = request_once
+        data = self._with_retries("search", attempt)
 
         # 返回 JSON 数据，但要确保 files 键存在且是一个列表
-        data = resp.json()
         if "files" not in data or not isinstance(data["files"], list):
             # 如果API返回的数据格式不符合预期，返回一个空列表，避免后续代码出错
             return {"files": []}
 
+        if self.search_cache is not None:
+            self.search_cache.put(cache_key, data)
+            return {**data, "files": list(data["files"])}
         return data
 
-    def dialogue(self, user_input: str) -> str:
+    def search_many(self, db_name: str, queries: List[str], top_k: int = None, expr: str = None) -> Dict[str, Any]:
+        """
+        并发执行多条检索（共用传输层的连接池）。
+        :return: {"results": 与 queries 一一对应的检索结果, "merged": 去重后按最高分合并的文档列表}
+        """
+        if len(queries) <= 1:
+            results = [self.search(db_name, q, top_k=top_k, expr=expr) for q in queries]
+        else:
+            futures = [self._search_executor.submit(self.search, db_name, q, top_k, expr) for q in queries]
+            results = [f.result() for f in futures]
+        return {"results": results, "merged": merge_results([r["files"] for r in results])}
+
+    def invalidate_search_cache(self, db_name: str = None):
+        """数据库写入新文件后调用，丢弃该库已缓存的检索结果"""
+        if self.search_cache is not None:
+            self.search_cache.invalidate(db_name)
+
+    def dialogue(self, user_input: str, max_tokens: int = 1024) -> str:
         """调用 /dialogue 接口"""
         url = f"{self.base_url}/dialogue"
         payload = {"user_input": user_input,
                    "token": self.token,
-                   "max_tokens": 1024
+                   "max_tokens": max_tokens
                    }
-        resp = self.session.post(url, json=payload)
-        if resp.status_code != 200:
-            raise Exception(f"Dialogue API error: {resp.text}")
+        resp = self._post("dialogue", url, payload)
         return resp.json().get("response", "")
+
+    def dialogue_stream(self, user_input: str) -> Iterator[str]:
+        """
+        调用 /dialogue 接口的流式版本，逐段产出生成的文本。
+        兼容三种上游响应：SSE (text/event-stream)、分块纯文本、以及不支持流式时的普通 JSON。
+        """
+        url = f"{self.base_url}/dialogue"
+        payload = {"user_input": user_input,
+                   "token": self.token,
+                   "max_tokens": 1024,
+                   "stream": True
+                   }
+        with self._post("dialogue", url, payload, stream=True) as resp:
+            content_type = resp.headers.get("Content-Type", "")
+            if "application/json" in content_type:
+                # 上游不支持流式，一次性返回全部内容
+                yield resp.json().get("response", "")
+                return
+
+            if resp.encoding is None:
+                resp.encoding = "utf-8"
+
+            if "text/event-stream" in content_type:
+                for line in resp.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    text = _extract_stream_text(data)
+                    if text:
+                        yield text
+                return
+
+            for chunk in resp.iter_content(chunk_size=None, decode_unicode=True):
+                if chunk:
+                    yield chunk
+
+
+def _extract_stream_text(data: str) -> str:
+    """从一条 SSE data 中取出文本：可能是 JSON（response/content/delta 字段）或纯文本"""
+    try:
+        obj = json.loads(data)
+    except ValueError:
+        return data
+    if isinstance(obj, dict):
+        return obj.get("response") or obj.get("content") or obj.get("delta") or ""
+    return str(obj)
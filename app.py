@@ -1,18 +1,22 @@
-from flask import Flask, request, jsonify,render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from flask_cors import CORS
-from api_client import APIClient
-from data_processor import extract_context, files_to_citations
-from prompt_builder import build_chat_prompt
-from guard import validate_user_input, validate_prompt
-from response_evaluator import integrate_with_rag_flow
+from api_client import APIClient, CircuitOpenError
+from data_processor import extract_context, files_to_citations, merge_results, pack_context, cited_context
+from prompt_builder import build_chat_prompt, detect_personality, PromptStats
+from guard import validate_user_input, validate_llm_output, InjectionScanner, StreamingOutputGuard
+from evaluation_queue import EvaluationQueue, STATUS_PENDING
+from answer_cache import AnswerCache
+from intent_classifier import IntentClassifier, normalize_verdict
+from retrieval_controller import RetrievalController, PATH_EARLY_EXIT
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from conversation_store import create_conversation_store
+from transport import get_transport
+from ingestion import IngestionManifest, AdaptiveUploader, iter_json_documents, prefetch, STATUS_UPLOADED, STATUS_FAILED
 from config import config
 import time
-import requests
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterator
 import logging
-import uuid
 import json
-import os
 import urllib3
 import concurrent.futures
 
@@ -21,14 +25,11 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 app = Flask(__name__)
 CORS(app)
 
-#并行上传
-BATCH_SIZE = 50           # batch量
-MAX_WORKERS = 4            # 并发数
+#并行上传（批次字节数与并发由 AdaptiveUploader 自适应调整，见 config.INGEST_*）
 REQUEST_TIMEOUT = 300      # 超时时间
 
 # 全局变量存储对话历史和数据库名
 history: List[Dict[str, str]] = []
-conversations: Dict[str, Tuple[str, List[Dict[str, str]]]] = {}  # <--- ✅ 修复：添加这一行
 db_name = "student_Group4_llll"  # 固定的数据库名称
 
 logging.basicConfig(
@@ -40,6 +41,30 @@ logging.basicConfig(
 )
 
 client = APIClient()
+# 检索后端：默认走远程向量库，也可切换为进程内的本地向量索引
+if config.RETRIEVAL_BACKEND == "local":
+    from local_index import LocalVectorIndex
+    retriever = LocalVectorIndex.load(config.LOCAL_INDEX_DIR)
+else:
+    retriever = client
+# 首轮（无历史）问答缓存
+answer_cache = AnswerCache()
+# 本地意图分类快速通道，只有不确定的输入才调用 LLM 审查
+intent_classifier = IntentClassifier() if config.LOCAL_INTENT_ENABLED else None
+# 两阶段检索的提前退出控制器
+retrieval_controller = RetrievalController()
+# BM25 关键词索引，覆盖已上传的文档，与向量检索结果做 RRF 融合
+lexical_index = LexicalIndex()
+# 对话历史存储（内存 LRU + 溢出到磁盘，或多进程共享的 SQLite）
+conversation_store = create_conversation_store()
+# Prompt 体积统计（平均 / 最大 token 数）
+prompt_stats = PromptStats()
+# 增量的 Prompt 注入检测：文档入库时扫描、历史消息只扫描一次、每轮只扫描新输入
+injection_scanner = InjectionScanner()
+# 后台回答质量评估，与主流程共用同一个客户端
+evaluation_queue = EvaluationQueue(client=client)
+# 推测执行线程池：意图审查与第一阶段检索并发进行
+pipeline_executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.PIPELINE_WORKERS)
 # --- 新增 ---: 意图审查的 Prompt 模板
 INTENT_CLASSIFICATION_PROMPT = """
 分析以下用户输入的意图。请仅回答 'benign' (良性) 或 'malicious' (恶意)。
@@ -59,207 +84,38 @@ INTENT_CLASSIFICATION_PROMPT = """
 分类 (仅回答 'benign' 或 'malicious'):
 """
 
-def load_json_files(directory='json_files'):
+def llm_classify_intent(user_input: str) -> str:
+    """调用 LLM 进行意图审查，返回规范化后的分类结果（'benign' 或其他）"""
+    intent_prompt = INTENT_CLASSIFICATION_PROMPT.format(user_input=user_input)
+    intent_response = client.dialogue(intent_prompt).strip().lower()
+    return normalize_verdict(intent_response) or intent_response
+
+def classify_intent(user_input: str) -> Tuple[str, str]:
     """
-    从指定目录加载JSON文件
-    支持多种格式：
-    1. CQA三元组格式 (context, question, answer) - 新增支持
-    2. concept格式 (原有格式)
-    3. content格式 (原有格式)
+    分层意图审查：先走本地分类器，不确定时才调用 LLM。
+    :return: (分类结果, 判定来源 'memo'/'rule'/'local'/'llm')
     """
-    files = []
-    print(f"🔍 正在扫描目录: {directory}")
-    
-    if not os.path.exists(directory):
-        print(f"❌ 目录 {directory} 不存在")
-        return files
-    
-    json_files = [f for f in os.listdir(directory) if f.endswith('.json')]
-    print(f"📄 找到 {len(json_files)} 个JSON文件: {json_files}")
-    
-    for filename in json_files:
-        filepath = os.path.join(directory, filename)
-        print(f"📖 正在处理文件: {filename}")
-        
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
-            
-            print(f"✅ JSON文件 {filename} 解析成功，数据类型: {type(json_data)}")
-            
-            # 处理单个条目的通用函数
-            def process_item(item, source_name):
-                """
-                处理单个JSON条目，支持多种格式
-                返回：成功处理的文档数量
-                """
-                docs_added = 0
-                
-                # ========== 格式1: CQA三元组 (优先处理) ==========
-                if all(k in item for k in ['context', 'question', 'answer']):
-                    context = item.get('context', '').strip()
-                    question = item.get('question', '').strip()
-                    answer = item.get('answer', '').strip()
-                    
-                    if not (context and question and answer):
-                        print(f"⚠️ {source_name}: CQA字段存在但内容为空，已跳过")
-                        return 0
-                    
-                    # 策略1: 完整的CQA文档
-                    full_content = f"""【背景知识】
-{context}
-
-【相关问题】
-{question}
-
-【参考答案】
-{answer}"""
-                    
-                    files.append({
-                        "file": full_content,
-                        "metadata": {
-                            "source": source_name,
-                            "type": "full_cqa",
-                            "context": context,
-                            "question": question,
-                            "answer": answer
-                        }
-                    })
-                    docs_added += 1
-                    
-                    # 策略2: Context + Question (更容易匹配问题)
-                    cq_content = f"""问题：{question}
-
-相关背景：{context}"""
-                    
-                    files.append({
-                        "file": cq_content,
-                        "metadata": {
-                            "source": f"{source_name}_cq",
-                            "type": "context_question",
-                            "full_answer": answer
-                        }
-                    })
-                    docs_added += 1
-                    
-                    # 策略3: Question + Answer (QA对匹配)
-                    qa_content = f"""Q: {question}
-
-A: {answer}"""
-                    
-                    files.append({
-                        "file": qa_content,
-                        "metadata": {
-                            "source": f"{source_name}_qa",
-                            "type": "question_answer",
-                            "full_context": context
-                        }
-                    })
-                    docs_added += 1
-                    
-                    print(f"✅ [CQA格式] {source_name}: 生成 {docs_added} 个文档")
-                    return docs_added
-                
-                # ========== 格式2: concept格式 (原有格式) ==========
-                elif 'concept' in item:
-                    content = item.get('concept', '').strip()
-                    metadata = item.get('metadata', {'source': source_name})
-                    
-                    if 'description' in item:
-                        if not isinstance(metadata, dict):
-                            metadata = {'source': source_name}
-                        metadata['description'] = item['description']
-                    
-                    if content:
-                        files.append({
-                            "file": content,
-                            "metadata": metadata
-                        })
-                        print(f"✅ [concept格式] {source_name}: 长度 {len(content)} 字符")
-                        return 1
-                    else:
-                        print(f"⚠️ {source_name}: concept字段为空")
-                        return 0
-                
-                # ========== 格式3: content格式 (原有格式) ==========
-                elif 'content' in item:
-                    content = item.get('content', '').strip()
-                    metadata = item.get('metadata', {'source': source_name})
-                    
-                    if 'description' in item:
-                        if not isinstance(metadata, dict):
-                            metadata = {'source': source_name}
-                        metadata['description'] = item['description']
-                    
-                    if content:
-                        files.append({
-                            "file": content,
-                            "metadata": metadata
-                        })
-                        print(f"✅ [content格式] {source_name}: 长度 {len(content)} 字符")
-                        return 1
-                    else:
-                        print(f"⚠️ {source_name}: content字段为空")
-                        return 0
-                
-                # ========== 不支持的格式 ==========
-                else:
-                    print(f"❌ {source_name}: 不支持的格式，需要 context/question/answer 或 concept 或 content 字段")
-                    return 0
-            
-            # 处理JSON数据（可能是单个对象或列表）
-            total_docs = 0
-            
-            if isinstance(json_data, dict):
-                # 单个文档
-                total_docs = process_item(json_data, filename)
-                
-            elif isinstance(json_data, list):
-                # 文档列表
-                print(f"📋 文件 {filename} 包含 {len(json_data)} 个条目")
-                for i, item in enumerate(json_data):
-                    if isinstance(item, dict):
-                        source_id = f"{filename}_item{i+1}"
-                        total_docs += process_item(item, source_id)
-                    else:
-                        print(f"⚠️ 第 {i+1} 个元素不是字典，已跳过")
-            else:
-                print(f"❌ 文件 {filename} 格式不支持，应为字典或列表")
-            
-            print(f"📊 {filename} 共生成 {total_docs} 个可检索文档")
-            
-        except json.JSONDecodeError as e:
-            print(f"❌ JSON解析错误 {filename}: {e}")
-        except Exception as e:
-            print(f"❌ 处理文件 {filename} 时出错: {e}")
-            import traceback
-            traceback.print_exc()
-    
-    print(f"\n🎉 总共提取了 {len(files)} 个有效文档")
-    
-    # 统计不同类型的文档
-    if files:
-        type_counts = {}
-        for doc in files:
-            doc_type = doc['metadata'].get('type', 'unknown')
-            type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
-        
-        print("\n📈 文档类型分布:")
-        for doc_type, count in type_counts.items():
-            print(f"  - {doc_type}: {count}")
-    
-    return files
+    if intent_classifier is None:
+        return llm_classify_intent(user_input), "llm"
+    return intent_classifier.classify(user_input, llm_classify_intent)
+
+def intent_log_tag(source: str) -> str:
+    """意图审查日志中的来源标记；LLM 判定保持原格式，供本地分类器从日志中学习"""
+    return "" if source == "llm" else f" ({source})"
 
 # --- 3. 新增：上传单个批次的辅助函数 ---
-def upload_batch(session, batch_data, batch_index, start_offset):
+def upload_batch(batch, batch_index, manifest: IngestionManifest):
     """
-    负责上传单个批次的函数，专为多线程设计。
+    负责上传单个批次的函数，专为多线程设计（每个线程使用自己的 Session，共享连接池）。
+    上传结果（成功或失败原因）按文档记入入库清单，返回成功上传的文档数。
+    :param batch: [(内容哈希, 文档), ...]
     """
-    # 计算在原始文件列表中的绝对索引
-    start_idx = start_offset + (batch_index * BATCH_SIZE)
-    end_idx = start_idx + len(batch_data) - 1
+    hashes = [doc_hash for doc_hash, _ in batch]
+    batch_data = [doc for _, doc in batch]
+    sources = [(doc.get("metadata") or {}).get("source") if isinstance(doc.get("metadata"), dict) else None
+               for doc in batch_data]
     
-    print(f"📤 [线程] 开始上传批次 {batch_index + 1} (文档 {start_idx + 1} - {end_idx + 1})")
+    print(f"📤 [线程] 开始上传批次 {batch_index + 1} ({len(batch_data)} 个文档)")
     
     payload = {
         "files": batch_data,
@@ -267,7 +123,7 @@ def upload_batch(session, batch_data, batch_index, start_offset):
     }
     
     try:
-        resp = session.post(
+        resp = get_transport().session().post(
             f"{config.BASE_URL}/databases/{db_name}/files", 
             json=payload,
             timeout=REQUEST_TIMEOUT,
@@ -276,95 +132,123 @@ def upload_batch(session, batch_data, batch_index, start_offset):
         
         if resp.status_code == 200:
             print(f"✅ [线程] 批次 {batch_index + 1} 上传成功")
+            manifest.mark(hashes, STATUS_UPLOADED, sources)
+            # 库中有了新文件，之前缓存的检索结果可能已过时
+            client.invalidate_search_cache(db_name)
             return len(batch_data) # 返回成功上传的数量
-        else:
-            print(f"❌ [线程] 批次 {batch_index + 1} 上传失败: {resp.status_code} {resp.text}")
-            return 0
+        error = f"{resp.status_code} {resp.text}"
+        print(f"❌ [线程] 批次 {batch_index + 1} 上传失败: {error}")
             
     except Exception as e:
+        error = str(e)
         print(f"❌ [线程] 批次 {batch_index + 1} 上传异常: {e}")
-        return 0
+    
+    manifest.mark(hashes, STATUS_FAILED, sources, error)
+    return 0
 
 
-def initialize_database(start_index=0):
-    """初始化数据库 - [!] 已优化为并发批量上传"""
+def initialize_database():
+    """
+    初始化数据库 - [!] 已优化为并发批量上传。
+    入库清单按内容哈希记录每个文档的上传状态，重新运行时只上传缺失或失败的文档，
+    失败的批次在本次运行内按退避间隔自动重试。
+    """
     global db_name
     
-    # 使用 Session 对象进行连接复用
-    with requests.Session() as session:
-        # 1. 数据库检查和创建
-        try:
-            check_resp = session.get(
-                f"{config.BASE_URL}/databases/{db_name}",
-                params={"token": config.TOKEN},
-                timeout=10,
+    # 使用共享传输层的连接池（与检索、对话请求复用同一组 keep-alive 连接）
+    session = get_transport().session()
+    # 1. 数据库检查和创建
+    try:
+        check_resp = session.get(
+            f"{config.BASE_URL}/databases/{db_name}",
+            params={"token": config.TOKEN},
+            timeout=10,
+            verify=False
+        )
+        if check_resp.status_code != 200:
+            create_resp = session.post(
+                f"{config.BASE_URL}/databases",
+                json={
+                    "database_name": db_name,
+                    "token": config.TOKEN,
+                    "metric_type": config.DEFAULT_METRIC_TYPE
+                },
+                timeout=30,
                 verify=False
             )
-            if check_resp.status_code != 200:
-                create_resp = session.post(
-                    f"{config.BASE_URL}/databases",
-                    json={
-                        "database_name": db_name,
-                        "token": config.TOKEN,
-                        "metric_type": config.DEFAULT_METRIC_TYPE
-                    },
-                    timeout=30,
-                    verify=False
-                )
-                if create_resp.status_code != 200:
-                    print(f"❌ 创建数据库失败: {create_resp.text}")
-                    return False
-                print(f"✅ 数据库创建成功: {db_name}")
-            else:
-                print(f"✅ 数据库 {db_name} 已存在，将直接使用")
-        except Exception as e:
-            print(f"❌ 数据库检查/创建时发生错误: {e}")
-            return False
-
-        # 2. 加载文件并创建批次
-        print("📂 开始加载 'json_files' 目录...")
-        json_files = load_json_files()
-        
-        if not json_files:
-            print("⚠️ 未找到有效的JSON文件，上传中止。")
-            return False # 如果没有文件，就没必要继续了
-        
-        files_to_upload = json_files[start_index:]
-        total_to_upload = len(files_to_upload)
-        
-        if total_to_upload == 0:
-            print("✅ 没有需要上传的新文件 (start_index 设置为 %d)。" % start_index)
-            return True
-            
-        print(f"总共 {total_to_upload} 个文档待上传。将以 {BATCH_SIZE} 为批次大小，{MAX_WORKERS} 个线程并发上传。")
+            if create_resp.status_code != 200:
+                print(f"❌ 创建数据库失败: {create_resp.text}")
+                return False
+            print(f"✅ 数据库创建成功: {db_name}")
+        else:
+            print(f"✅ 数据库 {db_name} 已存在，将直接使用")
+    except Exception as e:
+        print(f"❌ 数据库检查/创建时发生错误: {e}")
+        return False
+
+    # 2. 流式加载并上传：解析 → 展开 → 注入扫描 → 入库清单过滤 → 按字节分批 → 上传。
+    #    解析阶段在后台线程中运行，经有界队列交给上传阶段（背压），内存占用与语料大小无关，
+    #    第一个批次在全部文件解析完之前就开始上传。
+    manifest = IngestionManifest.load(db_name)
+    # 批次按字节数切分，并发按观测到的延迟与错误自适应调整（AIMD）
+    uploader = AdaptiveUploader(lambda batch, batch_index: upload_batch(batch, batch_index, manifest))
+    print(f"📂 开始流式加载 'json_files' 目录并上传。初始批次上限 {uploader.batch_bytes // 1024} KB，"
+          f"并发 {int(uploader.concurrency)}（最多 {uploader.max_concurrency}）。")
+
+    def documents(first_pass: bool) -> Iterator[Dict]:
+        """首轮同时建立 BM25 关键词索引（覆盖全部文档，包括之前已上传、本次跳过的部分）"""
+        for doc in iter_json_documents(stats=load_stats if first_pass else None, scanner=injection_scanner):
+            if first_pass and config.HYBRID_ENABLED:
+                lexical_index.add_documents([doc])
+            yield doc
+
+    load_stats: Dict = {}
+    total_to_upload = 0
+    total_success_count = 0
+    pending = 0
+    
+    for attempt in range(config.INGEST_MAX_RETRIES + 1):
+        if attempt:
+            delay = config.INGEST_RETRY_DELAY * 2 ** (attempt - 1)
+            print(f"🔁 {pending} 个文档上传失败，{delay:.0f} 秒后第 {attempt} 次重试...")
+            time.sleep(delay)
         
-        # 将所有待上传文件切分成多个批次
-        batches = [files_to_upload[i : i + BATCH_SIZE] for i in range(0, total_to_upload, BATCH_SIZE)]
+        # 3. 并发执行上传任务；重试轮重新流式读取，只有清单中没有或记为失败的文档会再次上传
+        counts: Dict[str, int] = {}
+        stream = prefetch(manifest.iter_pending(documents(attempt == 0), counts), config.INGEST_QUEUE_SIZE)
+        uploaded = uploader.run(stream)
+        total_success_count += uploaded
         
-        total_success_count = 0
+        if attempt == 0:
+            total_to_upload = counts.get('pending', 0)
+            print(f"📒 入库清单: {counts.get('skipped', 0)} 个文档此前已上传，跳过")
+            if not counts.get('seen'):
+                print("⚠️ 未找到有效的JSON文件，上传中止。")
+                return False # 如果没有文件，就没必要继续了
+            if total_to_upload == 0:
+                print("✅ 没有需要上传的新文件。")
+            if config.HYBRID_ENABLED:
+                print(f"🔤 BM25 关键词索引共 {len(lexical_index)} 个文档")
+            if load_stats.get('flagged'):
+                print(f"⚠️ {load_stats['flagged']} 个文档命中注入规则，检索时将被排除")
         
-        # 3. 使用线程池并发执行上传任务
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_batch = {
-                # 提交任务，并传入 session, batch数据, 批次索引, 和起始偏移量
-                executor.submit(upload_batch, session, batch, i, start_index): i 
-                for i, batch in enumerate(batches)
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_batch):
-                try:
-                    count = future.result()
-                    total_success_count += count
-                except Exception as exc:
-                    batch_index = future_to_batch[future]
-                    print(f'❌ 批次 {batch_index + 1} 执行时生成了异常: {exc}')
+        pending = counts.get('pending', 0) - uploaded
+        if pending <= 0:
+            break
+    
+    manifest.compact()
+    if pending > 0:
+        print(f"⚠️ 仍有 {pending} 个文档上传失败，已记入入库清单，下次启动时会自动重试")
 
     print("-" * 30)
     print(f"🎉 上传完成！总共成功上传了 {total_success_count} / {total_to_upload} 个文档")
+    print(f"📈 {uploader.progress()}")
     
     if total_success_count > 0:
         print(f"⏳ 等待 {config.WAIT_TIME} 秒让数据库完成索引...")
         time.sleep(config.WAIT_TIME) 
+        # 等待期间的检索可能读到未完成索引的结果，再失效一次
+        client.invalidate_search_cache(db_name)
     
     return total_success_count == total_to_upload
 #首页路由
@@ -373,30 +257,91 @@ def index():
     """返回根目录的 index.html"""
     return render_template('index.html')
 
+def _page_limit(args, default: int) -> int:
+    """解析分页参数 limit，限制在 [1, HISTORY_MAX_PAGE_SIZE]；非法值抛出 ValueError"""
+    limit = int(args.get('limit', default))
+    return max(1, min(limit, config.HISTORY_MAX_PAGE_SIZE))
+
+def history_page(args) -> Tuple[Dict, int]:
+    """对话列表的一页（按最后活动时间倒序），返回 (响应数据, 状态码)"""
+    try:
+        limit = _page_limit(args, config.HISTORY_PAGE_SIZE)
+        items, next_before = conversation_store.list_conversations(limit=limit, before=args.get('before'))
+    except ValueError:
+        return {"error": "limit 或 before 参数无效"}, 400
+    return {"conversations": items, "next_before": next_before}, 200
+
+def message_page(conversation_id: str, args) -> Tuple[Dict, int]:
+    """对话消息的一页（从最新往前翻）；不带 limit 时返回全部消息"""
+    try:
+        limit = _page_limit(args, config.HISTORY_MAX_PAGE_SIZE) if 'limit' in args else None
+        before = int(args['before']) if 'before' in args else None
+    except ValueError:
+        return {"error": "limit 或 before 参数无效"}, 400
+    page = conversation_store.get_message_page(conversation_id, limit=limit, before=before)
+    if page is None:
+        return {"error": "Conversation not found"}, 404
+    return page, 200
+
 @app.route('/history', methods=['GET'])
 def get_history_list():
-    """返回所有对话的ID和标题列表"""
-    history_summary = [
-        {"id": conv_id, "title": data[0]} 
-        for conv_id, data in conversations.items()
-    ]
-    return jsonify(sorted(history_summary, key=lambda x: x['id'], reverse=True))
+    """按最后活动时间倒序分页返回对话列表：?limit=&before=<上一页的 next_before>"""
+    payload, status = history_page(request.args)
+    return jsonify(payload), status
 
 # --- 新增API：获取特定对话的完整内容 ---
 @app.route('/history/<conversation_id>', methods=['GET'])
 def get_conversation_history(conversation_id):
-    """根据ID返回特定对话的完整消息历史"""
-    if conversation_id in conversations:
-        return jsonify({"messages": conversations[conversation_id][1]})
-    return jsonify({"error": "Conversation not found"}), 404
-
-# 聊天核心路由
-@app.route('/chat', methods=['POST'])
-def chat():
-    """处理聊天请求 - 集成了两阶段检索功能"""
+    """根据ID返回对话消息，支持 ?limit=&before=<消息序号> 从最新往前分页"""
+    payload, status = message_page(conversation_id, request.args)
+    return jsonify(payload), status
+
+def get_or_create_conversation(conversation_id, user_input: str):
+    """返回 (conversation_id, 历史列表)，对话不存在时以用户输入为标题新建"""
+    return conversation_store.get_or_create(conversation_id, user_input)
+
+def hybrid_fuse(query: str, vector_docs: List[Dict]) -> List[Dict]:
+    """将向量检索结果与 BM25 关键词检索结果做倒数排名融合；关键词索引为空时原样返回"""
+    if not config.HYBRID_ENABLED or not len(lexical_index):
+        return vector_docs
+    lexical_docs = lexical_index.search(query)['files']
+    return reciprocal_rank_fusion([vector_docs, lexical_docs], limit=config.HYBRID_TOP_K)
+
+def two_phase_retrieval(user_input: str, initial_docs: List[Dict]) -> List[Dict]:
+    """基于初步文档生成草稿答案，再用草稿进行第二次检索，返回合并去重后的文档"""
+    # 基于初步文档，生成一个“草稿”答案
+    if initial_docs:
+        initial_context = extract_context({"results": initial_docs})
+        # 构建一个简单的、无历史记录的prompt来生成草稿
+        draft_prompt = build_chat_prompt([], user_input, initial_context, [])
+        print("📝 [Phase 1] Generating draft answer...")
+        draft_answer = client.dialogue(draft_prompt)
+    else:
+        # 如果第一步没搜到任何东西，直接用用户问题进行下一步
+        draft_answer = user_input
+        print("⚠️ [Phase 1] No documents found, using user input as draft.")
+
+    # ========== 4. 【第二阶段】优化检索和生成最终答案 ==========
+    print(f"🚀 [Phase 2] Performing refined search with draft: {draft_answer[:50]}...")
+    # 4.1 使用“草稿”答案作为新查询进行第二次检索，获取更相关的文档
+    #     （search_many 可一次并发执行多个查询变体，结果已按文档去重合并）
+    refined_docs = retriever.search_many(db_name, [draft_answer], top_k=5)['merged'] # 第二次检索5个文档
     
+    # 4.2 合并两次检索的结果，按正文去重（同一文档保留最高分）
+    final_docs = merge_results([initial_docs, refined_docs])
+    print(f"📚 Combined and deduplicated documents: {len(initial_docs)} + {len(refined_docs)} -> {len(final_docs)} unique docs.")
+    return final_docs
+
+def upstream_error_status(error: Exception) -> int:
+    """上游熔断打开时返回 503（快速失败，客户端可稍后重试），其余错误返回 500"""
+    return 503 if isinstance(error, CircuitOpenError) else 500
+
+def parse_chat_request(data: Dict):
+    """
+    解析并校验请求体，识别人格类型。不调用上游，/chat、/chat/stream 与 ASGI 版本共用。
+    :return: (state, None)；或 (None, (错误数据, 状态码))
+    """
     # ========== 1. 接收和验证输入 (不变) ==========
-    data = request.get_json(silent=True) or {}
     msg = data.get('message', None)
     if isinstance(msg, dict):
         msg = msg.get('text') or msg.get('content') or msg.get('value')
@@ -406,140 +351,359 @@ def chat():
     enable_evaluation = bool(data.get('enable_evaluation', False))
 
     if not user_input:
-        return jsonify({'error': '消息不能为空，或 message 不是字符串'}), 400
+        return None, ({'error': '消息不能为空，或 message 不是字符串'}, 400)
     
     if not validate_user_input(user_input):
-        return jsonify({'error': '您的输入包含敏感内容或过长，请修改后重试'}), 400
+        return None, ({'error': '您的输入包含敏感内容或过长，请修改后重试'}, 400)
     
-    # ========== 1.5. 新增：意图审查 ==========
-    try:
-        # 构造意图审查的 prompt
-        intent_prompt = INTENT_CLASSIFICATION_PROMPT.format(user_input=user_input)
-        
-        # 使用 client.dialogue 进行一次独立的调用
-        intent_response = client.dialogue(intent_prompt)
-        
-        # 分析审查结果
-        intent_result = intent_response.strip().lower()
-        
-        if intent_result != 'benign':
-            # 如果意图不是 'benign' (例如是 'malicious' 或模型回复了其他意外内容)
-            logging.warning(f"Malicious intent detected: {user_input} (Response: {intent_result})")
-            # 403 Forbidden
-            return jsonify({'error': '您的请求似乎具有恶意意图，已拒绝处理。'}), 403 
-        
-        # 如果是 'benign'，则什么也不做，继续执行
-        logging.info(f"Intent check passed for: {user_input[:50]}...")
+    # 只对无历史的首轮提问使用问答缓存（回答不依赖对话上下文）
+    is_first_turn = not conversation_id or not conversation_store.message_count(conversation_id)
+    state = {
+        'user_input': user_input,
+        'conversation_id': conversation_id,
+        # 人格识别是纯本地计算，直接完成
+        'personality_type': detect_personality(user_input),
+        'cacheable': config.ANSWER_CACHE_ENABLED and is_first_turn and not enable_evaluation,
+        'enable_evaluation': enable_evaluation,
+    }
+    return state, None
+
+def use_cached_answer(state: Dict) -> bool:
+    """
+    首轮问答缓存：命中时打开对话并把回答写入 state['cached_response']，返回 True。
+    只能在本次输入通过意图审查之后调用：缓存的回答不能绕过对本次输入的审查。
+    """
+    if not state['cacheable']:
+        return False
+    cached_response = answer_cache.get(state['user_input'], state['personality_type'])
+    if cached_response is None:
+        return False
+    logging.info(f"Answer cache hit for: {state['user_input'][:50]}...")
+    state['conversation_id'], state['history'] = get_or_create_conversation(state['conversation_id'], state['user_input'])
+    state.update(cached_response=cached_response, cacheable=False, enable_evaluation=False)
+    return True
+
+def intent_rejection(user_input: str, intent_result: str, intent_source: str):
+    """记录意图审查结果；不是 'benign' 时返回应直接返回给客户端的 (错误数据, 状态码)，否则返回 None"""
+    if intent_result != 'benign':
+        # 如果意图不是 'benign' (例如是 'malicious' 或模型回复了其他意外内容)
+        logging.warning(f"Malicious intent detected{intent_log_tag(intent_source)}: {user_input} (Response: {intent_result})")
+        # 403 Forbidden
+        return {'error': '您的请求似乎具有恶意意图，已拒绝处理。'}, 403
+    
+    # 如果是 'benign'，则什么也不做，继续执行
+    logging.info(f"Intent check passed{intent_log_tag(intent_source)} for: {user_input[:50]}...")
+    return None
+
+def intent_error(error: Exception):
+    """意图审查调用失败：安全起见拒绝请求，返回 (错误数据, 状态码)"""
+    logging.error(f"Error during intent classification: {error}")
+    return {'error': '意图审查失败，请求已中止。'}, upstream_error_status(error)
+
+def open_conversation(state: Dict):
+    """意图审查通过后取出或新建对话，写入 state 的 conversation_id 与 history"""
+    state['conversation_id'], state['history'] = get_or_create_conversation(state['conversation_id'], state['user_input'])
 
+def first_phase_documents(state: Dict, initial_search_result: Dict) -> Tuple[List[Dict], bool]:
+    """
+    处理第一阶段检索结果：按向量检索分数决定是否提前退出，并融合 BM25 关键词检索结果。
+    :return: (文档列表, 是否跳过草稿生成与第二次检索)
+    """
+    initial_docs = initial_search_result.get('files', initial_search_result.get('results', []))
+
+    # 3.2 根据第一阶段的向量检索分数决定是否提前退出
+    retrieval_path, top_score = retrieval_controller.decide(initial_docs)
+    state['retrieval_path'] = retrieval_path
+    logging.info(f"Retrieval path: {retrieval_path} (top score: {top_score})")
+
+    # 3.3 融合 BM25 关键词检索结果，提升 CVE 编号、算法名等精确术语的召回
+    initial_docs = hybrid_fuse(state['user_input'], initial_docs)
+    if retrieval_path == PATH_EARLY_EXIT:
+        # 第一阶段证据充分：跳过草稿生成和第二次检索，直接用初步文档生成最终回答
+        print(f"⚡ [Phase 1] Strong evidence (top score {top_score:.3f}), skipping draft and refined search.")
+        return initial_docs, True
+    return initial_docs, False
+
+def build_final_prompt(state: Dict, final_docs: List[Dict]):
+    """
+    过滤文档、打包上下文并构建最终 Prompt，写入 state；Prompt 检测不通过时返回 (错误数据, 状态码)，否则返回 None。
+    """
+    user_input = state['user_input']
+
+    # 4.2 排除命中注入规则的文档（结论在入库时已写入，或按正文记忆）
+    final_docs, flagged = injection_scanner.filter_documents(final_docs)
+    if flagged:
+        logging.warning(f"Excluded {flagged} retrieved document(s) flagged by injection scan")
+
+    # 4.3 在 token 预算内打包最终的上下文，并生成引用
+    packed = pack_context(final_docs)
+    # 每篇文档只以 [编号] 的形式在上下文中出现一次，引用只携带编号、链接和简短摘要
+    final_context = cited_context(packed)
+    final_citations = files_to_citations({"results": packed.docs})
+    logging.info(f"Context packed: {len(packed.docs)} docs, {packed.tokens}/{packed.budget} tokens "
+                 f"({packed.truncated} truncated, {packed.dropped} dropped)")
+    
+    # 4.4 构建包含完整历史记录和最终上下文的Prompt
+    final_prompt = build_chat_prompt(
+        state['history'], # 使用完整的对话历史
+        user_input, 
+        final_context, 
+        final_citations,
+        personality_type=state['personality_type']
+    )
+    
+    print("\n" + "="*80)
+    print("🔍 [DEBUG] 最终发送给LLM的完整Prompt:")
+    print("="*80)
+    print(final_prompt)
+    print("="*80 + "\n")
+
+    prompt_stats.record(final_prompt)
+
+     # ========== 5. Prompt 安全检测 ==========
+    # 模板可信、文档已在上面过滤，只需扫描本轮输入和新增的历史消息
+    if not injection_scanner.validate_turn(user_input, state['conversation_id'], state['history']):
+        return {'error': '生成的提示词存在安全风险'}, 400
+
+    state.update(final_context=final_context, final_prompt=final_prompt,
+                 context_tokens=packed.tokens, citations=final_citations)
+    return None
+
+def prepare_chat_turn(data: Dict):
+    """
+    执行生成最终回答之前的全部阶段：输入校验、意图审查、两阶段检索、Prompt 构建与检测。
+    /chat 与 /chat/stream 共用这一流程；asgi_app 用同样的阶段函数组装异步版本。
+    :param data: 请求体 JSON
+    :return: (state, None) 表示成功，state 中包含生成最终回答所需的信息；
+             (None, (错误数据, 状态码)) 表示应直接返回给客户端的错误
+    """
+    state, error = parse_chat_request(data)
+    if error:
+        return None, error
+    user_input = state['user_input']
+
+    # ========== 1.5. 意图审查（推测执行） ==========
+    # 第一阶段检索与意图审查同时发出，审查不通过时丢弃检索结果，
+    # 从而把意图审查的耗时从关键路径上移除。
+    search_future = None
+    if config.SPECULATIVE_INTENT:
+        search_future = pipeline_executor.submit(retriever.search, db_name, user_input, 3)
+
+    try:
+        error = intent_rejection(user_input, *classify_intent(user_input))
     except Exception as e:
-        logging.error(f"Error during intent classification: {e}")
         # 审查步骤出错，安全起见，选择拒绝
-        return jsonify({'error': '意图审查失败，请求已中止。'}), 500
+        error = intent_error(e)
+    if error:
+        if search_future is not None:
+            search_future.cancel()
+        return None, error
+
+    # ========== 1.6. 首轮问答缓存（意图审查通过后才查找） ==========
+    if use_cached_answer(state):
+        if search_future is not None:
+            search_future.cancel()
+        return state, None
     
-    if not conversation_id or conversation_id not in conversations:
-        conversation_id = str(uuid.uuid4())
-        title = user_input[:30] + "..." if len(user_input) > 30 else user_input
-        conversations[conversation_id] = (title, [])
-    
-    current_history = conversations[conversation_id][1]
+    open_conversation(state)
 
     try:
-        # ========== 2. 识别用户期望的人格 ==========
-        from prompt_builder import detect_personality
-        personality_type = detect_personality(user_input)
-        
         # ========== 3. 【第一阶段】初步检索和生成草稿答案 ==========
         print("🚀 [Phase 1] Performing initial search...")
-        # 3.1 使用用户原始问题进行第一次检索
-        initial_search_result = client.search(db_name, user_input, top_k=3) # 初步检索3个文档
-        initial_docs = initial_search_result.get('files', initial_search_result.get('results', []))
-        
-        # 3.2 基于初步文档，生成一个“草稿”答案
-        if initial_docs:
-            initial_context = extract_context({"results": initial_docs})
-            # 构建一个简单的、无历史记录的prompt来生成草稿
-            draft_prompt = build_chat_prompt([], user_input, initial_context, [])
-            print("📝 [Phase 1] Generating draft answer...")
-            draft_answer = client.dialogue(draft_prompt)
+        # 3.1 使用用户原始问题进行第一次检索（推测执行时直接取回已发出的检索结果）
+        if search_future is not None:
+            initial_search_result = search_future.result()
         else:
-            # 如果第一步没搜到任何东西，直接用用户问题进行下一步
-            draft_answer = user_input
-            print("⚠️ [Phase 1] No documents found, using user input as draft.")
-
-        # ========== 4. 【第二阶段】优化检索和生成最终答案 ==========
-        print(f"🚀 [Phase 2] Performing refined search with draft: {draft_answer[:50]}...")
-        # 4.1 使用“草稿”答案作为新查询进行第二次检索，获取更相关的文档
-        refined_search_result = client.search(db_name, draft_answer, top_k=5) # 第二次检索5个文档
-        refined_docs = refined_search_result.get('files', refined_search_result.get('results', []))
-        
-        # 4.2 合并两次检索的结果，并去重
-        all_docs = initial_docs + refined_docs
-        # 使用文档内容的哈希或元数据中的唯一ID来去重
-        unique_docs_map = {doc.get('metadata', {}).get('source', doc.get('file')): doc for doc in reversed(all_docs)}
-        final_docs = list(unique_docs_map.values())
-        print(f"📚 Combined and deduplicated documents: {len(initial_docs)} + {len(refined_docs)} -> {len(final_docs)} unique docs.")
-
-        # 4.3 提取最终的上下文和引用
-        final_context = extract_context({"results": final_docs})
-        final_citations = files_to_citations({"results": final_docs})
-        
-        # 4.4 构建包含完整历史记录和最终上下文的Prompt
-        final_prompt = build_chat_prompt(
-            current_history, # 使用完整的对话历史
-            user_input, 
-            final_context, 
-            final_citations,
-            personality_type=personality_type
-        )
-        
-        print("\n" + "="*80)
-        print("🔍 [DEBUG] 最终发送给LLM的完整Prompt:")
-        print("="*80)
-        print(final_prompt)
-        print("="*80 + "\n")
-
-         # ========== 5. Prompt 安全检测 (不变) ==========
-        if not validate_prompt(final_prompt):
-            return jsonify({'error': '生成的提示词存在安全风险'}), 400
-        
+            initial_search_result = retriever.search(db_name, user_input, top_k=3) # 初步检索3个文档
+
+        initial_docs, early_exit = first_phase_documents(state, initial_search_result)
+        final_docs = initial_docs if early_exit else two_phase_retrieval(user_input, initial_docs)
+
+        error = build_final_prompt(state, final_docs)
+        if error:
+            return None, error
+
+    except Exception as e:
+        print(f"处理请求时出错: {e}")
+        return None, ({'error': f'处理请求失败: {str(e)}'}, upstream_error_status(e))
+
+    return state, None
+
+def output_rejection(final_response: str):
+    """
+    输出检测（第三层防御）：回答命中越狱确认或机密泄露时返回 (错误数据, 状态码)，否则返回 None。
+    /chat 与 /chat/stream（StreamingOutputGuard）使用同一组输出规则，被拒绝的回答不写入对话历史。
+    """
+    if config.OUTPUT_GUARD_ENABLED and not validate_llm_output(final_response):
+        return {'error': '回答包含不安全的内容，已拒绝返回。'}, 400
+    return None
+
+def finish_chat_turn(state: Dict, final_response: str) -> Dict:
+    """写入对话历史并组装响应数据（开启评估时提交后台评估并返回 evaluation_id）"""
+    # ========== 7. 更新对话历史 (不变) ==========
+    conversation_store.append_turn(state['conversation_id'], state['user_input'], final_response)
+
+    if state['cacheable']:
+        answer_cache.put(state['user_input'], state['personality_type'], final_response)
+    
+    # ========== 8. 准备响应数据 (不变) ==========
+    response_data = {
+        'response': final_response,
+        'conversation_id': state['conversation_id']
+    }
+    if 'cached_response' in state:
+        response_data['cached'] = True
+    else:
+        response_data['retrieval_path'] = state['retrieval_path']
+        response_data['context_tokens'] = state['context_tokens']
+        response_data['citations'] = state['citations']
+    
+    # ========== 9. 可选：回答质量评估（后台执行，通过 /evaluation/<id> 获取报告） ==========
+    if state['enable_evaluation']:
+        evaluation_id = evaluation_queue.submit(state['user_input'], state['final_context'], final_response)
+        if evaluation_id is not None:
+            response_data['evaluation_id'] = evaluation_id
+        else:
+            response_data['evaluation_dropped'] = True
+    
+    return response_data
+
+# 聊天核心路由
+@app.route('/chat', methods=['POST'])
+def chat():
+    """处理聊天请求 - 集成了两阶段检索功能"""
+    data = request.get_json(silent=True) or {}
+    state, error = prepare_chat_turn(data)
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+
+    try:
         # ========== 6. 生成最终回答 ==========
-        print("✅ [Phase 2] Generating final answer...")
-        final_response = client.dialogue(final_prompt)
-        
-        # ========== 7. 更新对话历史 (不变) ==========
-        current_history.append({"role": "user", "content": user_input})
-        current_history.append({"role": "assistant", "content": final_response})
-        
-        # ========== 8. 准备响应数据 (不变) ==========
-        response_data = {
-            'response': final_response,
-            'conversation_id': conversation_id
-        }
-        
-        # ========== 9. 可选：回答质量评估 (不变) ==========
-        if enable_evaluation:
-            _, evaluation_report = integrate_with_rag_flow(
-                final_response, user_input, final_context
-            )
-            response_data['evaluation'] = evaluation_report
-        
-        return jsonify(response_data)
+        if 'cached_response' in state:
+            final_response = state['cached_response']
+        else:
+            print("✅ [Phase 2] Generating final answer...")
+            final_response = client.dialogue(state['final_prompt'])
         
     except Exception as e:
         print(f"处理请求时出错: {e}")
-        return jsonify({'error': f'处理请求失败: {str(e)}'}), 500
+        return jsonify({'error': f'处理请求失败: {str(e)}'}), upstream_error_status(e)
+
+    error = output_rejection(final_response)
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+    return jsonify(finish_chat_turn(state, final_response))
+
+def _sse(event: str, payload: Dict) -> str:
+    """格式化一条 Server-Sent Events 消息"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+# 流式聊天路由：前置阶段与 /chat 相同，最终回答按 SSE 逐段推送
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    处理聊天请求并以 SSE 流式返回最终回答。
+    事件依次为 meta (conversation_id) -> token (增量文本) -> done (含 citations 与可选的 evaluation_id)；出错时发送 error。
+    """
+    data = request.get_json(silent=True) or {}
+    state, error = prepare_chat_turn(data)
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+
+    def generate():
+        yield _sse('meta', {'conversation_id': state['conversation_id']})
+        chunks = []
+        if 'cached_response' in state:
+            stream = iter([state['cached_response']])
+        else:
+            print("✅ [Phase 2] Streaming final answer...")
+            stream = client.dialogue_stream(state['final_prompt'])
+        # 输出检测（第三层防御）：与 /chat 的 output_rejection 规则相同，逐段检测，发现违规时立即中止，不写入对话历史
+        output_guard = StreamingOutputGuard() if config.OUTPUT_GUARD_ENABLED else None
+        try:
+            for chunk in stream:
+                chunks.append(chunk)
+                text = output_guard.feed(chunk) if output_guard is not None else chunk
+                if output_guard is not None and output_guard.blocked:
+                    if hasattr(stream, 'close'):
+                        stream.close()   # 关闭上游连接，停止继续生成
+                    yield _sse('error', {'error': '回答包含不安全的内容，已中止输出。', 'aborted': True})
+                    return
+                if text:
+                    yield _sse('token', {'text': text})
+            if output_guard is not None:
+                rest = output_guard.finish()
+                if rest:
+                    yield _sse('token', {'text': rest})
+        except Exception as e:
+            print(f"流式生成时出错: {e}")
+            yield _sse('error', {'error': f'处理请求失败: {str(e)}'})
+            return
+
+        response_data = finish_chat_turn(state, "".join(chunks))
+        done = {'conversation_id': state['conversation_id'], 'citations': response_data.get('citations', [])}
+        for key in ('evaluation_id', 'evaluation_dropped'):
+            if key in response_data:
+                done[key] = response_data[key]
+        yield _sse('done', done)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def evaluation_result(evaluation_id: str) -> Tuple[Dict, int]:
+    """后台评估的查询结果：进行中返回 202，不存在或已过期返回 404"""
+    entry = evaluation_queue.get(evaluation_id)
+    if entry is None:
+        return {'error': 'Evaluation not found'}, 404
+    payload = {'evaluation_id': evaluation_id, 'status': entry['status']}
+    if 'evaluation' in entry:
+        payload['evaluation'] = entry['evaluation']
+    if 'error' in entry:
+        payload['error'] = entry['error']
+    return payload, 202 if entry['status'] == STATUS_PENDING else 200
+
+@app.route('/evaluation/<evaluation_id>', methods=['GET'])
+def get_evaluation(evaluation_id):
+    """获取后台回答质量评估的报告"""
+    payload, status = evaluation_result(evaluation_id)
+    return jsonify(payload), status
 
 @app.route('/clear', methods=['POST'])
 def clear_history():
     """清空所有对话历史"""
-    global conversations
-    conversations = {}
+    conversation_store.clear()
     return jsonify({'status': 'success', 'message': 'All conversations cleared'})
 
+def health_payload() -> Dict:
+    """健康检查数据：各组件的状态与统计（Flask 与 ASGI 版本共用）"""
+    health_data = {'status': 'ok', 'database': db_name, 'retrieval_backend': config.RETRIEVAL_BACKEND,
+                   'answer_cache': answer_cache.stats()}
+    if client.search_cache is not None:
+        health_data['search_cache'] = client.search_cache.stats()
+    if intent_classifier is not None:
+        health_data['intent_decisions'] = intent_classifier.stats()
+    health_data['retrieval_paths'] = retrieval_controller.stats()
+    health_data['lexical_index_docs'] = len(lexical_index)
+    health_data['conversations'] = conversation_store.stats()
+    health_data['prompt_stats'] = prompt_stats.stats()
+    health_data['injection_scan'] = injection_scanner.stats()
+    health_data['evaluation_queue'] = evaluation_queue.stats()
+    health_data['circuit_breakers'] = client.circuit_stats()
+    health_data['connection_pool'] = client.transport.stats()
+    if client.hedge_policy is not None:
+        health_data['search_hedging'] = client.hedge_stats()
+    return health_data
+
 @app.route('/health', methods=['GET'])
 def health():
     """健康检查"""
-    return jsonify({'status': 'ok', 'database': db_name})
+    return jsonify(health_payload())
 
 
 # ✅ 启动时的输出信息
@@ -548,16 +712,13 @@ if __name__ == '__main__':
     print("⏳ 正在初始化数据库 student_Group4_final...")
     print("=" * 50 + "\n")
     
-    import sys
-    start_index = int(sys.argv[1]) if len(sys.argv) > 1 else 0
-
-    initialize_database(start_index=start_index)
+    initialize_database()
     print("\n" + "=" * 50)
     print("🚀 服务启动成功！")
     print("📱 请在浏览器访问: http://localhost:5000/")
     print("💡 提示: 按 Ctrl+C 停止服务")
     print("📁 JSON文件目录: ./json_files/")
-    print("💡 从第230个开始: python app.py 230")
+    print(f"💡 中断后重新运行会根据入库清单 {config.INGEST_MANIFEST_PATH} 只上传缺失或失败的文档")
     print("=" * 50 + "\n")
     
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+/chat 流程的 asyncio (ASGI) 版本。
+
+除上游调用外的各个阶段（输入校验、问答缓存、Prompt 构建与检测、写入历史）直接调用 app.py 中
+/chat 使用的同一组阶段函数，因此两者的行为与 JSON 响应格式一致。区别在于上游调用都是异步的：
+一个进程可以同时挂起数百个对话，而不是每个请求占用一个线程。
+阶段函数会访问对话存储（可能是 SQLite）、做注入扫描等同步计算，统一放到线程中执行，不阻塞事件循环。
+
+启动方式:
+    hypercorn asgi_app:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import logging
+from typing import Dict, List
+
+from quart import Quart, request, jsonify, render_template
+
+import app as sync_app
+from async_api_client import AsyncAPIClient
+from data_processor import extract_context, merge_results
+from ingestion import load_json_files
+from intent_classifier import normalize_verdict
+from prompt_builder import build_chat_prompt
+from config import config
+
+app = Quart(__name__)
+# 与同步客户端共用检索缓存与熔断器：入库后的失效、上游故障的熔断对两者同时生效
+aclient = AsyncAPIClient(search_cache=sync_app.client.search_cache, breakers=sync_app.client.breakers)
+
+
+@app.before_serving
+async def build_lexical_index():
+    """ASGI 部署不经过 initialize_database，启动时自行加载文档建立 BM25 关键词索引"""
+    if config.HYBRID_ENABLED and not len(sync_app.lexical_index):
+        documents = await asyncio.to_thread(load_json_files, scanner=sync_app.injection_scanner)
+        await asyncio.to_thread(sync_app.lexical_index.add_documents, documents)
+
+
+@app.after_serving
+async def close_client():
+    await aclient.close()
+
+
+async def search(query: str, top_k: int):
+    """检索：远程向量库走异步客户端，本地索引是 CPU 计算，放到线程中执行"""
+    if config.RETRIEVAL_BACKEND == "local":
+        return await asyncio.to_thread(sync_app.retriever.search, sync_app.db_name, query, top_k)
+    return await aclient.search(sync_app.db_name, query, top_k=top_k)
+
+
+async def search_many(queries: List[str], top_k: int):
+    """批量检索，返回格式与 APIClient.search_many 相同"""
+    if config.RETRIEVAL_BACKEND == "local":
+        return await asyncio.to_thread(sync_app.retriever.search_many, sync_app.db_name, queries, top_k)
+    return await aclient.search_many(sync_app.db_name, queries, top_k=top_k)
+
+
+async def classify_intent(user_input: str):
+    """分层意图审查：本地分类器无法确定时才异步调用 LLM，返回 (分类结果, 判定来源)"""
+    classifier = sync_app.intent_classifier
+    if classifier is not None:
+        decision = classifier.classify_local(user_input)
+        if decision is not None:
+            return decision
+
+    intent_prompt = sync_app.INTENT_CLASSIFICATION_PROMPT.format(user_input=user_input)
+    intent_response = await aclient.dialogue(intent_prompt)
+    intent_result = intent_response.strip().lower()
+    intent_result = normalize_verdict(intent_result) or intent_result
+    if classifier is not None:
+        classifier.remember(user_input, intent_result)   # 只记忆 benign / malicious
+    return intent_result, "llm"
+
+
+async def two_phase_retrieval(user_input: str, initial_docs: List[Dict]) -> List[Dict]:
+    """草稿生成 + 第二次检索，返回合并去重后的文档（与 app.two_phase_retrieval 相同）"""
+    if initial_docs:
+        initial_context = extract_context({"results": initial_docs})
+        draft_prompt = build_chat_prompt([], user_input, initial_context, [])
+        draft_answer = await aclient.dialogue(draft_prompt)
+    else:
+        draft_answer = user_input
+
+    # ========== 4. 【第二阶段】优化检索 ==========
+    refined_docs = (await search_many([draft_answer], 5))['merged']
+    return merge_results([initial_docs, refined_docs])
+
+
+@app.route('/')
+async def index():
+    """返回根目录的 index.html"""
+    return await render_template('index.html')
+
+
+@app.route('/history', methods=['GET'])
+async def get_history_list():
+    """按最后活动时间倒序分页返回对话列表：?limit=&before=<上一页的 next_before>"""
+    payload, status = await asyncio.to_thread(sync_app.history_page, request.args)
+    return jsonify(payload), status
+
+
+@app.route('/history/<conversation_id>', methods=['GET'])
+async def get_conversation_history(conversation_id):
+    """根据ID返回对话消息，支持 ?limit=&before=<消息序号> 从最新往前分页"""
+    payload, status = await asyncio.to_thread(sync_app.message_page, conversation_id, request.args)
+    return jsonify(payload), status
+
+
+async def prepare_chat_turn(data: Dict):
+    """app.prepare_chat_turn 的异步版本：阶段函数相同，上游调用异步进行，返回值格式相同"""
+    # ========== 1. 接收和验证输入 ==========
+    state, error = await asyncio.to_thread(sync_app.parse_chat_request, data)
+    if error:
+        return None, error
+    user_input = state['user_input']
+
+    # ========== 1.5. 意图审查（推测执行） ==========
+    search_task = None
+    if config.SPECULATIVE_INTENT:
+        search_task = asyncio.create_task(search(user_input, 3))
+
+    try:
+        error = sync_app.intent_rejection(user_input, *await classify_intent(user_input))
+    except Exception as e:
+        error = sync_app.intent_error(e)
+    if error:
+        if search_task is not None:
+            search_task.cancel()
+        return None, error
+
+    # ========== 1.6. 首轮问答缓存（意图审查通过后才查找，与 app.py 共用同一个缓存） ==========
+    if await asyncio.to_thread(sync_app.use_cached_answer, state):
+        if search_task is not None:
+            search_task.cancel()
+        return state, None
+
+    await asyncio.to_thread(sync_app.open_conversation, state)
+
+    try:
+        # ========== 3. 【第一阶段】初步检索 ==========
+        if search_task is not None:
+            initial_search_result = await search_task
+        else:
+            initial_search_result = await search(user_input, 3)
+
+        # 第一阶段证据充分时跳过草稿生成与第二次检索
+        initial_docs, early_exit = await asyncio.to_thread(
+            sync_app.first_phase_documents, state, initial_search_result)
+        final_docs = initial_docs if early_exit else await two_phase_retrieval(user_input, initial_docs)
+
+        # ========== 4~5. 打包上下文、构建 Prompt 并检测 ==========
+        error = await asyncio.to_thread(sync_app.build_final_prompt, state, final_docs)
+        if error:
+            return None, error
+
+    except Exception as e:
+        logging.error(f"处理请求时出错: {e}")
+        return None, ({'error': f'处理请求失败: {str(e)}'}, sync_app.upstream_error_status(e))
+
+    return state, None
+
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    """处理聊天请求 - 两阶段检索的异步实现"""
+    data = await request.get_json(silent=True) or {}
+    state, error = await prepare_chat_turn(data)
+    if error:
+        payload, status = error
+        return jsonify(payload), status
+
+    try:
+        # ========== 6. 生成最终回答 ==========
+        if 'cached_response' in state:
+            final_response = state['cached_response']
+        else:
+            final_response = await aclient.dialogue(state['final_prompt'])
+
+        error = sync_app.output_rejection(final_response)
+        if error:
+            payload, status = error
+            return jsonify(payload), status
+
+        # ========== 7~9. 更新对话历史、准备响应数据、提交后台评估 ==========
+        return jsonify(await asyncio.to_thread(sync_app.finish_chat_turn, state, final_response))
+
+    except Exception as e:
+        logging.error(f"处理请求时出错: {e}")
+        return jsonify({'error': f'处理请求失败: {str(e)}'}), sync_app.upstream_error_status(e)
+
+
+@app.route('/evaluation/<evaluation_id>', methods=['GET'])
+async def get_evaluation(evaluation_id):
+    """获取后台回答质量评估的报告"""
+    payload, status = sync_app.evaluation_result(evaluation_id)
+    return jsonify(payload), status
+
+
+@app.route('/clear', methods=['POST'])
+async def clear_history():
+    """清空所有对话历史"""
+    await asyncio.to_thread(sync_app.conversation_store.clear)
+    return jsonify({'status': 'success', 'message': 'All conversations cleared'})
+
+
+@app.route('/health', methods=['GET'])
+async def health():
+    """健康检查（与 app.py 相同，熔断器由两个客户端共用）"""
+    return jsonify(await asyncio.to_thread(sync_app.health_payload))
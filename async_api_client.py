@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import aiohttp
+from typing import Dict, Any, List, Optional
+from config import config
+from search_cache import SearchCache
+from data_processor import merge_results
+from api_client import APIError, CircuitBreaker, CircuitOpenError, backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAPIClient:
+    """
+    APIClient 的 asyncio 版本。
+    所有请求共用一个 aiohttp 连接池，并按上游接口（search / dialogue）分别用信号量限制并发，
+    避免大量并发会话同时压垮向量库或对话服务。
+    超时、熔断与检索重试的策略与 APIClient 相同；传入同步客户端的 breakers 时两者共用熔断状态。
+    """
+
+    def __init__(self, search_concurrency: int = None, dialogue_concurrency: int = None,
+                 pool_size: int = None, search_cache=None, breakers: Dict[str, CircuitBreaker] = None):
+        self.base_url = config.BASE_URL
+        self.token = config.TOKEN
+        self.pool_size = pool_size if pool_size is not None else config.ASYNC_POOL_SIZE
+        self._session: Optional[aiohttp.ClientSession] = None
+        if search_cache is None and config.SEARCH_CACHE_ENABLED:
+            search_cache = SearchCache()
+        self.search_cache = search_cache
+        self._timeouts = {
+            "search": aiohttp.ClientTimeout(sock_connect=config.SEARCH_CONNECT_TIMEOUT,
+                                            sock_read=config.SEARCH_READ_TIMEOUT),
+            "dialogue": aiohttp.ClientTimeout(sock_connect=config.DIALOGUE_CONNECT_TIMEOUT,
+                                              sock_read=config.DIALOGUE_READ_TIMEOUT),
+        }
+        self.breakers = breakers if breakers is not None else {
+            endpoint: CircuitBreaker(endpoint) for endpoint in self._timeouts}
+        self._semaphores = {
+            "search": asyncio.Semaphore(
+                search_concurrency if search_concurrency is not None else config.ASYNC_SEARCH_CONCURRENCY),
+            "dialogue": asyncio.Semaphore(
+                dialogue_concurrency if dialogue_concurrency is not None else config.ASYNC_DIALOGUE_CONCURRENCY),
+        }
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """惰性创建共享的连接池（必须在事件循环内创建）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Content-Type": "application/json"}
+            )
+        return self._session
+
+    async def _post(self, endpoint: str, url: str, payload: Dict[str, Any]) -> Any:
+        """
+        在对应接口的信号量内经熔断器发起 POST（带该接口的超时），返回解析后的 JSON，非 200 响应抛出 APIError。
+        故障计入熔断器的规则与 APIClient._post 相同。
+        """
+        breaker = self.breakers[endpoint]
+        probe = breaker.before_call()
+        try:
+            async with self._semaphores[endpoint]:
+                async with self._get_session().post(url, json=payload, timeout=self._timeouts[endpoint]) as resp:
+                    if resp.status == 200:
+                        data = await resp.json(content_type=None)
+                    else:
+                        error = APIError(f"{endpoint.capitalize()} API error: {await resp.text()}",
+                                         endpoint=endpoint, status_code=resp.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            breaker.record_failure()
+            raise APIError(f"{endpoint.capitalize()} API error: {e!r}", endpoint=endpoint) from e
+        except BaseException:
+            # 被取消（推测执行的检索在意图审查不通过或命中缓存时会被取消）或其他中断：
+            # 没有结果，不计入熔断状态，但必须释放探测名额，否则熔断器会一直停在 half_open
+            if probe:
+                breaker.release_probe()
+            raise
+
+        if resp.status != 200:
+            if error.retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise error
+        breaker.record_success()
+        return data
+
+    async def _post_with_retries(self, endpoint: str, url: str, payload: Dict[str, Any]) -> Any:
+        """幂等请求的重试，退避策略与 APIClient._with_retries 相同；熔断打开时不再重试"""
+        for attempt in range(config.SEARCH_MAX_RETRIES + 1):
+            try:
+                return await self._post(endpoint, url, payload)
+            except CircuitOpenError:
+                raise
+            except APIError as e:
+                if not e.retryable or attempt >= config.SEARCH_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{endpoint} attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def circuit_stats(self) -> Dict[str, Dict]:
+        """各上游接口的熔断器状态"""
+        return {endpoint: breaker.stats() for endpoint, breaker in self.breakers.items()}
+
+    async def search(self, db_name: str, query: str, top_k: int = None, expr: str = None) -> Dict[str, Any]:
+        """调用 /search 接口，语义与 APIClient.search 相同"""
+        url = f"{self.base_url}/databases/{db_name}/search"
+        final_top_k = top_k if top_k is not None else config.TOP_K
+
+        payload = {
+            "token": self.token,
+            "query": query,
+            "top_k": final_top_k,
+            "metric_type": config.DEFAULT_METRIC_TYPE,
+        }
+        if expr:
+            payload["expr"] = expr
+
+        cache_key = (db_name, query, final_top_k, config.DEFAULT_METRIC_TYPE, expr)
+        if self.search_cache is not None:
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "files": list(cached["files"])}
+
+        data = await self._post_with_retries("search", url, payload)
+
+        if not isinstance(data, dict) or "files" not in data or not isinstance(data["files"], list):
+            return {"files": []}
+
+        if self.search_cache is not None:
+            self.search_cache.put(cache_key, data)
+            return {**data, "files": list(data["files"])}
+        return data
+
+    async def search_many(self, db_name: str, queries: List[str], top_k: int = None,
+                          expr: str = None) -> Dict[str, Any]:
+        """并发执行多条检索，返回格式与 APIClient.search_many 相同"""
+        results = await asyncio.gather(*(self.search(db_name, q, top_k=top_k, expr=expr) for q in queries))
+        return {"results": list(results), "merged": merge_results([r["files"] for r in results])}
+
+    async def dialogue(self, user_input: str) -> str:
+        """调用 /dialogue 接口"""
+        url = f"{self.base_url}/dialogue"
+        payload = {"user_input": user_input,
+                   "token": self.token,
+                   "max_tokens": 1024
+                   }
+        data = await self._post("dialogue", url, payload)
+        return data.get("response", "")
+
+    async def close(self):
+        """关闭共享连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
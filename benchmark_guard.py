@@ -0,0 +1,98 @@
+"""
+guard.py 校验函数的微基准：对比旧实现（每次调用重建模式列表、逐条以忽略大小写方式 re.search）与预编译的 guard 引擎。
+
+用法:
+    python benchmark_guard.py [--number 2000]
+"""
+import argparse
+import random
+import re
+import timeit
+
+import guard
+from guard import CompiledRules, KeywordAutomaton
+
+
+def legacy_validate_user_input(user_input: str) -> bool:
+    if len(user_input) > 500:
+        return False
+    if any(word in user_input for word in guard.SENSITIVE_WORDS):
+        return False
+    all_attack_patterns = [
+        r"(?i)\b(select|union|insert|drop|delete|update|alter|create|truncate)\b",
+        r"(\'|\")\s*(or|and)\s*(\'|\")\d(\'|\")\s*=\s*(\'|\")\d",
+        r"(?i)\b(sleep|benchmark|waitfor\s+delay)\b",
+        r"(--|\#|\/\*|\*\/)",
+        r"(?i)<script",
+        r"(?i)onerror=",
+        r"(?i)onload=",
+        r"(?i)onmouseover=",
+        r"(?i)href=[\s\"']*javascript:",
+        r"(&&|\|\||;|`|\$\()",
+        r"\b(ls|cat|rm|whoami|sh|bash|powershell|wget|curl)\b",
+    ]
+    return not any(re.search(pattern, user_input) for pattern in all_attack_patterns)
+
+
+def legacy_validate_prompt(prompt: str) -> bool:
+    return not any(re.search(pattern, prompt) for pattern in guard.INJECTION_PATTERNS)
+
+
+def legacy_validate_llm_output(response: str) -> bool:
+    jailbreak_confirmations = [
+        r"(?i)forgot(ten)?\s+previous",
+        r"(?i)ignore(d)?\s+instructions",
+        r"(?i)new\s+role",
+        r"(?i)i\s+will\s+now",
+    ]
+    if any(re.search(pattern, response) for pattern in jailbreak_confirmations):
+        return False
+    return not any(word in response for word in guard.SENSITIVE_WORDS)
+
+
+def per_call_us(func, arg, number: int) -> float:
+    return timeit.timeit(lambda: func(arg), number=number) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="guard 校验函数微基准")
+    parser.add_argument("--number", type=int, default=2000, help="每项测量的调用次数")
+    args = parser.parse_args()
+
+    user_input = "请详细解释一下什么是跨站请求伪造攻击以及企业应当如何防御它？" * 5
+    prompt = ("你是一个网络安全助手。\n【参考上下文】\n"
+              + "防火墙是一种网络安全设备或软件，它根据预定的安全规则监控和控制传入和传出的网络流量。\n" * 60)
+    response = "CSRF 攻击利用用户已登录的身份发起非本意的请求，可通过 SameSite Cookie 与 CSRF Token 防御。" * 20
+
+    cases = [
+        ("validate_user_input", legacy_validate_user_input, guard.validate_user_input, user_input),
+        ("validate_prompt", legacy_validate_prompt, guard.validate_prompt, prompt),
+        ("validate_llm_output", legacy_validate_llm_output, guard.validate_llm_output, response),
+    ]
+    print(f"{'函数':<22}{'输入长度':>8}{'旧实现 (µs)':>14}{'新实现 (µs)':>14}{'加速比':>8}")
+    for name, legacy, compiled, text in cases:
+        assert legacy(text) == compiled(text)
+        old = per_call_us(legacy, text, args.number)
+        new = per_call_us(compiled, text, args.number)
+        print(f"{name:<22}{len(text):>8}{old:>14.1f}{new:>14.1f}{old / new:>7.1f}x")
+
+    # 关键词规模对匹配方式的影响：少量关键词时交替式正则更快，关键词很多时 Aho–Corasick 不随数量变慢
+    rng = random.Random(0)
+    alphabet = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可也你说年着"
+    print(f"\n{'关键词数':<10}{'any(in) (µs)':>14}{'交替式正则 (µs)':>18}{'Aho–Corasick (µs)':>20}")
+    for n_keywords in (5, 100, 1000):
+        keywords = ["".join(rng.choice(alphabet) for _ in range(rng.randint(3, 6))) for _ in range(n_keywords)]
+        keywords = [w for w in keywords if w not in user_input]
+        literal = re.compile("|".join(re.escape(w) for w in sorted(keywords, key=len, reverse=True)))
+        automaton = KeywordAutomaton(keywords)
+        scan = per_call_us(lambda t: any(w in t for w in keywords), user_input, args.number // 10)
+        regex = per_call_us(literal.search, user_input, args.number // 10)
+        ac = per_call_us(automaton.search, user_input, args.number // 10)
+        print(f"{n_keywords:<10}{scan:>14.1f}{regex:>18.1f}{ac:>20.1f}")
+
+    rules = CompiledRules({"sql": guard.SQL_PATTERNS}, keywords=guard.SENSITIVE_WORDS)
+    print(f"\n命中规则示例: {rules.search('1 union select password')}, {rules.search('忘记 admin 账户')}")
+
+
+if __name__ == '__main__':
+    main()
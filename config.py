@@ -7,8 +7,102 @@ class Config(NamedTuple):
     TOKEN: str = os.getenv("TOKEN", "_QZ9BtHUWrgT8BrO4ihZFAPJpzju8PBnFG_VbGJUGDYSBkOEztl8FqxafKhh-Prb")
     DEFAULT_METRIC_TYPE: str = "cosine"
     MAX_CONTEXT_LENGTH: int = 2000  # 检索结果最大上下文长度
+    MAX_CONTEXT_TOKENS: int = int(os.getenv("MAX_CONTEXT_TOKENS", "1500"))  # 检索上下文的 token 预算
+    CONTEXT_TOKENIZER: str = os.getenv("CONTEXT_TOKENIZER", "estimate")  # token 计数: estimate / tiktoken:<编码名>
+    CONTEXT_TRUNCATE: bool = os.getenv("CONTEXT_TRUNCATE", "1") == "1"   # 放不下的文档按句子截断以填满预算
+    CONTEXT_MIN_TRUNCATED_TOKENS: int = 64        # 剩余预算少于此值时不再截断填充
+    CITATION_SNIPPET_LENGTH: int = 80             # 返回给前端的引用摘要最大字符数
+    PROMPT_HISTORY_MESSAGES: int = 10             # Prompt 中保留的最近历史消息条数（注入检测也只检查这些）
+    GUARD_RULES_FILE: str = os.getenv("GUARD_RULES_FILE", "")  # 可选的 guard 规则文件（JSON），修改后自动热加载
+    GUARD_RELOAD_INTERVAL: float = 5.0            # 检查规则文件是否修改的间隔（秒）
+    GUARD_AC_MIN_KEYWORDS: int = 100              # 关键词数达到此值时改用 Aho–Corasick 自动机匹配
+    INJECTION_SCAN_CACHE_SIZE: int = 10000        # 文档 / 对话注入扫描结论的缓存条目数
+    OUTPUT_GUARD_ENABLED: bool = os.getenv("OUTPUT_GUARD_ENABLED", "1") == "1"  # 检测 LLM 回答中的越狱确认与私钥等机密泄露（/chat 与 /chat/stream）
+    OUTPUT_GUARD_TAIL_CHARS: int = 64             # 流式输出检测保留的末尾字符数（跨分段匹配的最大长度）
+    TRANSPORT_POOL_SIZE: int = int(os.getenv("TRANSPORT_POOL_SIZE", "64"))  # 每个上游 host 的 keep-alive 连接池大小
+    TRANSPORT_POOL_BLOCK: bool = os.getenv("TRANSPORT_POOL_BLOCK", "0") == "1"  # 连接池耗尽时等待空闲连接，否则临时新建（用完即关闭）
+    TRANSPORT_MAX_HOSTS: int = 10                 # 缓存连接池的上游 host 数
+    TRANSPORT_TCP_KEEPALIVE: bool = True          # 对上游连接开启 TCP keep-alive 探测，尽早发现被中间设备断开的空闲连接
+    SEARCH_CONNECT_TIMEOUT: float = 3.05          # /search 建立连接超时（秒）
+    SEARCH_READ_TIMEOUT: float = float(os.getenv("SEARCH_READ_TIMEOUT", "10"))      # /search 读取超时（秒）
+    DIALOGUE_CONNECT_TIMEOUT: float = 3.05        # /dialogue 建立连接超时（秒）
+    DIALOGUE_READ_TIMEOUT: float = float(os.getenv("DIALOGUE_READ_TIMEOUT", "120"))  # /dialogue 读取超时（秒，流式时为两个分块之间的最长间隔）
+    SEARCH_MAX_RETRIES: int = 2                   # /search 暂时性故障的最大重试次数（检索是幂等的）
+    RETRY_BACKOFF_BASE: float = 0.2               # 重试退避的基准时间（秒），第 n 次重试最多等待 base * 2^n
+    RETRY_BACKOFF_MAX: float = 2.0                # 单次重试退避的最长时间（秒）
+    CIRCUIT_FAILURE_THRESHOLD: int = 5            # 连续失败多少次后打开熔断器
+    CIRCUIT_RESET_TIMEOUT: float = 30.0           # 熔断打开后多久放行一个探测请求（秒）
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "1") == "1"  # /search 超过近期延迟分位数未返回时发出对冲请求
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))  # 对冲等待时间取近期延迟的该分位数
+    HEDGE_MIN_DELAY: float = 0.02                 # 对冲等待时间下限（秒）
+    HEDGE_MIN_SAMPLES: int = 20                   # 延迟样本不足此数时不对冲
+    HEDGE_LATENCY_WINDOW: int = 500               # 计算分位数使用的最近延迟样本数
+    HEDGE_MAX_RATIO: float = 0.05                 # 对冲请求占总请求数的上限
+    HEDGE_MAX_TOKENS: float = 10.0                # 对冲令牌桶容量（允许的突发对冲数）
+    HEDGE_WORKERS: int = 32                       # 执行可对冲检索的线程数
     TOP_K: int = 3                # 默认返回 top_k 个结果
+    INGEST_MANIFEST_PATH: str = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.json")  # 入库清单（按内容哈希记录上传状态）
+    INGEST_MAX_RETRIES: int = 3                   # 上传失败的文档在同一次运行内的最大重试轮数
+    INGEST_RETRY_DELAY: float = 2.0               # 首轮重试前的等待时间（秒），之后每轮翻倍
+    INGEST_BATCH_BYTES: int = int(os.getenv("INGEST_BATCH_BYTES", str(1024 * 1024)))  # 上传批次的初始字节上限
+    INGEST_MIN_BATCH_BYTES: int = 64 * 1024       # 批次字节上限的下限（失败时逐次减半）
+    INGEST_MAX_BATCH_BYTES: int = 8 * 1024 * 1024  # 批次字节上限的上限
+    INGEST_MAX_BATCH_DOCS: int = 1000             # 每个批次最多的文档数
+    INGEST_INITIAL_CONCURRENCY: int = 4           # 上传的初始并发数
+    INGEST_MIN_CONCURRENCY: int = 1
+    INGEST_MAX_CONCURRENCY: int = int(os.getenv("INGEST_MAX_CONCURRENCY", "16"))  # 上传并发数上限
+    INGEST_TARGET_LATENCY: float = float(os.getenv("INGEST_TARGET_LATENCY", "10"))  # 批次延迟超过此值（秒）时减小并发
+    INGEST_PROGRESS_INTERVAL: float = 5.0         # 上传进度（docs/s、bytes/s）输出间隔（秒）
+    INGEST_READ_CHUNK: int = 1024 * 1024          # 增量解析 JSON 文件时每次读取的字符数
+    INGEST_QUEUE_SIZE: int = 2000                 # 解析阶段与上传阶段之间的有界队列容量（文档数）
     WAIT_TIME: int = 2            # 等待向量库flush的时间
+    SPECULATIVE_INTENT: bool = os.getenv("SPECULATIVE_INTENT", "1") == "1"  # 意图审查与第一阶段检索并发执行
+    PIPELINE_WORKERS: int = int(os.getenv("PIPELINE_WORKERS", "16"))        # 推测执行使用的线程数
+    ASYNC_POOL_SIZE: int = int(os.getenv("ASYNC_POOL_SIZE", "100"))                     # 异步客户端共享连接池大小
+    ASYNC_SEARCH_CONCURRENCY: int = int(os.getenv("ASYNC_SEARCH_CONCURRENCY", "32"))    # /search 最大并发
+    ASYNC_DIALOGUE_CONCURRENCY: int = int(os.getenv("ASYNC_DIALOGUE_CONCURRENCY", "16"))  # /dialogue 最大并发
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"  # 首轮问答缓存开关
+    ANSWER_CACHE_MAX_ENTRIES: int = 2000          # 问答缓存最大条目数
+    ANSWER_CACHE_MAX_BYTES: int = 32 * 1024 * 1024  # 问答缓存内存上限（估算）
+    ANSWER_CACHE_TTL: int = 3600                  # 问答缓存过期时间（秒）
+    SEARCH_CACHE_ENABLED: bool = os.getenv("SEARCH_CACHE_ENABLED", "1") == "1"  # 检索结果缓存开关
+    SEARCH_CACHE_SIZE: int = 1024                 # 检索结果缓存最大条目数
+    SEARCH_CACHE_TTL: int = 600                   # 检索结果缓存过期时间（秒）
+    SEARCH_MANY_WORKERS: int = 8                  # search_many 并发检索的线程数
+    LOCAL_INTENT_ENABLED: bool = os.getenv("LOCAL_INTENT_ENABLED", "1") == "1"  # 本地意图分类快速通道
+    INTENT_TRAINING_LOG: str = "app_security.log"  # 本地意图分类器的训练日志
+    INTENT_BENIGN_CORPUS: str = "processed_qa_data.json"  # 本地意图分类器的良性样本：知识库问答中的问题
+    INTENT_BENIGN_THRESHOLD: float = 0.1          # 恶意概率不高于此值时本地判为良性
+    INTENT_MALICIOUS_THRESHOLD: float = 0.95      # 恶意概率不低于此值时本地判为恶意
+    INTENT_SCORE_SCALE: float = 4.0               # 平均对数似然比映射为概率时的缩放系数
+    INTENT_MEMO_SIZE: int = 10000                 # 意图判定记忆的最大条目数
+    EARLY_EXIT_ENABLED: bool = os.getenv("EARLY_EXIT_ENABLED", "1") == "1"  # 第一阶段证据充分时跳过第二阶段
+    EARLY_EXIT_MIN_SCORE: float = float(os.getenv("EARLY_EXIT_MIN_SCORE", "0.85"))   # 提前退出所需的最高相似度
+    EARLY_EXIT_MIN_MARGIN: float = float(os.getenv("EARLY_EXIT_MIN_MARGIN", "0.05"))  # 最高分与次高分的最小差距
+    RETRIEVAL_BACKEND: str = os.getenv("RETRIEVAL_BACKEND", "remote")  # 检索后端: remote (向量库) / local (本地索引)
+    LOCAL_INDEX_DIR: str = os.getenv("LOCAL_INDEX_DIR", "local_index")  # 本地向量索引目录
+    LOCAL_EMBEDDING_MODEL: str = os.getenv("LOCAL_EMBEDDING_MODEL", "paraphrase-multilingual-MiniLM-L12-v2")
+    LOCAL_INDEX_NPROBE: int = 8                   # IVF 查询时扫描的簇数
+    HYBRID_ENABLED: bool = os.getenv("HYBRID_ENABLED", "1") == "1"  # 第一阶段融合 BM25 关键词检索
+    BM25_K1: float = 1.5
+    BM25_B: float = 0.75
+    LEXICAL_TOP_K: int = 3                        # BM25 检索返回的文档数
+    RRF_K: int = 60                               # 倒数排名融合的平滑常数
+    HYBRID_TOP_K: int = 5                         # 融合后保留的文档数
+    CONVERSATION_BACKEND: str = os.getenv("CONVERSATION_BACKEND", "memory")  # 对话存储: memory / sqlite
+    CONVERSATION_MAX_BYTES: int = 64 * 1024 * 1024  # 内存存储的对话总大小上限（估算）
+    CONVERSATION_SPILL_DIR: str = os.getenv("CONVERSATION_SPILL_DIR", "conversation_spill")  # 超出上限的对话写入此目录（每个进程一个子目录），空字符串表示直接丢弃
+    CONVERSATION_DB_PATH: str = os.getenv("CONVERSATION_DB_PATH", "conversations.db")  # SQLite 存储的库文件
+    HISTORY_PAGE_SIZE: int = 30                   # /history 默认每页对话数
+    HISTORY_MAX_PAGE_SIZE: int = 200              # /history 与 /history/<id> 每页条数上限
+    EVALUATION_WORKERS: int = int(os.getenv("EVALUATION_WORKERS", "2"))        # 后台评估的工作线程数
+    EVALUATION_QUEUE_SIZE: int = int(os.getenv("EVALUATION_QUEUE_SIZE", "100"))  # 评估队列容量，满时丢弃新的评估
+    EVALUATION_MAX_RESULTS: int = 1000            # 保留的评估结果数上限
+    EVALUATION_RESULT_TTL: int = 3600             # 评估结果保留时间（秒）
+    EVALUATION_BATCH_SIZE: int = int(os.getenv("EVALUATION_BATCH_SIZE", "5"))  # 批量评估时每次调用评估的回答数
+    EVALUATION_BATCH_CONCURRENCY: int = 4         # 批量评估并发执行的批次数
+    EVALUATION_RATE_LIMIT: float = float(os.getenv("EVALUATION_RATE_LIMIT", "2"))  # 批量评估每秒最多调用次数，0 表示不限速
+    EVALUATION_ITEM_MAX_TOKENS: int = 400         # 批量评估时每项结果预留的输出 token 数
 
 class PersonalityConfig:
     TEACHER = {
@@ -0,0 +1,441 @@
+"""
+对话历史存储，替代 app.py 中无上限的全局 dict。
+
+- MemoryConversationStore：进程内 LRU，按估算字节数限制内存；超出上限时把最久未访问的对话
+  压缩后写到磁盘（spill），再次访问时自动载回。未配置 spill 目录时直接丢弃。
+  spill 文件只对写入它的进程有意义，每个进程使用自己的子目录，启动与退出时清理。
+- SQLiteConversationStore：SQLite WAL 模式，多个 worker 进程可共享同一个库文件。
+
+消息在存储内部以紧凑的 (角色代码, 内容) 元组保存，对外仍是 {"role": ..., "content": ...}。
+
+对话列表按最后活动时间倒序，使用游标分页：游标由 (updated_at, id) 编码，
+翻页期间有对话产生新消息（移到最前）也不会导致重复或遗漏。
+"""
+import atexit
+import bisect
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+
+ROLES = ("user", "assistant")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+# 每条消息除正文外的估算开销（元组、int、str 对象头）
+_MESSAGE_OVERHEAD = 120
+
+Message = Tuple[int, str]
+
+
+def compact_message(role: str, content: str) -> Message:
+    return _ROLE_CODES[role], content
+
+
+def expand_messages(messages: List[Message]) -> List[Dict[str, str]]:
+    return [{"role": ROLES[code], "content": content} for code, content in messages]
+
+
+def make_title(user_input: str) -> str:
+    """以首条用户输入作为对话标题"""
+    return user_input[:30] + "..." if len(user_input) > 30 else user_input
+
+
+def encode_cursor(updated_at: float, conversation_id: str) -> str:
+    return f"{updated_at!r}:{conversation_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """解析对话列表的分页游标，格式错误时抛出 ValueError"""
+    updated_at, _, conversation_id = cursor.partition(":")
+    return float(updated_at), conversation_id
+
+
+def page_messages(messages: List, limit: Optional[int], before: Optional[int]) -> Tuple[List, Optional[int]]:
+    """
+    取 before（消息序号，不含）之前最近的 limit 条消息。
+    返回 (该页消息, 下一页的 before)，没有更早的消息时后者为 None。
+    """
+    end = len(messages) if before is None else max(0, min(before, len(messages)))
+    start = 0 if limit is None else max(0, end - limit)
+    return messages[start:end], (start if start > 0 else None)
+
+
+def _process_alive(pid: int) -> bool:
+    """进程是否仍在运行。Windows 上 os.kill 会直接终止目标进程，无法用来探测，保守地视为仍在运行"""
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def prepare_spill_dir(root: str) -> str:
+    """
+    创建并清空本进程的 spill 目录 <root>/proc-<pid>，返回其路径。
+    内存存储的对话索引不跨进程保留，之前的进程留下的 spill 文件再也无法访问：
+    同时删除已退出进程的目录，以及旧版本直接写在 root 下的文件。
+    """
+    os.makedirs(root, exist_ok=True)
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith("proc-") and os.path.isdir(path):
+            pid = name[len("proc-"):]
+            if pid.isdigit() and int(pid) != os.getpid() and _process_alive(int(pid)):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+        elif name.endswith((".json.z", ".json.z.tmp")):
+            os.remove(path)
+    spill_dir = os.path.join(root, f"proc-{os.getpid()}")
+    os.makedirs(spill_dir, exist_ok=True)
+    return spill_dir
+
+
+class ConversationStore:
+    """对话存储接口。所有实现均线程安全。"""
+
+    def get_or_create(self, conversation_id: Optional[str], user_input: str) -> Tuple[str, List[Dict[str, str]]]:
+        """返回 (conversation_id, 历史消息)；对话不存在时以用户输入为标题新建"""
+        if conversation_id:
+            messages = self.get_messages(conversation_id)
+            if messages is not None:
+                return conversation_id, messages
+        conversation_id = str(uuid.uuid4())
+        self.create(conversation_id, make_title(user_input))
+        return conversation_id, []
+
+    def create(self, conversation_id: str, title: str):
+        raise NotImplementedError
+
+    def get_messages(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """返回对话的全部消息，对话不存在时返回 None"""
+        raise NotImplementedError
+
+    def get_message_page(self, conversation_id: str, limit: int = None,
+                         before: int = None) -> Optional[Dict]:
+        """
+        分页读取消息（从最新往前翻），对话不存在时返回 None。
+        返回 {"messages": [...], "total": 消息总数, "next_before": 更早一页的游标或 None}
+        """
+        messages = self.get_messages(conversation_id)
+        if messages is None:
+            return None
+        page, next_before = page_messages(messages, limit, before)
+        return {"messages": page, "total": len(messages), "next_before": next_before}
+
+    def message_count(self, conversation_id: str) -> int:
+        """对话中的消息数，对话不存在时为 0"""
+        raise NotImplementedError
+
+    def append_turn(self, conversation_id: str, user_input: str, response: str):
+        """追加一轮问答；对话已被清除时静默忽略"""
+        raise NotImplementedError
+
+    def list_conversations(self, limit: int = None, before: str = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        按最后活动时间倒序列出对话 [{"id", "title", "updated_at"}]。
+        before 为上一页返回的游标；返回 (该页对话, 下一页游标或 None)。
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class _Conversation:
+    __slots__ = ("title", "messages", "nbytes")
+
+    def __init__(self, title: str, messages: List[Message] = None):
+        self.title = title
+        self.messages = messages or []
+        self.nbytes = _MESSAGE_OVERHEAD + len(title.encode("utf-8"))
+        for _, content in self.messages:
+            self.nbytes += _MESSAGE_OVERHEAD + len(content.encode("utf-8"))
+
+
+class MemoryConversationStore(ConversationStore):
+    """进程内 LRU 存储，内存占用受 max_bytes 限制，超出部分写入 spill_dir 下本进程的子目录"""
+
+    def __init__(self, max_bytes: int = None, spill_dir: str = None):
+        self.max_bytes = max_bytes if max_bytes is not None else config.CONVERSATION_MAX_BYTES
+        spill_root = spill_dir if spill_dir is not None else config.CONVERSATION_SPILL_DIR
+        self.spill_dir = prepare_spill_dir(spill_root) if spill_root else ""
+        self._hot: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._titles: Dict[str, str] = {}   # 所有对话（含已写到磁盘的）的标题
+        self._updated_at: Dict[str, float] = {}
+        self._activity: List[Tuple[float, str]] = []  # (updated_at, id) 升序，增量维护
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.spilled = 0
+        self.reloaded = 0
+        self.dropped = 0
+        if self.spill_dir:
+            atexit.register(shutil.rmtree, self.spill_dir, True)
+
+    def _spill_path(self, conversation_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{conversation_id}.json.z")
+
+    def _load(self, conversation_id: str) -> Optional[_Conversation]:
+        """取出对话（必要时从磁盘载回），调用方需持有锁"""
+        conv = self._hot.get(conversation_id)
+        if conv is not None:
+            self._hot.move_to_end(conversation_id)
+            return conv
+        if conversation_id not in self._titles or not self.spill_dir:
+            return None
+        path = self._spill_path(conversation_id)
+        with open(path, 'rb') as f:
+            data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        os.remove(path)
+        conv = _Conversation(data["title"], [tuple(m) for m in data["messages"]])
+        self._insert(conversation_id, conv)
+        self.reloaded += 1
+        return conv
+
+    def _touch(self, conversation_id: str):
+        """记录一次活动：时间戳严格递增，新键总是追加在索引末尾"""
+        old = self._updated_at.get(conversation_id)
+        if old is not None:
+            del self._activity[bisect.bisect_left(self._activity, (old, conversation_id))]
+        now = time.time()
+        if self._activity and now <= self._activity[-1][0]:
+            now = self._activity[-1][0] + 1e-6
+        self._updated_at[conversation_id] = now
+        self._activity.append((now, conversation_id))
+
+    def _forget(self, conversation_id: str):
+        del self._titles[conversation_id]
+        old = self._updated_at.pop(conversation_id)
+        del self._activity[bisect.bisect_left(self._activity, (old, conversation_id))]
+
+    def _insert(self, conversation_id: str, conv: _Conversation):
+        self._hot[conversation_id] = conv
+        self._titles[conversation_id] = conv.title
+        self._bytes += conv.nbytes
+        self._evict(keep=conversation_id)
+
+    def _evict(self, keep: str):
+        """超出内存上限时淘汰最久未访问的对话（当前对话除外）"""
+        while self._bytes > self.max_bytes and len(self._hot) > 1:
+            conversation_id, conv = next(iter(self._hot.items()))
+            if conversation_id == keep:
+                self._hot.move_to_end(conversation_id)
+                continue
+            del self._hot[conversation_id]
+            self._bytes -= conv.nbytes
+            if self.spill_dir:
+                payload = json.dumps({"title": conv.title, "messages": conv.messages}, ensure_ascii=False)
+                tmp_path = self._spill_path(conversation_id) + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(zlib.compress(payload.encode("utf-8")))
+                os.replace(tmp_path, self._spill_path(conversation_id))
+                self.spilled += 1
+            else:
+                self._forget(conversation_id)
+                self.dropped += 1
+
+    def create(self, conversation_id: str, title: str):
+        with self._lock:
+            self._touch(conversation_id)
+            self._insert(conversation_id, _Conversation(title))
+
+    def get_messages(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            conv = self._load(conversation_id)
+            return expand_messages(conv.messages) if conv is not None else None
+
+    def message_count(self, conversation_id: str) -> int:
+        with self._lock:
+            conv = self._load(conversation_id)
+            return len(conv.messages) if conv is not None else 0
+
+    def append_turn(self, conversation_id: str, user_input: str, response: str):
+        with self._lock:
+            conv = self._load(conversation_id)
+            if conv is None:
+                return
+            self._touch(conversation_id)
+            for message in (compact_message("user", user_input), compact_message("assistant", response)):
+                conv.messages.append(message)
+                size = _MESSAGE_OVERHEAD + len(message[1].encode("utf-8"))
+                conv.nbytes += size
+                self._bytes += size
+            self._evict(keep=conversation_id)
+
+    def get_message_page(self, conversation_id: str, limit: int = None,
+                         before: int = None) -> Optional[Dict]:
+        with self._lock:
+            conv = self._load(conversation_id)
+            if conv is None:
+                return None
+            page, next_before = page_messages(conv.messages, limit, before)
+            return {"messages": expand_messages(page), "total": len(conv.messages), "next_before": next_before}
+
+    def list_conversations(self, limit: int = None, before: str = None) -> Tuple[List[Dict], Optional[str]]:
+        with self._lock:
+            end = len(self._activity)
+            if before is not None:
+                end = bisect.bisect_left(self._activity, decode_cursor(before))
+            start = 0 if limit is None else max(0, end - limit)
+            page = [{"id": conv_id, "title": self._titles[conv_id], "updated_at": updated_at}
+                    for updated_at, conv_id in reversed(self._activity[start:end])]
+        next_before = encode_cursor(page[-1]["updated_at"], page[-1]["id"]) if start > 0 and page else None
+        return page, next_before
+
+    def clear(self):
+        with self._lock:
+            if self.spill_dir:
+                # 删除整个目录（包括写到一半的 .tmp 文件）后重建
+                shutil.rmtree(self.spill_dir, ignore_errors=True)
+                os.makedirs(self.spill_dir, exist_ok=True)
+            self._hot.clear()
+            self._titles.clear()
+            self._updated_at.clear()
+            self._activity.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"backend": "memory", "conversations": len(self._titles), "in_memory": len(self._hot),
+                    "bytes": self._bytes, "spilled": self.spilled, "reloaded": self.reloaded,
+                    "dropped": self.dropped}
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    SQLite 存储（WAL 模式：读写互不阻塞，多个进程可同时读，写入由 SQLite 串行化）。
+    每个线程使用自己的连接。
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            role INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (conversation_id, seq)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_conversations_activity ON conversations (updated_at DESC, id DESC);
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else config.CONVERSATION_DB_PATH
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def create(self, conversation_id: str, title: str):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO conversations (id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                         (conversation_id, title, now, now))
+
+    def get_messages(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone() is None:
+            return None
+        rows = conn.execute("SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+                            (conversation_id,)).fetchall()
+        return expand_messages(rows)
+
+    def message_count(self, conversation_id: str) -> int:
+        row = self._connect().execute("SELECT COUNT(*) FROM messages WHERE conversation_id = ?",
+                                      (conversation_id,)).fetchone()
+        return row[0]
+
+    def append_turn(self, conversation_id: str, user_input: str, response: str):
+        conn = self._connect()
+        with conn:
+            # BEGIN IMMEDIATE 先取得写锁，避免多进程同时追加时 seq 冲突
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("UPDATE conversations SET updated_at = ? WHERE id = ?",
+                            (time.time(), conversation_id)).rowcount == 0:
+                return
+            seq = conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE conversation_id = ?",
+                               (conversation_id,)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)",
+                [(conversation_id, seq, *compact_message("user", user_input)),
+                 (conversation_id, seq + 1, *compact_message("assistant", response))]
+            )
+
+    def get_message_page(self, conversation_id: str, limit: int = None,
+                         before: int = None) -> Optional[Dict]:
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone() is None:
+            return None
+        total = self.message_count(conversation_id)
+        end = total if before is None else max(0, min(before, total))
+        start = 0 if limit is None else max(0, end - limit)
+        rows = conn.execute("SELECT role, content FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? "
+                            "ORDER BY seq", (conversation_id, start, end)).fetchall()
+        return {"messages": expand_messages(rows), "total": total, "next_before": start if start > 0 else None}
+
+    def list_conversations(self, limit: int = None, before: str = None) -> Tuple[List[Dict], Optional[str]]:
+        sql = "SELECT id, title, updated_at FROM conversations"
+        params: list = []
+        if before is not None:
+            updated_at, conversation_id = decode_cursor(before)
+            sql += " WHERE updated_at < ? OR (updated_at = ? AND id < ?)"
+            params += [updated_at, updated_at, conversation_id]
+        sql += " ORDER BY updated_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)   # 多取一条用来判断是否还有下一页
+        rows = self._connect().execute(sql, params).fetchall()
+        has_more = limit is not None and len(rows) > limit
+        page = [{"id": conv_id, "title": title, "updated_at": updated_at}
+                for conv_id, title, updated_at in rows[:limit]]
+        next_before = encode_cursor(page[-1]["updated_at"], page[-1]["id"]) if has_more else None
+        return page, next_before
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages")
+            conn.execute("DELETE FROM conversations")
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._connect()
+        return {"backend": "sqlite",
+                "conversations": conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0],
+                "messages": conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]}
+
+
+def create_conversation_store(backend: str = None) -> ConversationStore:
+    """按 config.CONVERSATION_BACKEND 创建存储：memory（默认）/ sqlite"""
+    backend = backend or config.CONVERSATION_BACKEND
+    if backend == "sqlite":
+        return SQLiteConversationStore()
+    if backend == "memory":
+        return MemoryConversationStore()
+    raise ValueError(f"未知的对话存储后端: {backend}")
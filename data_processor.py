@@ -1,60 +1,198 @@
-from typing import List, Dict, Tuple
+import math
+import re
+from typing import Callable, List, Dict, NamedTuple
 from config import config
+from retrieval_controller import doc_score
 
-def extract_context(search_results: Dict, max_length: int = None) -> str:
+TokenCounter = Callable[[str], int]
+
+# 中日韩文字及全角标点：大多数分词器中约一个字一个 token
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 句子：以中英文句末标点或换行结尾（英文句点后需跟空白，避免切开 TLS1.3、小数等）
+_SENTENCE_RE = re.compile(r".+?(?:[。！？!?；;]+|\.(?=\s)|\n|$)", re.S)
+
+_token_counters: Dict[str, TokenCounter] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """CJK 感知的 token 估算：CJK 字符按 1 个 token，其余字符约 4 个一个 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def get_token_counter(name: str = None) -> TokenCounter:
     """
-    从 search 结果中提取上下文，控制总长度
-    :param search_results: API 返回的 search 结果
-    :param max_length: 最大字符数，默认使用 config.MAX_CONTEXT_LENGTH
-    :return: 拼接后的上下文字符串
+    按名称返回 token 计数函数（默认 config.CONTEXT_TOKENIZER）：
+    - "estimate"：estimate_tokens，无额外依赖
+    - "tiktoken:<编码名>"：使用 tiktoken 精确计数（需另行安装 tiktoken）
     """
-    if max_length is None:
-        max_length = config.MAX_CONTEXT_LENGTH
+    name = name or config.CONTEXT_TOKENIZER
+    if name == "estimate":
+        return estimate_tokens
+    if name not in _token_counters:
+        backend, _, encoding_name = name.partition(":")
+        if backend != "tiktoken":
+            raise ValueError(f"未知的 tokenizer: {name}")
+        import tiktoken
+        encoding = tiktoken.get_encoding(encoding_name or "cl100k_base")
+        _token_counters[name] = lambda text: len(encoding.encode(text))
+    return _token_counters[name]
 
-    contexts = []
-    total_len = 0
 
-    items = search_results.get("results", search_results.get("files", []))
+def item_content(item: Dict) -> str:
+    """从检索结果条目中取出正文，兼容多种返回格式"""
+    # 1. 优先检查是否存在 'payload' 字段
+    payload = item.get("payload", {})
+
+    # 2. 从 payload 或顶层对象中依次尝试获取内容
+    return (
+        item.get("text") or
+        payload.get("file") or
+        payload.get("content") or
+        item.get("file_content") or
+        item.get("file") or
+        item.get("content") or
+        ""
+    )
+
 
-    for item in items:
-        # --- ✅ 核心修改在这里 ---
-        # 1. 优先检查是否存在 'payload' 字段
-        payload = item.get("payload", {})
-        
-        # 2. 从 payload 或顶层对象中依次尝试获取内容
-        content = (
-            item.get("text") or
-            payload.get("file") or 
-            payload.get("content") or
-            item.get("file_content") or 
-            item.get("file") or 
-            item.get("content") or 
-            ""
-        )
-        # -------------------------
-
-        if total_len + len(content) > max_length:
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: TokenCounter) -> str:
+    """在句子边界处截断，保留不超过 max_tokens 的前若干句；第一句就放不下时返回空串"""
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_RE.findall(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > max_tokens:
             break
-        contexts.append(content)
-        total_len += len(content)
+        kept.append(sentence)
+        used += tokens
+    return "".join(kept).rstrip()
+
+
+class PackedContext(NamedTuple):
+    text: str              # 拼接后的上下文
+    docs: List[Dict]       # 入选的检索条目（按相关性排序）
+    contents: List[str]    # 与 docs 对应的实际使用的正文（可能被截断）
+    tokens: int            # 上下文占用的 token 数
+    budget: int            # token 预算
+    dropped: int           # 未能放入的文档数
+    truncated: int         # 被截断的文档数
 
-    return "\n\n".join(contexts)
 
-def files_to_citations(search_results: Dict) -> List[Dict]:
+def pack_context(items: List[Dict], max_tokens: int = None, count_tokens: TokenCounter = None,
+                 truncate: bool = None) -> PackedContext:
+    """
+    在 token 预算内挑选上下文文档。
+    按“相关性 / token 数”从高到低贪心选入，放不下的文档可在句子边界截断后填满剩余预算；
+    入选文档最终仍按相关性排序输出。检索结果都带分数时以分数为相关性，否则按排名 1/(rank+1)。
+    """
+    budget = max_tokens if max_tokens is not None else config.MAX_CONTEXT_TOKENS
+    count_tokens = count_tokens or get_token_counter()
+    truncate = truncate if truncate is not None else config.CONTEXT_TRUNCATE
+    separator_tokens = count_tokens("\n\n")
+
+    scores = [doc_score(item) for item in items]
+    use_scores = bool(items) and all(score is not None for score in scores)
+    candidates = []
+    for rank, item in enumerate(items):
+        content = item_content(item)
+        if not content:
+            continue
+        relevance = max(scores[rank], 1e-6) if use_scores else 1.0 / (rank + 1)
+        tokens = count_tokens(content)
+        candidates.append((relevance / max(tokens, 1), rank, content, tokens))
+
+    selected: Dict[int, str] = {}
+    used = 0
+    truncated = 0
+    for _, rank, content, tokens in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        separator = separator_tokens if selected else 0
+        if used + separator + tokens <= budget:
+            selected[rank] = content
+            used += separator + tokens
+        elif truncate and budget - used - separator >= config.CONTEXT_MIN_TRUNCATED_TOKENS:
+            cut = truncate_to_tokens(content, budget - used - separator, count_tokens)
+            if cut:
+                selected[rank] = cut
+                used += separator + count_tokens(cut)
+                truncated += 1
+
+    ranks = sorted(selected)
+    contents = [selected[rank] for rank in ranks]
+    return PackedContext(
+        text="\n\n".join(contents),
+        docs=[items[rank] for rank in ranks],
+        contents=contents,
+        tokens=used,
+        budget=budget,
+        dropped=len(candidates) - len(selected),
+        truncated=truncated,
+    )
+
+
+def extract_context(search_results: Dict, max_length: int = None) -> str:
+    """
+    从 search 结果中提取上下文，控制总长度（见 pack_context）
+    :param search_results: API 返回的 search 结果
+    :param max_length: 按字符数计的预算；默认按 config.MAX_CONTEXT_TOKENS 个 token 计
+    :return: 拼接后的上下文字符串
+    """
+    items = search_results.get("results", search_results.get("files", []))
+    if max_length is not None:
+        return pack_context(items, max_tokens=max_length, count_tokens=len).text
+    return pack_context(items).text
+
+def files_to_citations(search_results: Dict, snippet_length: int = None) -> List[Dict]:
     """
     为每个检索到的文件生成引用编号和链接（模拟）
     :param search_results: API 返回的 search 结果
-    :return: 包含引用信息的列表
+    :param snippet_length: 摘要最大字符数，默认使用 config.CITATION_SNIPPET_LENGTH
+    :return: 包含引用信息的列表（只含编号、链接和简短摘要，正文只在上下文中出现一次）
     """
+    if snippet_length is None:
+        snippet_length = config.CITATION_SNIPPET_LENGTH
     citations = []
     items = search_results.get("results", search_results.get("files", []))
     for i, item in enumerate(items, 1):
-        file_id = item.get("file_id") or item.get("id") or item.get("name") or "unknown"
-        content = (item.get("file_content") or item.get("file") or item.get("content") or "")
+        file_id = (item.get("file_id") or item.get("id") or item.get("name")
+                   or (item.get("metadata") or {}).get("source") or "unknown")
+        content = item_content(item)
+        snippet = content if len(content) <= snippet_length else content[:snippet_length].rstrip() + "…"
         citations.append({
             "id": i,
             "file_id": file_id,
-            "snippet": content,
+            "snippet": snippet,
             "link": f"#file-{file_id}"  # 可替换为真实URL
         })
-    return citations
\ No newline at end of file
+    return citations
+
+def cited_context(packed: PackedContext) -> str:
+    """把入选文档拼成上下文，每篇文档只出现一次，并以 [编号] 开头，编号与 files_to_citations 一致"""
+    return "\n\n".join(f"[{i}] {content}" for i, content in enumerate(packed.contents, 1))
+
+def doc_key(doc: Dict) -> str:
+    """
+    文档去重键：使用正文。
+    metadata.source 不能保证唯一（同一语料文件中的条目可能共用一个 source），正文相同才是真正的重复。
+    """
+    return (doc.get("file") or doc.get("content") or doc.get("text")
+            or (doc.get("metadata") or {}).get("source") or "")
+
+def merge_results(result_lists: List[List[Dict]]) -> List[Dict]:
+    """
+    合并多次检索的结果并去重。
+    同一文档出现多次时保留最高的 score；有分数的文档按分数降序排在前面，其余保持原有先后顺序。
+    """
+    merged: Dict[str, Dict] = {}
+    for results in result_lists:
+        for doc in results:
+            key = doc_key(doc)
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = doc
+            elif isinstance(doc.get("score"), (int, float)) and doc["score"] > existing.get("score", float("-inf")):
+                merged[key] = {**existing, **doc}
+    docs = list(merged.values())
+    scored = [d for d in docs if isinstance(d.get("score"), (int, float))]
+    unscored = [d for d in docs if not isinstance(d.get("score"), (int, float))]
+    return sorted(scored, key=lambda d: d["score"], reverse=True) + unscored
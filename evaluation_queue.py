@@ -0,0 +1,124 @@
+"""
+后台回答质量评估。
+
+评估需要再调用一次对话接口，耗时与生成回答相当；放在请求路径上会让开启评估的 /chat 延迟翻倍。
+这里用固定数量的工作线程消费一个有界队列：请求只负责入队并立即返回 evaluation_id，
+前端稍后通过 /evaluation/<id> 取回报告。队列满时直接丢弃（计入 dropped），不阻塞请求。
+
+评估结果只保存在当前进程内，多进程部署时需要会话粘滞才能取回报告。
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from config import config
+from response_evaluator import integrate_with_rag_flow
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class EvaluationQueue:
+    """有界队列 + 固定工作线程池的后台评估，线程安全"""
+
+    def __init__(self, client=None, workers: int = None, max_queue: int = None,
+                 max_results: int = None, result_ttl: int = None,
+                 evaluate: Callable[..., tuple] = None):
+        self.client = client
+        self.workers = workers if workers is not None else config.EVALUATION_WORKERS
+        self.max_queue = max_queue if max_queue is not None else config.EVALUATION_QUEUE_SIZE
+        self.max_results = max_results if max_results is not None else config.EVALUATION_MAX_RESULTS
+        self.result_ttl = result_ttl if result_ttl is not None else config.EVALUATION_RESULT_TTL
+        self._evaluate = evaluate or integrate_with_rag_flow
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_queue)
+        # evaluation_id -> {"status", "created_at", "finished_at", "evaluation" / "error"}
+        self._results: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_workers(self):
+        """惰性启动工作线程（守护线程，进程退出时不等待未完成的评估）"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"evaluation-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, question: str, context: str, response: str) -> Optional[str]:
+        """提交一次评估，返回 evaluation_id；队列已满时丢弃并返回 None"""
+        evaluation_id = uuid.uuid4().hex
+        with self._lock:
+            self._ensure_workers()
+            try:
+                self._queue.put_nowait((evaluation_id, question, context, response))
+            except queue.Full:
+                self.dropped += 1
+                logger.warning(f"评估队列已满（{self.max_queue}），丢弃本次评估")
+                return None
+            self.submitted += 1
+            self._results[evaluation_id] = {"status": STATUS_PENDING, "created_at": time.time()}
+            self._prune()
+        return evaluation_id
+
+    def get(self, evaluation_id: str) -> Optional[Dict]:
+        """查询评估状态与结果，不存在或已过期返回 None"""
+        with self._lock:
+            self._prune()
+            entry = self._results.get(evaluation_id)
+            return dict(entry) if entry is not None else None
+
+    def _prune(self):
+        """淘汰过期结果与超出数量上限的最旧结果（调用方需持有锁）"""
+        expire_before = time.time() - self.result_ttl
+        while self._results:
+            oldest_id, oldest = next(iter(self._results.items()))
+            if len(self._results) <= self.max_results and oldest["created_at"] >= expire_before:
+                break
+            del self._results[oldest_id]
+
+    def _finish(self, evaluation_id: str, **fields):
+        with self._lock:
+            entry = self._results.get(evaluation_id)
+            if entry is not None:
+                entry.update(fields, finished_at=time.time())
+
+    def _run(self):
+        while True:
+            evaluation_id, question, context, response = self._queue.get()
+            try:
+                _, report = self._evaluate(response, question, context, client=self.client)
+                self._finish(evaluation_id, status=STATUS_DONE, evaluation=report)
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                logger.error(f"后台评估失败: {e}")
+                self._finish(evaluation_id, status=STATUS_FAILED, error=str(e))
+                with self._lock:
+                    self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.max_queue,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "completed": self.completed,
+                "failed": self.failed,
+                "results": len(self._results),
+            }
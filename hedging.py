@@ -0,0 +1,121 @@
+"""
+对冲请求（hedged requests），用于降低幂等上游调用的尾延迟。
+
+第一次请求在 "近期延迟的 P 分位数" 内没有返回时，再发出一个相同的请求，取先成功返回的结果。
+额外负载由令牌桶限制：每个请求积攒 max_ratio 个令牌，每次对冲消耗 1 个，
+因此长期来看对冲请求数不超过总请求数的 max_ratio。
+
+注意：requests 无法中断已经发出的同步请求。落败的一方如果尚未开始执行会被取消；
+已在执行的只能放弃其结果，它仍会占用一个线程与连接直到返回（或触发读取超时）。
+"""
+import concurrent.futures
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, TypeVar
+
+from config import config
+
+T = TypeVar("T")
+
+
+class HedgePolicy:
+    """记录近期延迟、计算对冲等待时间并限制对冲比例，线程安全"""
+
+    def __init__(self, percentile: float = None, window: int = None, min_samples: int = None,
+                 min_delay: float = None, max_ratio: float = None, max_tokens: float = None):
+        self.percentile = percentile if percentile is not None else config.HEDGE_PERCENTILE
+        self.min_samples = min_samples if min_samples is not None else config.HEDGE_MIN_SAMPLES
+        self.min_delay = min_delay if min_delay is not None else config.HEDGE_MIN_DELAY
+        self.max_ratio = max_ratio if max_ratio is not None else config.HEDGE_MAX_RATIO
+        self.max_tokens = max_tokens if max_tokens is not None else config.HEDGE_MAX_TOKENS
+        self._latencies = deque(maxlen=window if window is not None else config.HEDGE_LATENCY_WINDOW)
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.hedges_throttled = 0
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """当前的对冲等待时间；样本不足时返回 None（不对冲）"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    def start_request(self):
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.max_tokens, self._tokens + self.max_ratio)
+
+    def try_hedge(self) -> bool:
+        """消耗一个对冲令牌；令牌不足时拒绝（计入 hedges_throttled）"""
+        with self._lock:
+            if self._tokens < 1:
+                self.hedges_throttled += 1
+                return False
+            self._tokens -= 1
+            self.hedges_fired += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def stats(self) -> Dict:
+        delay = self.delay()
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges_fired": self.hedges_fired,
+                "hedges_won": self.hedges_won,
+                "hedges_throttled": self.hedges_throttled,
+                "hedge_delay_ms": round(delay * 1000, 1) if delay is not None else None,
+                "latency_samples": len(self._latencies),
+            }
+
+
+def hedged_call(fn: Callable[[], T], policy: HedgePolicy,
+                executor: concurrent.futures.Executor) -> T:
+    """
+    执行 fn，必要时发出一次对冲请求并返回先成功的结果。
+    两次都失败时抛出首个请求的异常。每次调用各自的耗时都会计入延迟样本。
+    """
+    def timed():
+        started = time.monotonic()
+        result = fn()
+        policy.record_latency(time.monotonic() - started)
+        return result
+
+    policy.start_request()
+    delay = policy.delay()
+    if delay is None:
+        return timed()
+
+    primary = executor.submit(timed)
+    try:
+        return primary.result(timeout=delay)
+    except concurrent.futures.TimeoutError:
+        pass
+    if not policy.try_hedge():
+        return primary.result()
+
+    hedge = executor.submit(timed)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for loser in pending:
+                    loser.cancel()   # 仅能取消尚未开始的请求，已发出的请求结果被丢弃
+                if future is hedge:
+                    policy.record_win()
+                return future.result()
+    return primary.result()
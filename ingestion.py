@@ -0,0 +1,681 @@
+"""
+向量库入库：入库清单（ingestion manifest）与自适应批量上传。
+
+每个文档按内容哈希记录上传状态（uploaded / failed）。重新运行入库时只上传清单中没有的
+或上次失败的文档，中断后的续传不再依赖 "从第 N 个开始" 这样的位置参数。
+
+持久化分两部分：
+- 快照 <path>：完整的清单 JSON，写临时文件后 os.replace 原子替换
+- 日志 <path>.log：每个批次完成时追加一行并 fsync，崩溃后最多丢失正在上传的批次；
+  加载时在快照上重放日志，compact() 把日志并入快照后清空
+
+AdaptiveUploader 按字节数而不是文档数切分批次，并按 AIMD 调整并发：
+批次成功且延迟低于目标时并发缓慢增加，失败或超时则并发减半（批次字节数同时收缩）。
+
+iter_json_items / prefetch 用于流式入库：大型 JSON 数组逐个元素增量解析，
+各阶段之间用有界队列衔接，内存占用与语料大小无关。
+iter_json_documents / load_json_files 把 json_files 目录中的条目展开为可检索文档，
+上传、本地向量索引与 BM25 索引共用（本模块导入时没有副作用，可以被离线脚本直接使用）。
+"""
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import config
+from guard import INJECTION_SCAN_FIELD
+
+try:
+    import ijson   # 可选：安装后用 C 后端解析大型数组
+except ImportError:
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+_json_decoder = json.JSONDecoder()
+# 可能出现在数字中间的字符
+_NUMBER_CHARS = frozenset(".eE+-0123456789")
+
+
+def iter_json_items(path: str, chunk_size: int = None) -> Iterator[Tuple[Optional[int], Any]]:
+    """
+    增量解析 JSON 文件，逐个产出 (序号, 条目)。
+    顶层是数组时逐个元素解析（序号从 0 开始），任意时刻只在内存中保留当前元素附近的一段文本；
+    顶层是其他值（单个对象）时整体解析，序号为 None。格式错误时抛出 json.JSONDecodeError。
+    """
+    chunk_size = chunk_size or config.INGEST_READ_CHUNK
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buf = f.read(chunk_size)
+        pos = len(buf) - len(buf.lstrip())
+        if not buf[pos:pos + 1] == "[":
+            yield None, json.loads(buf + f.read())
+            return
+
+        if ijson is not None:
+            with open(path, 'rb') as raw:
+                for index, item in enumerate(ijson.items(raw, "item", use_float=True)):
+                    yield index, item
+            return
+
+        pos += 1
+        index = 0
+        eof = False
+        while True:
+            # 跳过元素之间的空白与逗号
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    raise json.JSONDecodeError("数组没有结束", buf, pos)
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = _json_decoder.raw_decode(buf, pos)
+                # 数字没有结束符，缓冲区截在中间时（"1." 会被解析为 1）前缀也能解析成功：
+                # 只有后面已缓冲了一个不可能属于数字的字符，或已读到文件末尾，才算完整
+                complete = eof or (end < len(buf) and buf[end] not in _NUMBER_CHARS)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                # 读取量至少与已缓冲的内容相当，超大元素的重复解析总代价保持线性
+                more = f.read(max(chunk_size, len(buf) - pos))
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield index, item
+            index += 1
+            pos = end
+            if pos > chunk_size:
+                buf, pos = buf[pos:], 0
+
+
+_DONE = object()
+
+
+def prefetch(iterable: Iterable, maxsize: int) -> Iterator:
+    """
+    在后台线程中消费 iterable，经容量为 maxsize 的有界队列逐个产出。
+    下游处理慢时上游在 put 处阻塞（背压）；上游的异常在下游重新抛出；下游提前结束时上游随之停止。
+    """
+    items: queue.Queue = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+            return
+        put((_DONE, None))
+
+    thread = threading.Thread(target=produce, name="ingest-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+def expand_item(item: Dict, source_name: str) -> List[Dict]:
+    """
+    处理单个JSON条目，支持多种格式
+    返回：由该条目生成的可检索文档列表（CQA 三元组生成 3 个，其余格式 1 个，无效条目为空）
+    """
+    files = []
+    docs_added = 0
+    
+    # ========== 格式1: CQA三元组 (优先处理) ==========
+    if all(k in item for k in ['context', 'question', 'answer']):
+        context = item.get('context', '').strip()
+        question = item.get('question', '').strip()
+        answer = item.get('answer', '').strip()
+        
+        if not (context and question and answer):
+            print(f"⚠️ {source_name}: CQA字段存在但内容为空，已跳过")
+            return files
+        
+        # 策略1: 完整的CQA文档
+        full_content = f"""【背景知识】
+{context}
+
+【相关问题】
+{question}
+
+【参考答案】
+{answer}"""
+        
+        files.append({
+            "file": full_content,
+            "metadata": {
+                "source": source_name,
+                "type": "full_cqa",
+                "context": context,
+                "question": question,
+                "answer": answer
+            }
+        })
+        docs_added += 1
+        
+        # 策略2: Context + Question (更容易匹配问题)
+        cq_content = f"""问题：{question}
+
+相关背景：{context}"""
+        
+        files.append({
+            "file": cq_content,
+            "metadata": {
+                "source": f"{source_name}_cq",
+                "type": "context_question",
+                "full_answer": answer
+            }
+        })
+        docs_added += 1
+        
+        # 策略3: Question + Answer (QA对匹配)
+        qa_content = f"""Q: {question}
+
+A: {answer}"""
+        
+        files.append({
+            "file": qa_content,
+            "metadata": {
+                "source": f"{source_name}_qa",
+                "type": "question_answer",
+                "full_context": context
+            }
+        })
+        docs_added += 1
+        
+        print(f"✅ [CQA格式] {source_name}: 生成 {docs_added} 个文档")
+        return files
+    
+    # ========== 格式2: concept格式 (原有格式) ==========
+    elif 'concept' in item:
+        content = item.get('concept', '').strip()
+        metadata = item.get('metadata', {'source': source_name})
+        
+        if 'description' in item:
+            if not isinstance(metadata, dict):
+                metadata = {'source': source_name}
+            metadata['description'] = item['description']
+        
+        if content:
+            files.append({
+                "file": content,
+                "metadata": metadata
+            })
+            print(f"✅ [concept格式] {source_name}: 长度 {len(content)} 字符")
+            return files
+        else:
+            print(f"⚠️ {source_name}: concept字段为空")
+            return files
+    
+    # ========== 格式3: content格式 (原有格式) ==========
+    elif 'content' in item:
+        content = item.get('content', '').strip()
+        metadata = item.get('metadata', {'source': source_name})
+        
+        if 'description' in item:
+            if not isinstance(metadata, dict):
+                metadata = {'source': source_name}
+            metadata['description'] = item['description']
+        
+        if content:
+            files.append({
+                "file": content,
+                "metadata": metadata
+            })
+            print(f"✅ [content格式] {source_name}: 长度 {len(content)} 字符")
+            return files
+        else:
+            print(f"⚠️ {source_name}: content字段为空")
+            return files
+    
+    # ========== 不支持的格式 ==========
+    else:
+        print(f"❌ {source_name}: 不支持的格式，需要 context/question/answer 或 concept 或 content 字段")
+        return files
+
+
+def iter_json_documents(directory='json_files', stats: Dict = None, scanner=None) -> Iterator[Dict]:
+    """
+    流式读取目录下的JSON文件并逐个产出可检索文档。
+    大型数组逐个元素增量解析，内存中只保留当前条目；入库前的注入扫描也逐条完成。
+    :param stats: 可选，累计 files / documents / flagged / failed_items 数量与 types（各文档类型数量）
+    :param scanner: 可选，guard.InjectionScanner；传入时为每个文档写入注入扫描结论
+    """
+    stats = stats if stats is not None else {}
+    type_counts = stats.setdefault('types', {})
+    print(f"🔍 正在扫描目录: {directory}")
+    
+    if not os.path.exists(directory):
+        print(f"❌ 目录 {directory} 不存在")
+        return
+    
+    json_files = [f for f in os.listdir(directory) if f.endswith('.json')]
+    print(f"📄 找到 {len(json_files)} 个JSON文件: {json_files}")
+    
+    for filename in json_files:
+        filepath = os.path.join(directory, filename)
+        print(f"📖 正在处理文件: {filename}")
+        total_docs = 0
+        
+        try:
+            for index, item in iter_json_items(filepath):
+                if index is None:
+                    # 单个文档
+                    if not isinstance(item, dict):
+                        print(f"❌ 文件 {filename} 格式不支持，应为字典或列表")
+                        break
+                    source_id = filename
+                elif isinstance(item, dict):
+                    source_id = f"{filename}_item{index+1}"
+                else:
+                    print(f"⚠️ 第 {index+1} 个元素不是字典，已跳过")
+                    continue
+                
+                try:
+                    docs = expand_item(item, source_id)
+                    # 入库前做一次 Prompt 注入扫描，结论写入 metadata 随文档一起上传
+                    if scanner is not None:
+                        stats['flagged'] = stats.get('flagged', 0) + scanner.tag_documents(docs)
+                except Exception as e:
+                    # 单个条目出错只跳过该条目，不影响同一文件中后续的条目
+                    print(f"❌ {source_id} 处理失败，已跳过: {e}")
+                    stats['failed_items'] = stats.get('failed_items', 0) + 1
+                    continue
+                for doc in docs:
+                    doc_type = doc['metadata'].get('type', 'unknown') if isinstance(doc['metadata'], dict) else 'unknown'
+                    type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
+                    yield doc
+                total_docs += len(docs)
+            
+            print(f"📊 {filename} 共生成 {total_docs} 个可检索文档")
+            
+        except json.JSONDecodeError as e:
+            print(f"❌ JSON解析错误 {filename}: {e}")
+        except Exception as e:
+            print(f"❌ 处理文件 {filename} 时出错: {e}")
+            traceback.print_exc()
+        stats['files'] = stats.get('files', 0) + 1
+        stats['documents'] = stats.get('documents', 0) + total_docs
+
+
+def load_json_files(directory='json_files', scanner=None) -> List[Dict]:
+    """
+    从指定目录加载JSON文件
+    支持多种格式：
+    1. CQA三元组格式 (context, question, answer) - 新增支持
+    2. concept格式 (原有格式)
+    3. content格式 (原有格式)
+    返回全部文档的列表（兼容旧接口）；大语料入库请直接使用 iter_json_documents 流式处理。
+    """
+    stats: Dict = {}
+    files = list(iter_json_documents(directory, stats, scanner))
+    
+    print(f"\n🎉 总共提取了 {len(files)} 个有效文档")
+    
+    # 统计不同类型的文档
+    if files:
+        print("\n📈 文档类型分布:")
+        for doc_type, count in stats['types'].items():
+            print(f"  - {doc_type}: {count}")
+
+    if stats.get('flagged'):
+        print(f"⚠️ {stats['flagged']} 个文档命中注入规则，检索时将被排除")
+    
+    return files
+
+
+STATUS_UPLOADED = "uploaded"
+STATUS_FAILED = "failed"
+STATUS_IN_FLIGHT = "in_flight"   # 已交给上传阶段、尚无结果；只存在于内存中，不写入日志与快照
+
+MANIFEST_VERSION = 2
+
+
+# 不参与内容哈希的 metadata 字段：source 默认由文件名与条目位置生成（如 "a.json_item3_qa"），
+# 注入扫描结论由规则推导而来。两者都会在内容不变时改变，计入哈希会让在文件中插入一个条目
+# 或调整规则后，之后的文档全部被当作新文档重新上传（向量库不支持删除，会产生重复文档）。
+UNSTABLE_METADATA_FIELDS = ("source", INJECTION_SCAN_FIELD)
+
+
+def _sha256_json(value: Any) -> str:
+    canonical = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def document_hash(doc: Dict) -> str:
+    """
+    文档内容哈希：正文与稳定 metadata 的规范化 JSON 的 SHA-256，不含 UNSTABLE_METADATA_FIELDS，
+    因此与文档在文件中的位置以及是否已做注入扫描无关。正文与其余 metadata 都相同的文档视为同一文档。
+    """
+    metadata = doc.get("metadata")
+    if isinstance(metadata, dict):
+        doc = {**doc, "metadata": {k: v for k, v in metadata.items() if k not in UNSTABLE_METADATA_FIELDS}}
+    return _sha256_json(doc)
+
+
+def legacy_document_hash(doc: Dict) -> str:
+    """清单版本 1 使用的哈希（整个文档，含 source 与注入扫描结论），仅用于迁移旧清单"""
+    return _sha256_json(doc)
+
+
+class IngestionManifest:
+    """按内容哈希记录每个文档的上传状态，线程安全"""
+
+    def __init__(self, path: str = None, database: str = None, base_url: str = None):
+        self.path = path if path is not None else config.INGEST_MANIFEST_PATH
+        self.journal_path = self.path + ".log"
+        self.database = database
+        self.base_url = base_url if base_url is not None else config.BASE_URL
+        # 内容哈希 -> {"status", "source", "attempts", "updated_at", ["error"]}
+        self.documents: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._journal = None
+
+    @classmethod
+    def load(cls, database: str, path: str = None, base_url: str = None) -> "IngestionManifest":
+        """加载快照并重放日志；清单属于其他数据库或上游地址时从空清单开始"""
+        manifest = cls(path, database, base_url)
+        if os.path.exists(manifest.path):
+            try:
+                with open(manifest.path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"入库清单 {manifest.path} 无法读取，将重新开始: {e}")
+                snapshot = {}
+            if snapshot.get("database") == database and snapshot.get("base_url") == manifest.base_url:
+                manifest.documents = snapshot.get("documents", {})
+            elif snapshot:
+                logger.warning(f"入库清单属于 {snapshot.get('database')}@{snapshot.get('base_url')}，已忽略")
+                manifest._discard_journal()
+        manifest._replay_journal()
+        return manifest
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue   # 崩溃时写了一半的最后一行
+                if record.get("database") == self.database and record.get("base_url") == self.base_url:
+                    self._apply(record)
+
+    def _discard_journal(self):
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def _apply(self, record: Dict):
+        for doc_hash, source in zip(record["hashes"], record.get("sources") or [None] * len(record["hashes"])):
+            entry = self.documents.setdefault(doc_hash, {"attempts": 0})
+            entry["status"] = record["status"]
+            entry["attempts"] = entry.get("attempts", 0) + 1
+            entry["updated_at"] = record["time"]
+            if source:
+                entry["source"] = source
+            if record.get("error"):
+                entry["error"] = record["error"]
+            else:
+                entry.pop("error", None)
+
+    def status(self, doc_hash: str) -> Optional[str]:
+        with self._lock:
+            entry = self.documents.get(doc_hash)
+            return entry["status"] if entry else None
+
+    def iter_pending(self, documents: Iterable[Dict], counts: Dict[str, int] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        逐个筛选需要上传的文档（清单中没有或状态为失败），内容相同的文档只保留一个。
+        产出的文档在清单中记为 in_flight，之后再遇到相同内容时直接跳过，去重不需要另外的集合；
+        内存占用只有清单本身（每个文档一条记录），不随本次读取的文档数额外增长。
+        上传阶段必须对每个产出的文档调用 mark()，否则该文档在本进程内不会再被产出。
+        :param counts: 可选，累计 seen / skipped（已上传而跳过）/ pending 数量
+        """
+        counts = counts if counts is not None else {}
+        for doc in documents:
+            doc_hash = document_hash(doc)
+            counts["seen"] = counts.get("seen", 0) + 1
+            status = self._claim(doc_hash, doc)
+            if status == STATUS_IN_FLIGHT:
+                continue
+            if status == STATUS_UPLOADED:
+                counts["skipped"] = counts.get("skipped", 0) + 1
+            else:
+                counts["pending"] = counts.get("pending", 0) + 1
+                yield doc_hash, doc
+
+    def _claim(self, doc_hash: str, doc: Dict) -> Optional[str]:
+        """
+        返回文档此前的状态；需要上传（无记录或失败）时把它记为 in_flight。
+        清单中没有该哈希时，旧版清单按 legacy_document_hash 记为已上传的记录会被沿用，
+        避免升级后整库重新上传；迁移结果在下次 compact() 时写入快照。
+        """
+        with self._lock:
+            entry = self.documents.get(doc_hash)
+            if entry is None:
+                legacy = self.documents.get(legacy_document_hash(doc))
+                if legacy is not None and legacy.get("status") == STATUS_UPLOADED:
+                    self.documents[doc_hash] = dict(legacy)
+                    return STATUS_UPLOADED
+                entry = self.documents[doc_hash] = {"attempts": 0}
+            status = entry.get("status")
+            if status not in (STATUS_UPLOADED, STATUS_IN_FLIGHT):
+                entry["status"] = STATUS_IN_FLIGHT
+            return status
+
+    def pending(self, documents: Iterable[Dict]) -> Tuple[List[Tuple[str, Dict]], int]:
+        """
+        iter_pending 的列表版本。
+        :return: ([(内容哈希, 文档), ...], 已上传而跳过的文档数)
+        """
+        counts: Dict[str, int] = {}
+        pending = list(self.iter_pending(documents, counts))
+        return pending, counts.get("skipped", 0)
+
+    def mark(self, hashes: List[str], status: str, sources: List[str] = None, error: str = None):
+        """记录一批文档的上传结果：先追加日志并落盘，再更新内存中的清单"""
+        record = {"database": self.database, "base_url": self.base_url, "status": status, "time": time.time(),
+                  "hashes": list(hashes), "sources": list(sources) if sources else None}
+        if error:
+            record["error"] = error[:200]
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._journal is None:
+                directory = os.path.dirname(os.path.abspath(self.journal_path))
+                os.makedirs(directory, exist_ok=True)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._apply(record)
+
+    def compact(self):
+        """把当前清单原子地写入快照，然后清空日志"""
+        with self._lock:
+            documents = {h: e for h, e in self.documents.items() if e.get("status") != STATUS_IN_FLIGHT}
+            snapshot = {"version": MANIFEST_VERSION, "database": self.database, "base_url": self.base_url,
+                        "updated_at": time.time(), "documents": documents}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            self._discard_journal()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for entry in self.documents.values():
+                counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+            return {"documents": len(self.documents), **counts}
+
+
+def document_size(doc: Dict) -> int:
+    """文档序列化后的字节数（与上传请求体中的大小一致）"""
+    return len(json.dumps(doc, ensure_ascii=False).encode("utf-8"))
+
+
+Batch = List[Tuple[str, Dict]]
+
+
+class AdaptiveUploader:
+    """
+    自适应批量上传。
+    - 批次按字节数切分（单个文档超过上限时独占一个批次），批次在有空闲并发时才从输入中取出
+    - 并发 AIMD：成功且延迟不超过目标时每个批次增加 1/并发数（约每轮 +1），
+      失败或超过目标延迟时减半；同一轮内的多次失败只减一次
+    - 批次字节数：失败或延迟超过目标两倍时减半，远低于目标时增加 25%
+    """
+
+    def __init__(self, upload: Callable[[Batch, int], int], batch_bytes: int = None,
+                 min_batch_bytes: int = None, max_batch_bytes: int = None, max_batch_docs: int = None,
+                 concurrency: int = None, min_concurrency: int = None, max_concurrency: int = None,
+                 target_latency: float = None, progress_interval: float = None):
+        """
+        :param upload: 上传一个批次的函数 upload(batch, batch_index)，返回成功上传的文档数（0 表示失败）
+        """
+        self.upload = upload
+        self.batch_bytes = batch_bytes if batch_bytes is not None else config.INGEST_BATCH_BYTES
+        self.min_batch_bytes = min_batch_bytes if min_batch_bytes is not None else config.INGEST_MIN_BATCH_BYTES
+        self.max_batch_bytes = max_batch_bytes if max_batch_bytes is not None else config.INGEST_MAX_BATCH_BYTES
+        self.max_batch_docs = max_batch_docs if max_batch_docs is not None else config.INGEST_MAX_BATCH_DOCS
+        self.min_concurrency = min_concurrency if min_concurrency is not None else config.INGEST_MIN_CONCURRENCY
+        self.max_concurrency = max_concurrency if max_concurrency is not None else config.INGEST_MAX_CONCURRENCY
+        self.concurrency = float(concurrency if concurrency is not None else config.INGEST_INITIAL_CONCURRENCY)
+        self.target_latency = target_latency if target_latency is not None else config.INGEST_TARGET_LATENCY
+        self.progress_interval = progress_interval if progress_interval is not None else config.INGEST_PROGRESS_INTERVAL
+        self._last_decrease = 0.0
+        self._last_report = 0.0
+        self.started_at = None
+        self.submitted = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.docs = 0
+        self.bytes = 0
+
+    def _batches(self, items: Iterable[Tuple[str, Dict]]) -> Iterator[Tuple[Batch, int]]:
+        """按当前的批次字节数切分；生成器惰性执行，每个批次使用取出时的字节上限"""
+        batch, size = [], 0
+        for doc_hash, doc in items:
+            doc_bytes = document_size(doc)
+            if batch and (size + doc_bytes > self.batch_bytes or len(batch) >= self.max_batch_docs):
+                yield batch, size
+                batch, size = [], 0
+            batch.append((doc_hash, doc))
+            size += doc_bytes
+        if batch:
+            yield batch, size
+
+    def _timed_upload(self, batch: Batch, batch_bytes: int, batch_index: int):
+        started = time.monotonic()
+        try:
+            uploaded = self.upload(batch, batch_index)
+        except Exception as e:
+            logger.error(f"批次 {batch_index + 1} 上传时发生异常: {e}")
+            uploaded = 0
+        return uploaded, len(batch), batch_bytes, time.monotonic() - started
+
+    def _on_done(self, uploaded: int, batch_bytes: int, latency: float):
+        now = time.monotonic()
+        self.batches += 1
+        if uploaded:
+            self.docs += uploaded
+            self.bytes += batch_bytes
+        failed = not uploaded
+        if failed:
+            self.failed_batches += 1
+
+        if failed or latency > self.target_latency:
+            # 一个延迟周期内只做一次乘性减小，避免同一轮的多个失败把并发连续减半
+            if now - self._last_decrease >= latency:
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self._last_decrease = now
+            if failed or latency > 2 * self.target_latency:
+                self.batch_bytes = max(self.min_batch_bytes, self.batch_bytes // 2)
+        else:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            if latency < self.target_latency / 2:
+                self.batch_bytes = min(self.max_batch_bytes, int(self.batch_bytes * 1.25))
+
+        if now - self._last_report >= self.progress_interval:
+            self._last_report = now
+            print(f"📈 {self.progress()}")
+
+    def progress(self) -> str:
+        elapsed = max(time.monotonic() - self.started_at, 1e-6) if self.started_at else 1e-6
+        return (f"已上传 {self.docs} 个文档 / {self.bytes / 1024 / 1024:.1f} MB，"
+                f"{self.docs / elapsed:.1f} docs/s，{self.bytes / 1024 / elapsed:.1f} KB/s，"
+                f"并发 {int(self.concurrency)}，批次上限 {self.batch_bytes // 1024} KB，失败批次 {self.failed_batches}")
+
+    def run(self, items: Iterable[Tuple[str, Dict]]) -> int:
+        """上传全部 (内容哈希, 文档)，返回成功上传的文档数"""
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        uploaded_before = self.docs
+        in_flight = set()
+
+        def drain(return_when):
+            nonlocal in_flight
+            done, in_flight = concurrent.futures.wait(in_flight, return_when=return_when)
+            for future in done:
+                uploaded, _, batch_bytes, latency = future.result()
+                self._on_done(uploaded, batch_bytes, latency)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for batch, batch_bytes in self._batches(items):
+                while len(in_flight) >= int(self.concurrency):
+                    drain(concurrent.futures.FIRST_COMPLETED)
+                in_flight.add(executor.submit(self._timed_upload, batch, batch_bytes, self.submitted))
+                self.submitted += 1
+            if in_flight:
+                drain(concurrent.futures.ALL_COMPLETED)
+        return self.docs - uploaded_before
+
+    def stats(self) -> Dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "docs": self.docs,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "docs_per_second": round(self.docs / elapsed, 1) if elapsed else 0.0,
+            "bytes_per_second": round(self.bytes / elapsed, 1) if elapsed else 0.0,
+            "concurrency": int(self.concurrency),
+            "batch_bytes": self.batch_bytes,
+        }
@@ -0,0 +1,126 @@
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List
+from config import config
+from data_processor import doc_key
+
+# ASCII 词：字母数字串，允许以 - _ . 连接（CVE-2021-44228、CWE-79、TLS1.3 作为整体保留）
+_ASCII_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+_CJK_RUN_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_SPLIT_RE = re.compile(r"[-_.]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    CJK 感知的分词：
+    - ASCII 技术词整体保留，连接符分隔的部分也单独作为词（"cve-2021-44228" -> 本身 + cve / 2021 / 44228）
+    - 连续的中文按字符二元组切分，单个汉字保留为一元组
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for match in _ASCII_TOKEN_RE.finditer(text):
+        token = match.group(0)
+        tokens.append(token)
+        parts = _SPLIT_RE.split(token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    for match in _CJK_RUN_RE.finditer(text):
+        run = match.group(0)
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引。文档按加入顺序编号，因此每个词的倒排表天然有序，
+    直接用 array 存储 (文档号 uint32, 词频 uint16)，比 dict/list 紧凑得多。线程安全。
+    """
+
+    def __init__(self, k1: float = None, b: float = None):
+        self.k1 = k1 if k1 is not None else config.BM25_K1
+        self.b = b if b is not None else config.BM25_B
+        self.documents: List[Dict] = []
+        self._keys = set()
+        self._doc_ids: Dict[str, array] = {}
+        self._term_freqs: Dict[str, array] = {}
+        self._doc_lengths = array('I')
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add_documents(self, documents: Iterable[Dict]) -> int:
+        """加入文档（按去重键跳过已存在的），返回实际新增数量"""
+        added = 0
+        with self._lock:
+            for doc in documents:
+                key = doc_key(doc)
+                if not key or key in self._keys:
+                    continue
+                text = doc.get("file") or doc.get("content") or ""
+                doc_id = len(self.documents)
+                counts: Dict[str, int] = {}
+                tokens = tokenize(text)
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, tf in counts.items():
+                    if token not in self._doc_ids:
+                        self._doc_ids[token] = array('I')
+                        self._term_freqs[token] = array('H')
+                    self._doc_ids[token].append(doc_id)
+                    self._term_freqs[token].append(min(tf, 65535))
+                self.documents.append(doc)
+                self._keys.add(key)
+                self._doc_lengths.append(len(tokens))
+                self._total_length += len(tokens)
+                added += 1
+        return added
+
+    def search(self, query: str, top_k: int = None) -> Dict:
+        """BM25 检索，返回格式与 APIClient.search 相同，每项附带 bm25 分数"""
+        top_k = top_k if top_k is not None else config.LEXICAL_TOP_K
+        with self._lock:
+            n_docs = len(self.documents)
+            if not n_docs:
+                return {"files": []}
+            avg_length = self._total_length / n_docs
+            scores: Dict[int, float] = {}
+            for token in set(tokenize(query)):
+                doc_ids = self._doc_ids.get(token)
+                if doc_ids is None:
+                    continue
+                df = len(doc_ids)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in zip(doc_ids, self._term_freqs[token]):
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            best = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+            return {"files": [{**self.documents[doc_id], "bm25": score} for doc_id, score in best]}
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], k: int = None, limit: int = None) -> List[Dict]:
+    """
+    倒数排名融合 (RRF)：score(d) = Σ 1 / (k + rank)。
+    同一文档在多个列表中出现时合并字段（保留向量检索的 score 与 BM25 的 bm25），并记录 rrf_score。
+    """
+    k = k if k is not None else config.RRF_K
+    fused: Dict[str, Dict] = {}
+    scores: Dict[str, float] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            key = doc_key(doc)
+            fused[key] = {**doc, **fused[key]} if key in fused else dict(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    if limit is not None:
+        ordered = ordered[:limit]
+    return [{**fused[key], "rrf_score": scores[key]} for key in ordered]
@@ -0,0 +1,221 @@
+"""
+进程内的本地向量索引，可替代远程向量库作为检索后端（config.RETRIEVAL_BACKEND = "local"）。
+
+- 向量以归一化 float32 矩阵保存，余弦相似度即一次矩阵乘法
+- 可选 int8 量化（逐行缩放），内存与磁盘占用降为 1/4
+- 可选 IVF 粗排：k-means 聚类后按簇连续存放，查询时只扫描最近的 nprobe 个簇
+- 以 .npy 持久化，加载时使用 mmap，启动几乎不耗时
+
+构建索引:
+    python local_index.py [--quantize] [--lists 64]
+"""
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from data_processor import merge_results
+from ingestion import load_json_files
+
+logger = logging.getLogger(__name__)
+
+Encoder = Callable[[List[str]], np.ndarray]
+
+_model_cache: Dict[str, object] = {}
+
+
+def sentence_transformer_encoder(model_name: str) -> Encoder:
+    """基于 sentence-transformers 的编码器，模型按名称缓存、首次使用时才加载"""
+    def encode(texts: List[str]) -> np.ndarray:
+        if model_name not in _model_cache:
+            from sentence_transformers import SentenceTransformer
+            _model_cache[model_name] = SentenceTransformer(model_name)
+        return _model_cache[model_name].encode(texts, batch_size=64, convert_to_numpy=True)
+    return encode
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _quantize(vectors: np.ndarray):
+    """逐行对称 int8 量化，返回 (int8 矩阵, 每行缩放系数)"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """球面 k-means（以内积为相似度），返回归一化的簇中心"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for k in range(n_lists):
+            members = vectors[assignments == k]
+            if len(members):
+                centroids[k] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class LocalVectorIndex:
+    """与 APIClient.search 接口一致的本地向量检索"""
+
+    def __init__(self, documents: List[Dict], embeddings: np.ndarray, scales: np.ndarray = None,
+                 centroids: np.ndarray = None, list_offsets: np.ndarray = None,
+                 model_name: str = None, encoder: Encoder = None):
+        self.documents = documents
+        self.embeddings = embeddings          # float32 或 int8 (量化时)
+        self.scales = scales                  # int8 量化的逐行缩放系数
+        self.centroids = centroids            # IVF 簇中心
+        self.list_offsets = list_offsets      # 第 k 簇的行范围为 [offsets[k], offsets[k+1])
+        self.model_name = model_name or config.LOCAL_EMBEDDING_MODEL
+        self.encoder = encoder or sentence_transformer_encoder(self.model_name)
+        self.nprobe = config.LOCAL_INDEX_NPROBE
+
+    @classmethod
+    def build(cls, documents: List[Dict], encoder: Encoder = None, model_name: str = None,
+              quantize: bool = False, n_lists: int = 0) -> "LocalVectorIndex":
+        """
+        从文档列表构建索引。
+        :param documents: {"file": 文本, "metadata": {...}} 列表，与上传到向量库的格式相同
+        :param quantize: 是否以 int8 存储向量
+        :param n_lists: IVF 簇数，0 表示不建粗排索引（小语料直接全量扫描更快）
+        """
+        model_name = model_name or config.LOCAL_EMBEDDING_MODEL
+        encoder = encoder or sentence_transformer_encoder(model_name)
+        texts = [doc.get("file", "") for doc in documents]
+        vectors = _normalize(encoder(texts))
+
+        centroids = list_offsets = None
+        if n_lists and n_lists < len(documents):
+            centroids = _kmeans(vectors, n_lists)
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            # 按簇重新排列，使每个簇在矩阵中连续，查询时按切片读取
+            order = np.argsort(assignments, kind="stable")
+            vectors = vectors[order]
+            documents = [documents[i] for i in order]
+            counts = np.bincount(assignments, minlength=n_lists)
+            list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        scales = None
+        if quantize:
+            vectors, scales = _quantize(vectors)
+
+        return cls(documents, vectors, scales, centroids, list_offsets, model_name, encoder)
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "embeddings.npy"), self.embeddings)
+        if self.scales is not None:
+            np.save(os.path.join(directory, "scales.npy"), self.scales)
+        if self.centroids is not None:
+            np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+            np.save(os.path.join(directory, "list_offsets.npy"), self.list_offsets)
+        with open(os.path.join(directory, "documents.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.documents, f, ensure_ascii=False)
+        with open(os.path.join(directory, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"model_name": self.model_name, "count": len(self.documents)}, f)
+
+    @classmethod
+    def load(cls, directory: str, encoder: Encoder = None) -> "LocalVectorIndex":
+        """加载索引；向量矩阵以 mmap 方式打开，由操作系统按需换页"""
+        def optional(name):
+            path = os.path.join(directory, name)
+            return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+        with open(os.path.join(directory, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, "documents.json"), 'r', encoding='utf-8') as f:
+            documents = json.load(f)
+        return cls(
+            documents,
+            np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r"),
+            optional("scales.npy"),
+            optional("centroids.npy"),
+            optional("list_offsets.npy"),
+            meta.get("model_name"),
+            encoder,
+        )
+
+    def _candidate_rows(self, query_vector: np.ndarray) -> Optional[np.ndarray]:
+        """IVF 粗排：返回最近 nprobe 个簇的行号；未建 IVF 时返回 None 表示全量扫描"""
+        if self.centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+        return np.concatenate([
+            np.arange(self.list_offsets[k], self.list_offsets[k + 1]) for k in nearest
+        ])
+
+    def _score(self, query_vector: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        matrix = self.embeddings if rows is None else self.embeddings[rows]
+        if self.scales is None:
+            return matrix @ query_vector
+        scales = self.scales if rows is None else self.scales[rows]
+        return (matrix.astype(np.float32) @ query_vector) * scales
+
+    def search(self, db_name: str, query: str, top_k: int = None, expr: str = None) -> Dict:
+        """
+        与 APIClient.search 相同的签名与返回格式 ({"files": [...]}，每项附带 score)。
+        db_name 仅为兼容而保留；本地索引不支持 expr 过滤。
+        """
+        return self.search_many(db_name, [query], top_k=top_k, expr=expr)["results"][0]
+
+    def search_many(self, db_name: str, queries: List[str], top_k: int = None, expr: str = None) -> Dict:
+        """批量检索：所有查询一次编码，返回格式与 APIClient.search_many 相同"""
+        if expr:
+            raise ValueError("本地向量索引不支持 expr 过滤")
+        final_top_k = top_k if top_k is not None else config.TOP_K
+        if not self.documents or not queries:
+            results = [{"files": []} for _ in queries]
+            return {"results": results, "merged": []}
+
+        query_vectors = _normalize(self.encoder(list(queries)))
+        results = []
+        for query_vector in query_vectors:
+            rows = self._candidate_rows(query_vector)
+            scores = self._score(query_vector, rows)
+
+            k = min(final_top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            doc_ids = top if rows is None else rows[top]
+            results.append({"files": [
+                {**self.documents[i], "score": float(scores[j])} for j, i in zip(top, doc_ids)
+            ]})
+        return {"results": results, "merged": merge_results([r["files"] for r in results])}
+
+
+def load_corpus(directory: str = 'json_files', extra_files: List[str] = None) -> List[Dict]:
+    """构建索引用的语料：json_files 目录（与上传逻辑相同的展开方式）加上已处理好的语料文件"""
+    documents = load_json_files(directory)
+    for path in extra_files or []:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                documents.extend(json.load(f))
+    return documents
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="构建本地向量索引")
+    parser.add_argument("--quantize", action="store_true", help="以 int8 存储向量")
+    parser.add_argument("--lists", type=int, default=0, help="IVF 簇数（0 表示全量扫描）")
+    parser.add_argument("--output", default=config.LOCAL_INDEX_DIR)
+    args = parser.parse_args()
+
+    corpus = load_corpus(extra_files=["processed_qa_data.json"])
+    print(f"📦 共 {len(corpus)} 个文档，开始编码...")
+    index = LocalVectorIndex.build(corpus, quantize=args.quantize, n_lists=args.lists)
+    index.save(args.output)
+    print(f"✅ 本地索引已保存到 {args.output}")
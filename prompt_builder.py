@@ -1,4 +1,7 @@
+import threading
 from typing import List, Dict
+from config import config
+from data_processor import get_token_counter
 
 def detect_personality(user_input: str) -> str:
     """基于用户输入识别期望的人格类型"""
@@ -13,12 +16,12 @@ def detect_personality(user_input: str) -> str:
         return "GENERAL"
     
     # 基于关键词匹配
-    for personality_type, config in [
+    for personality_type, personality in [
         ("TEACHER", PersonalityConfig.TEACHER),
         ("RESEARCHER", PersonalityConfig.RESEARCHER),
         ("GENERAL", PersonalityConfig.GENERAL)
     ]:
-        if any(keyword in user_input for keyword in config["keywords"]):
+        if any(keyword in user_input for keyword in personality["keywords"]):
             return personality_type
     
     # 默认返回通用模式
@@ -35,22 +38,18 @@ def build_chat_prompt(
     组合系统 Prompt + 历史对话 + 当前用户输入 + 上下文 + 引用
     :param history: 历史对话 [{"role": "user"/"assistant", "content": "..."}]
     :param user_input: 当前用户问题
-    :param context: 检索到的相关上下文
-    :param citations: 引用列表
+    :param context: 检索到的相关上下文（由 cited_context 生成，每篇文档以 [编号] 开头）
+    :param citations: 引用列表（只返回给前端，正文不会在 Prompt 中重复出现）
     :return: 最终发送给 LLM 的 Prompt（包含对话历史）
     """
-    # 只取最近的若干条历史，避免过长
-    truncated = history[-10:] if len(history) > 10 else history
+    # 只取最近的若干条历史，避免过长（InjectionScanner 只检测这一窗口）
+    window = config.PROMPT_HISTORY_MESSAGES
+    truncated = history[-window:] if len(history) > window else history
     history_text = "\n".join([
         f"{'【用户】' if m['role']=='user' else '【助手】'}{m['content']}"
         for m in truncated
     ])
 
-    citation_text = "\n".join([
-        f"[{c['id']}] {c['snippet']} (来源: {c['link']})"
-        for c in citations
-    ])
-
     from config import PersonalityConfig
     personalities = {
         "TEACHER": PersonalityConfig.TEACHER,
@@ -71,7 +70,33 @@ def build_chat_prompt(
 
 【参考上下文】
 {context}
+{"（引用上下文内容时请在句末标注对应的 [编号]）" if citations else ""}
 
 请回答：
 """
     return final_prompt
+
+
+class PromptStats:
+    """Prompt 体积统计：已构建的 Prompt 数量与平均 token 数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+
+    def record(self, prompt: str):
+        tokens = get_token_counter()(prompt)
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens += tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, tokens)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "prompts": self.prompts,
+                "avg_prompt_tokens": round(self.prompt_tokens / self.prompts, 1) if self.prompts else 0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+            }
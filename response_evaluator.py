@@ -1,13 +1,70 @@
 # response_evaluator.py
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 from api_client import APIClient
+from config import config
+import concurrent.futures
 import json
 import logging
-import re
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-def evaluate_response(question: str, context: str, response: str, max_retries: int = 2) -> Dict[str, any]:
+_shared_client: Optional[APIClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_shared_client() -> APIClient:
+    """评估默认使用的共享客户端（惰性创建），避免每次评估都新建客户端与连接"""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = APIClient()
+        return _shared_client
+
+
+_json_decoder = json.JSONDecoder()
+
+
+def extract_json(text: str, expected_type: type = dict):
+    """
+    从模型输出中提取第一个完整的 JSON 值（对象或数组）。
+    从每个候选起始括号处用 raw_decode 解析，解析到值结束即停止，
+    不会像贪婪正则那样把说明文字或多个对象之间的内容一并吞进去。
+    """
+    if not isinstance(text, str):
+        raise TypeError(f"模型输出不是字符串: {type(text).__name__}")
+    opener = "[" if expected_type is list else "{"
+    start = text.find(opener)
+    while start != -1:
+        try:
+            value, _ = _json_decoder.raw_decode(text, start)
+            if isinstance(value, expected_type):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find(opener, start + 1)
+    return None
+
+
+def _extract_json_objects(text: str) -> List[Dict]:
+    """依次提取文本中所有顶层 JSON 对象（模型没有输出数组、而是逐个输出对象时使用）"""
+    objects = []
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, end = _json_decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            start = text.find("{", start + 1)
+            continue
+        if isinstance(value, dict):
+            objects.append(value)
+        start = text.find("{", end)
+    return objects
+
+
+def evaluate_response(question: str, context: str, response: str, max_retries: int = 2,
+                      client: Optional[APIClient] = None) -> Dict[str, any]:
     """
     评估模型回答的质量，并提供优化建议
     
@@ -16,13 +73,14 @@ def evaluate_response(question: str, context: str, response: str, max_retries: i
         context: 检索到的上下文
         response: 模型生成的回答
         max_retries: 最大重试次数
+        client: 调用对话接口的客户端，默认使用共享客户端
         
     Returns:
         包含评分和建议的字典
     """
     evaluator_prompt = _build_evaluation_prompt(question, context, response)
     
-    client = APIClient()
+    client = client or get_shared_client()
     
     # 尝试获取有效的JSON响应
     for attempt in range(max_retries + 1):
@@ -30,14 +88,11 @@ def evaluate_response(question: str, context: str, response: str, max_retries: i
             evaluation_result = client.dialogue(evaluator_prompt)
             logger.info(f"Evaluation attempt {attempt + 1}: Raw response: {evaluation_result}")
             
-            # 尝试从响应中提取JSON
-            json_match = re.search(r'\{[\s\S]*\}', evaluation_result)
-            if json_match:
-                json_str = json_match.group(0)
-                return json.loads(json_str)
-            
-            # 如果找不到JSON，尝试直接解析整个响应
-            return json.loads(evaluation_result)
+            # 从响应中提取第一个完整的JSON对象
+            evaluation = extract_json(evaluation_result, dict)
+            if evaluation is None:
+                raise json.JSONDecodeError("响应中没有JSON对象", evaluation_result, 0)
+            return evaluation
             
         except (json.JSONDecodeError, TypeError) as e:
             logger.warning(f"JSON解析失败 (attempt {attempt + 1}): {str(e)}")
@@ -53,24 +108,14 @@ def evaluate_response(question: str, context: str, response: str, max_retries: i
     
     return _create_default_evaluation()
 
-def _build_evaluation_prompt(question: str, context: str, response: str, 
-                            additional_instruction: str = "") -> str:
-    """构建评估提示词"""
-    return f"""
-你是一个专业的AI回答质量评估专家。请根据以下标准评估一个AI助手对用户问题的回答质量：
-
-评估标准：
+_EVALUATION_CRITERIA = """评估标准：
 1. 准确性（30分）：回答是否准确无误，是否基于提供的上下文，是否有事实错误
 2. 相关性（25分）：回答是否紧扣用户问题，是否包含无关信息
 3. 完整性（20分）：回答是否全面覆盖问题要点，是否遗漏重要信息
 4. 清晰度（15分）：回答是否逻辑清晰，表达是否简洁明了
-5. 格式与引用（10分）：是否正确标注引用，格式是否恰当
-
-{additional_instruction}
+5. 格式与引用（10分）：是否正确标注引用，格式是否恰当"""
 
-请严格按照以下JSON Schema格式输出评估结果：
-{{
-    "accuracy_score": 0-30,
+_EVALUATION_FIELDS = """    "accuracy_score": 0-30,
     "relevance_score": 0-25,
     "completeness_score": 0-20,
     "clarity_score": 0-15,
@@ -79,7 +124,21 @@ def _build_evaluation_prompt(question: str, context: str, response: str,
     "strengths": ["优点1", "优点2", ...],
     "weaknesses": ["缺点1", "缺点2", ...],
     "suggestions": ["改进建议1", "改进建议2", ...],
-    "optimized_prompt": "优化后的prompt建议（如果需要）"
+    "optimized_prompt": "优化后的prompt建议（如果需要）\""""
+
+def _build_evaluation_prompt(question: str, context: str, response: str, 
+                            additional_instruction: str = "") -> str:
+    """构建评估提示词"""
+    return f"""
+你是一个专业的AI回答质量评估专家。请根据以下标准评估一个AI助手对用户问题的回答质量：
+
+{_EVALUATION_CRITERIA}
+
+{additional_instruction}
+
+请严格按照以下JSON Schema格式输出评估结果：
+{{
+{_EVALUATION_FIELDS}
 }}
 
 【用户问题】
@@ -109,6 +168,195 @@ def _create_default_evaluation() -> Dict[str, any]:
         "optimized_prompt": ""
     }
 
+# 各项评分的上限，批量评估时据此校验每一项结果
+SCORE_LIMITS = {
+    "accuracy_score": 30,
+    "relevance_score": 25,
+    "completeness_score": 20,
+    "clarity_score": 15,
+    "format_score": 10,
+    "total_score": 100,
+}
+LIST_FIELDS = ("strengths", "weaknesses", "suggestions")
+
+_STRICT_JSON_INSTRUCTION = "请务必严格按照JSON格式输出，不要包含任何额外说明或文本。"
+
+
+def validate_evaluation(item) -> Optional[Dict[str, any]]:
+    """校验并规范化单项评估结果：评分必须是范围内的数字，列表字段缺失时补空；不合格返回 None"""
+    if not isinstance(item, dict):
+        return None
+    result = {}
+    for key, limit in SCORE_LIMITS.items():
+        value = item.get(key)
+        if isinstance(value, str):
+            try:
+                value = float(value.strip())
+            except ValueError:
+                return None
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= limit:
+            return None
+        result[key] = int(value) if float(value).is_integer() else value
+    for key in LIST_FIELDS:
+        value = item.get(key) or []
+        if isinstance(value, str):
+            value = [value]
+        if not isinstance(value, list):
+            return None
+        result[key] = [str(v) for v in value]
+    optimized_prompt = item.get("optimized_prompt") or ""
+    result["optimized_prompt"] = optimized_prompt if isinstance(optimized_prompt, str) else json.dumps(
+        optimized_prompt, ensure_ascii=False)
+    return result
+
+
+def _build_batch_evaluation_prompt(items: Sequence[Tuple[str, str, str]],
+                                   additional_instruction: str = "") -> str:
+    """构建批量评估提示词：多组 (问题, 上下文, 回答) 放在同一个 Prompt 中，要求输出 JSON 数组"""
+    groups = "\n\n".join(
+        f"""【第 {i} 组】
+【用户问题】
+{question}
+
+【参考上下文】
+{context}
+
+【AI回答】
+{response}"""
+        for i, (question, context, response) in enumerate(items, 1)
+    )
+    return f"""
+你是一个专业的AI回答质量评估专家。下面共有 {len(items)} 组用户问题与AI助手的回答，请根据以下标准分别评估每一组的回答质量：
+
+{_EVALUATION_CRITERIA}
+
+{additional_instruction}
+
+请严格按照以下格式输出一个JSON数组，每组对应一个元素，用 index 标明组号（1 到 {len(items)}）：
+[
+  {{
+    "index": 组号,
+{_EVALUATION_FIELDS}
+  }},
+  ...
+]
+
+{groups}
+
+请只输出JSON数组，不要包含任何其他说明：
+"""
+
+
+def _parse_batch_evaluation(text: str, count: int) -> Dict[int, Dict[str, any]]:
+    """解析批量评估输出，返回 {组号(从 0 开始): 校验通过的结果}；缺失或不合格的组不出现在结果中"""
+    try:
+        items = extract_json(text, list)
+    except TypeError:
+        return {}
+    if not items or not all(isinstance(item, dict) for item in items):
+        # 没有输出数组（找到的可能只是某个对象内部的列表字段），退回逐个提取对象
+        items = _extract_json_objects(text)
+
+    parsed = {}
+    for position, item in enumerate(items):
+        index = item.get("index")
+        if isinstance(index, str) and index.strip().isdigit():
+            index = int(index)
+        if isinstance(index, bool) or not isinstance(index, int) or not 1 <= index <= count:
+            # 没有合法组号时，只有在数量一致的情况下才按位置对应
+            if len(items) != count:
+                continue
+            index = position + 1
+        evaluation = validate_evaluation(item)
+        if evaluation is not None and index - 1 not in parsed:
+            parsed[index - 1] = evaluation
+    return parsed
+
+
+class RateLimiter:
+    """按固定速率放行调用（每秒 rate 次），多线程共享；rate <= 0 表示不限速"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def evaluate_batch(items: Sequence[Tuple[str, str, str]], max_retries: int = 2,
+                   client: Optional[APIClient] = None,
+                   rate_limiter: Optional[RateLimiter] = None) -> List[Dict[str, any]]:
+    """
+    在一次对话调用中评估多组回答。
+    每一项单独校验，重试时只把失败的项重新发送；重试耗尽后仍失败的项返回默认评估结果。
+
+    Args:
+        items: (问题, 上下文, 回答) 列表
+        max_retries: 失败项的最大重试次数
+        client: 调用对话接口的客户端，默认使用共享客户端
+        rate_limiter: 可选的调用限速器
+
+    Returns:
+        与 items 顺序一致的评估结果列表
+    """
+    client = client or get_shared_client()
+    results: List[Optional[Dict]] = [None] * len(items)
+    pending = list(range(len(items)))
+    instruction = ""
+
+    for attempt in range(max_retries + 1):
+        if not pending:
+            break
+        prompt = _build_batch_evaluation_prompt([items[i] for i in pending], instruction)
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            raw = client.dialogue(prompt, max_tokens=max(1024, config.EVALUATION_ITEM_MAX_TOKENS * len(pending)))
+            logger.info(f"Batch evaluation attempt {attempt + 1}: {len(pending)} items, raw response: {raw}")
+        except Exception as e:
+            logger.warning(f"批量评估调用失败 (attempt {attempt + 1}): {str(e)}")
+            continue
+
+        parsed = _parse_batch_evaluation(raw, len(pending))
+        for position, evaluation in parsed.items():
+            results[pending[position]] = evaluation
+        pending = [i for i in pending if results[i] is None]
+        if pending:
+            logger.warning(f"批量评估有 {len(pending)} 项解析失败 (attempt {attempt + 1})")
+            instruction = _STRICT_JSON_INSTRUCTION
+
+    return [result if result is not None else _create_default_evaluation() for result in results]
+
+
+def evaluate_responses(items: Sequence[Tuple[str, str, str]], batch_size: int = None,
+                       concurrency: int = None, rate_limit: float = None, max_retries: int = 2,
+                       client: Optional[APIClient] = None) -> List[Dict[str, any]]:
+    """
+    批量评估大量回答（离线质量评估使用）：按 batch_size 分批，各批在线程池中并发执行，
+    所有对话调用共用一个限速器。
+
+    Returns:
+        与 items 顺序一致的评估结果列表
+    """
+    batch_size = max(1, batch_size if batch_size is not None else config.EVALUATION_BATCH_SIZE)
+    concurrency = max(1, concurrency if concurrency is not None else config.EVALUATION_BATCH_CONCURRENCY)
+    rate_limiter = RateLimiter(rate_limit if rate_limit is not None else config.EVALUATION_RATE_LIMIT)
+    client = client or get_shared_client()
+
+    batches = [list(items[i:i + batch_size]) for i in range(0, len(items), batch_size)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(evaluate_batch, batch, max_retries, client, rate_limiter) for batch in batches]
+        return [evaluation for future in futures for evaluation in future.result()]
+
 def format_evaluation_report(evaluation: Dict[str, any]) -> str:
     """
     格式化评估报告，生成易于阅读的文本
@@ -151,7 +399,8 @@ def format_evaluation_report(evaluation: Dict[str, any]) -> str:
     
     return report
 
-def integrate_with_rag_flow(original_response: str, user_input: str, context: str) -> Tuple[str, str]:
+def integrate_with_rag_flow(original_response: str, user_input: str, context: str,
+                            client: Optional[APIClient] = None) -> Tuple[str, str]:
     """
     与RAG流程集成，评估回答质量并生成报告
     
@@ -159,14 +408,41 @@ def integrate_with_rag_flow(original_response: str, user_input: str, context: st
         original_response: RAG流程生成的原始回答
         user_input: 用户原始输入
         context: 检索到的上下文
+        client: 调用对话接口的客户端，默认使用共享客户端
         
     Returns:
         (原始回答, 评估报告)
     """
     # 评估回答质量
-    evaluation = evaluate_response(user_input, context, original_response)
+    evaluation = evaluate_response(user_input, context, original_response, client=client)
     
     # 生成评估报告
     report = format_evaluation_report(evaluation)
     
-    return original_response, report
\ No newline at end of file
+    return original_response, report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="批量评估回答质量")
+    parser.add_argument("input", help="JSON 文件：[{\"question\": ..., \"context\": ..., \"response\": ...}, ...]")
+    parser.add_argument("--output", default="evaluations.json")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument("--rate-limit", type=float, default=None, help="每秒最多的对话调用次数")
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    triples = [(r.get("question", ""), r.get("context", ""), r.get("response", "")) for r in records]
+
+    started = time.time()
+    evaluations = evaluate_responses(triples, batch_size=args.batch_size, concurrency=args.concurrency,
+                                     rate_limit=args.rate_limit)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(evaluations, f, ensure_ascii=False, indent=2)
+
+    average = sum(e["total_score"] for e in evaluations) / len(evaluations) if evaluations else 0
+    print(f"✅ 已评估 {len(evaluations)} 个回答，用时 {time.time() - started:.1f}s，平均分 {average:.1f}")
+    print(f"📁 结果已保存到 {args.output}")
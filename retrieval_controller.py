@@ -0,0 +1,61 @@
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from config import config
+
+# 检索路径
+PATH_EARLY_EXIT = "early_exit"   # 第一阶段证据充分，跳过草稿生成与第二次检索
+PATH_TWO_PHASE = "two_phase"     # 完整的两阶段检索
+PATH_NO_DOCS = "no_docs"         # 第一阶段没有检索到文档
+
+
+def doc_score(doc: Dict) -> Optional[float]:
+    """
+    读取检索结果中的相似度分数（越大越相似）。
+    兼容 score / similarity 字段；只有 distance 时按余弦距离换算为相似度。
+    """
+    for field in ("score", "similarity"):
+        value = doc.get(field)
+        if isinstance(value, (int, float)):
+            return float(value)
+    distance = doc.get("distance")
+    if isinstance(distance, (int, float)):
+        return 1.0 - float(distance)
+    return None
+
+
+class RetrievalController:
+    """
+    基于第一阶段检索分数的提前退出控制器。
+    当最相关文档的分数足够高、且与次相关文档拉开足够差距（说明命中明确）时，
+    直接用第一阶段的文档生成最终回答，省掉一次 LLM 生成和一次检索。
+    """
+
+    def __init__(self, min_score: float = None, min_margin: float = None, enabled: bool = None):
+        self.enabled = enabled if enabled is not None else config.EARLY_EXIT_ENABLED
+        self.min_score = min_score if min_score is not None else config.EARLY_EXIT_MIN_SCORE
+        self.min_margin = min_margin if min_margin is not None else config.EARLY_EXIT_MIN_MARGIN
+        self._lock = threading.Lock()
+        self.paths = Counter()
+
+    def decide(self, docs: List[Dict]) -> Tuple[str, Optional[float]]:
+        """返回 (检索路径, 第一阶段最高分)，并计入路径统计"""
+        if not docs:
+            path, top_score = PATH_NO_DOCS, None
+        else:
+            scores = sorted((s for s in map(doc_score, docs) if s is not None), reverse=True)
+            top_score = scores[0] if scores else None
+            margin = scores[0] - scores[1] if len(scores) > 1 else scores[0] if scores else 0.0
+            if (self.enabled and top_score is not None
+                    and top_score >= self.min_score and margin >= self.min_margin):
+                path = PATH_EARLY_EXIT
+            else:
+                path = PATH_TWO_PHASE
+
+        with self._lock:
+            self.paths[path] += 1
+        return path, top_score
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.paths)
@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from config import config
+
+
+class SearchCache:
+    """
+    APIClient.search 的结果缓存：容量受限的 LRU + TTL。
+    键为 (db_name, query, top_k, metric_type, expr)，第一个元素必须是数据库名，
+    以便在该库写入新文件后按库失效。线程安全。
+    """
+
+    def __init__(self, maxsize: int = None, ttl: float = None):
+        self.maxsize = maxsize if maxsize is not None else config.SEARCH_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else config.SEARCH_CACHE_TTL
+        self._data: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        """返回未过期的缓存值，否则返回 None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Tuple[Hashable, ...], value: Any):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, db_name: str = None):
+        """清除指定数据库（默认全部）的缓存结果"""
+        with self._lock:
+            if db_name is None:
+                self._data.clear()
+                return
+            for key in [k for k in self._data if k[0] == db_name]:
+                del self._data[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,103 @@
+"""
+本地模拟上游服务（向量库 + /dialogue），用于在没有真实后端时联调 app.py。
+
+用法:
+    python stub_upstream.py            # 默认监听 9002 端口
+    set VECTOR_DB_BASE_URL=http://127.0.0.1:9002/api
+    python app.py
+
+/dialogue 在请求体带 "stream": true 时以 SSE 分块返回，否则返回普通 JSON。
+STUB_DELAY 环境变量控制每次调用（以及每个流式分块）的模拟延迟（秒）。
+"""
+import json
+import os
+import time
+
+from flask import Flask, request, jsonify, Response
+
+app = Flask(__name__)
+
+STUB_DELAY = float(os.getenv("STUB_DELAY", "0.05"))
+STUB_PORT = int(os.getenv("STUB_PORT", "9002"))
+CORPUS_FILE = "processed_qa_data.json"
+
+# 内存中的"向量库"：db_name -> 文档列表
+databases = {}
+
+
+def _load_corpus():
+    if not os.path.exists(CORPUS_FILE):
+        return []
+    with open(CORPUS_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _overlap_score(query: str, text: str) -> float:
+    """以字符重叠率模拟相似度分数"""
+    q = set(query)
+    if not q:
+        return 0.0
+    return len(q & set(text)) / len(q)
+
+
+@app.route('/api/databases/<db>', methods=['GET'])
+def get_database(db):
+    if db not in databases:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"database_name": db, "count": len(databases[db])})
+
+
+@app.route('/api/databases', methods=['POST'])
+def create_database():
+    data = request.get_json(silent=True) or {}
+    databases.setdefault(data.get("database_name"), [])
+    return jsonify({"status": "ok"})
+
+
+@app.route('/api/databases/<db>/files', methods=['POST'])
+def upload_files(db):
+    data = request.get_json(silent=True) or {}
+    time.sleep(STUB_DELAY)
+    databases.setdefault(db, []).extend(data.get("files", []))
+    return jsonify({"status": "ok", "count": len(data.get("files", []))})
+
+
+@app.route('/api/databases/<db>/search', methods=['POST'])
+def search(db):
+    data = request.get_json(silent=True) or {}
+    time.sleep(STUB_DELAY)
+    query = data.get("query", "")
+    top_k = int(data.get("top_k", 3))
+    docs = databases.get(db) or _load_corpus()
+    scored = sorted(
+        ({**doc, "score": _overlap_score(query, doc.get("file", ""))} for doc in docs),
+        key=lambda d: d["score"], reverse=True
+    )
+    return jsonify({"files": scored[:top_k]})
+
+
+@app.route('/api/dialogue', methods=['POST'])
+def dialogue():
+    data = request.get_json(silent=True) or {}
+    user_input = data.get("user_input", "")
+    if "分类 (仅回答" in user_input:
+        time.sleep(STUB_DELAY)
+        return jsonify({"response": "benign"})
+
+    answer = f"这是针对问题的模拟回答（Prompt 长度 {len(user_input)} 字符）。网络安全需要纵深防御。"
+    if not data.get("stream"):
+        time.sleep(STUB_DELAY * 4)
+        return jsonify({"response": answer})
+
+    def generate():
+        for i in range(0, len(answer), 4):
+            time.sleep(STUB_DELAY)
+            yield f"data: {json.dumps({'response': answer[i:i + 4]}, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return Response(generate(), mimetype='text/event-stream')
+
+
+if __name__ == '__main__':
+    print(f"🧪 模拟上游服务已启动: http://127.0.0.1:{STUB_PORT}/api")
+    app.run(host='127.0.0.1', port=STUB_PORT, threaded=True)
@@ -0,0 +1,10 @@
+import logging
+import os
+import sys
+
+# 模块都在仓库根目录下，直接以顶层模块导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app 在导入时用 basicConfig 把日志写入 app_security.log（也是意图分类器的训练数据）；
+# 先给根 logger 配置处理器，使其成为空操作，测试不会污染该日志
+logging.basicConfig(level=logging.INFO, handlers=[logging.NullHandler()])
@@ -0,0 +1,62 @@
+import time
+
+from answer_cache import AnswerCache, normalize_question
+
+
+def test_normalize_drops_filler_and_punctuation():
+    assert normalize_question("什么是SQL注入？") == normalize_question("SQL注入是什么")
+    assert normalize_question("ＸＳＳ 攻击的原理吗") == "xss攻击的原理"
+
+
+def test_normalize_keeps_particles_inside_words():
+    assert normalize_question("吗啡是什么") == "吗啡"
+
+
+def test_exact_hit_after_normalization():
+    cache = AnswerCache(max_entries=10, max_bytes=1 << 20, ttl=60)
+    cache.put("什么是SQL注入？", "default", "answer")
+    assert cache.get("SQL注入是什么", "default") == "answer"
+    assert cache.get("SQL注入是什么", "other") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_near_miss_questions_do_not_share_answers():
+    cache = AnswerCache(max_entries=10, max_bytes=1 << 20, ttl=60)
+    cache.put("什么是非对称加密", "default", "asymmetric")
+    cache.put("CVE-2021-44228 是什么", "default", "log4shell")
+    cache.put("防火墙能防御什么", "default", "can")
+    assert cache.get("什么是对称加密", "default") is None
+    assert cache.get("CVE-2021-44229 是什么", "default") is None
+    assert cache.get("防火墙不能防御什么", "default") is None
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = AnswerCache(max_entries=2, max_bytes=1 << 20, ttl=60)
+    cache.put("q1", "p", "a1")
+    cache.put("q2", "p", "a2")
+    cache.get("q1", "p")
+    cache.put("q3", "p", "a3")
+    assert cache.get("q2", "p") is None
+    assert cache.get("q1", "p") == "a1"
+
+    small = AnswerCache(max_entries=100, max_bytes=700, ttl=60)
+    small.put("q1", "p", "x" * 200)
+    small.put("q2", "p", "y" * 200)
+    small.put("q3", "p", "z" * 200)
+    assert small.stats()["bytes"] <= 700
+    assert small.get("q1", "p") is None
+
+
+def test_expired_entries_miss():
+    cache = AnswerCache(max_entries=10, max_bytes=1 << 20, ttl=0.01)
+    cache.put("q", "p", "a")
+    time.sleep(0.02)
+    assert cache.get("q", "p") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_technical_symbols_keep_questions_apart():
+    keys = {normalize_question(q) for q in ["什么是C++", "什么是C#", "什么是C", "TLS1.3 是什么", "TLS13 是什么"]}
+    assert len(keys) == 5
+    assert normalize_question("什么是TCP/IP？") == normalize_question("TCP/IP 是什么。") == "tcp/ip"
+    assert normalize_question("What is XSS.") == normalize_question("what is xss?")
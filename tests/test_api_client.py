@@ -0,0 +1,98 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+import api_client
+from api_client import APIClient, APIError, CircuitOpenError
+from hedging import HedgePolicy, hedged_call
+
+
+class _Response:
+    def __init__(self, data):
+        self._data = data
+
+    def json(self):
+        return self._data
+
+
+def _client(monkeypatch, outcomes):
+    """APIClient whose _post replays outcomes (exceptions are raised)"""
+    client = APIClient()
+    client.search_cache = None
+    calls = []
+
+    def fake_post(endpoint, url, payload, stream=False):
+        calls.append(endpoint)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return _Response(outcome)
+
+    monkeypatch.setattr(client, "_post", fake_post)
+    return client, calls
+
+
+def test_retry_backoff_not_counted_as_latency(monkeypatch):
+    monkeypatch.setattr(api_client, "backoff_delay", lambda attempt: 0.05)
+    client, calls = _client(monkeypatch, [APIError("busy", "search", 503), {"files": [{"file": "a"}]}])
+
+    assert client.search("db", "q")["files"] == [{"file": "a"}]
+
+    assert calls == ["search", "search"]
+    samples = list(client.hedge_policy._latencies)
+    assert len(samples) == 1 and samples[0] < 0.05
+    assert client.hedge_policy.requests == 2
+
+
+def test_non_retryable_error_is_not_retried(monkeypatch):
+    client, calls = _client(monkeypatch, [APIError("bad request", "search", 400)])
+    with pytest.raises(APIError):
+        client.search("db", "q")
+    assert calls == ["search"]
+
+
+def test_executors_created_once_in_init():
+    client = APIClient()
+    assert client._search_executor is not None
+    assert client._hedge_executor is not None
+
+
+def test_hedge_wins_when_primary_is_slow():
+    policy = HedgePolicy(min_samples=1, min_delay=0.01, max_ratio=1.0, max_tokens=1.0)
+    policy.record_latency(0.01)
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(1)
+            return "primary"
+        return "hedge"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        assert hedged_call(fn, policy, executor) == "hedge"
+        release.set()
+    assert policy.hedges_fired == 1 and policy.hedges_won == 1
+
+
+def test_hedge_throttled_without_tokens():
+    policy = HedgePolicy(min_samples=1, min_delay=0.01, max_ratio=0.0)
+    policy.record_latency(0.01)
+
+    def fn():
+        time.sleep(0.05)
+        return "primary"
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        assert hedged_call(fn, policy, executor) == "primary"
+    assert policy.hedges_fired == 0 and policy.hedges_throttled == 1
+
+
+def test_open_circuit_is_not_retried(monkeypatch):
+    client, calls = _client(monkeypatch, [CircuitOpenError("open", "search")])
+    with pytest.raises(CircuitOpenError):
+        client.search("db", "q")
+    assert calls == ["search"]
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+import app as sync_app
+import asgi_app
+import async_api_client
+from api_client import APIError, CircuitBreaker, CircuitOpenError
+from async_api_client import AsyncAPIClient
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_async_search_retries_transient_errors(monkeypatch):
+    client = AsyncAPIClient()
+    client.search_cache = None
+    outcomes = [APIError("busy", "search", 503), {"files": [{"file": "a"}]}]
+    calls = []
+
+    async def fake_post(endpoint, url, payload):
+        calls.append(endpoint)
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(client, "_post", fake_post)
+    monkeypatch.setattr(async_api_client, "backoff_delay", lambda attempt: 0)
+
+    assert _run(client.search("db", "q"))["files"] == [{"file": "a"}]
+    assert calls == ["search", "search"]
+
+
+def test_async_client_rejects_when_shared_breaker_is_open():
+    breakers = {endpoint: CircuitBreaker(endpoint, failure_threshold=1) for endpoint in ("search", "dialogue")}
+    breakers["dialogue"].record_failure()
+    client = AsyncAPIClient(search_cache=None, breakers=breakers)
+
+    with pytest.raises(CircuitOpenError):
+        _run(client.dialogue("hello"))
+    assert client.circuit_stats()["dialogue"]["rejected"] == 1
+
+
+@pytest.fixture
+def quart_client(monkeypatch):
+    async def benign(text):
+        return "benign", "local"
+
+    monkeypatch.setattr(asgi_app, "classify_intent", benign)
+    monkeypatch.setattr(asgi_app, "config", asgi_app.config._replace(SPECULATIVE_INTENT=False))
+    sync_app.answer_cache.clear()
+    sync_app.conversation_store.clear()
+    yield asgi_app.app.test_client()
+    sync_app.answer_cache.clear()
+    sync_app.conversation_store.clear()
+
+
+def test_cached_answer_matches_flask_response(quart_client):
+    question = "防火墙是如何工作的"
+    sync_app.answer_cache.put(question, sync_app.detect_personality(question), "按规则过滤流量")
+
+    async def call():
+        response = await quart_client.post("/chat", json={"message": question})
+        return response.status_code, await response.get_json()
+
+    status, payload = _run(call())
+    assert status == 200
+    assert payload["response"] == "按规则过滤流量" and payload["cached"] is True
+
+
+def test_open_circuit_maps_to_503(quart_client, monkeypatch):
+    async def open_circuit(text):
+        raise CircuitOpenError("dialogue upstream unavailable (circuit open)", endpoint="dialogue")
+
+    monkeypatch.setattr(asgi_app, "classify_intent", open_circuit)
+
+    async def call():
+        return (await quart_client.post("/chat", json={"message": "防火墙是如何工作的"})).status_code
+
+    assert _run(call()) == 503
+
+
+def test_health_matches_flask(quart_client):
+    async def call():
+        return await (await quart_client.get("/health")).get_json()
+
+    assert set(_run(call())) == set(sync_app.health_payload())
+
+
+def test_cancelled_half_open_probe_is_released(monkeypatch):
+    breaker = CircuitBreaker("search", failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    client = AsyncAPIClient(breakers={"search": breaker, "dialogue": CircuitBreaker("dialogue")})
+    client.search_cache = None
+
+    class _SlowSession:
+        closed = False
+
+        def post(self, *args, **kwargs):
+            return self
+
+        async def __aenter__(self):
+            await asyncio.sleep(10)
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(client, "_get_session", lambda: _SlowSession())
+
+    async def cancel_probe():
+        task = asyncio.create_task(client.search("db", "q"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    _run(cancel_probe())
+    assert breaker.before_call() is True
@@ -0,0 +1,46 @@
+import json
+
+from response_evaluator import evaluate_batch, extract_json, validate_evaluation
+
+GOOD = {"accuracy_score": 25, "relevance_score": 20, "completeness_score": 15, "clarity_score": 10,
+        "format_score": 8, "total_score": 78, "strengths": "清晰"}
+
+
+class _Client:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def dialogue(self, prompt, max_tokens=1024):
+        self.prompts.append(prompt)
+        return self.replies.pop(0)
+
+
+def test_extract_json_skips_prose_and_nested_lists():
+    text = '说明 {"a": [1, 2]} 之后还有 {"b": 2}'
+    assert extract_json(text) == {"a": [1, 2]}
+    assert extract_json("没有 JSON") is None
+
+
+def test_validate_evaluation_checks_score_ranges():
+    assert validate_evaluation(GOOD)["strengths"] == ["清晰"]
+    assert validate_evaluation({**GOOD, "accuracy_score": 31}) is None
+    assert validate_evaluation({**GOOD, "total_score": True}) is None
+
+
+def test_only_failed_items_are_retried():
+    items = [("q1", "c1", "r1"), ("q2", "c2", "r2")]
+    first = json.dumps([{"index": 1, **GOOD}, {"index": 2, **GOOD, "format_score": 99}])
+    second = json.dumps([{"index": 1, **GOOD, "total_score": 60}])
+    client = _Client([first, second])
+
+    results = evaluate_batch(items, max_retries=1, client=client)
+
+    assert results[0]["total_score"] == 78 and results[1]["total_score"] == 60
+    assert "q2" in client.prompts[1] and "q1" not in client.prompts[1]
+
+
+def test_exhausted_items_fall_back_to_default():
+    client = _Client(["不是 JSON", "还是不是"])
+    results = evaluate_batch([("q", "c", "r")], max_retries=1, client=client)
+    assert results[0]["total_score"] == 0 and results[0]["strengths"] == ["评估失败"]
@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    app.answer_cache.clear()
+    app.conversation_store.clear()
+    yield
+    app.answer_cache.clear()
+    app.conversation_store.clear()
+
+
+def test_intent_check_runs_before_answer_cache(monkeypatch):
+    question = "什么是SQL注入"
+    app.answer_cache.put(question, app.detect_personality(question), "cached answer")
+    monkeypatch.setattr(app, "classify_intent", lambda text: ("malicious", "local"))
+    monkeypatch.setattr(app, "config", app.config._replace(SPECULATIVE_INTENT=False))
+
+    state, error = app.prepare_chat_turn({"message": question})
+
+    assert state is None
+    assert error[1] == 403
+
+
+def test_cached_answer_served_after_intent_passes(monkeypatch):
+    question = "什么是SQL注入"
+    app.answer_cache.put(question, app.detect_personality(question), "cached answer")
+    monkeypatch.setattr(app, "classify_intent", lambda text: ("benign", "local"))
+    monkeypatch.setattr(app, "config", app.config._replace(SPECULATIVE_INTENT=False))
+
+    state, error = app.prepare_chat_turn({"message": question})
+
+    assert error is None
+    assert state["cached_response"] == "cached answer"
+    assert app.finish_chat_turn(state, state["cached_response"])["cached"] is True
+
+
+def test_circuit_open_maps_to_503(monkeypatch):
+    def open_circuit(text):
+        raise app.CircuitOpenError("dialogue upstream unavailable (circuit open)", endpoint="dialogue")
+
+    monkeypatch.setattr(app, "classify_intent", open_circuit)
+    monkeypatch.setattr(app, "config", app.config._replace(SPECULATIVE_INTENT=False))
+
+    state, error = app.prepare_chat_turn({"message": "防火墙是如何工作的"})
+
+    assert state is None
+    assert error[1] == 503
+
+
+def test_speculative_search_result_discarded_on_rejection(monkeypatch):
+    search_started = threading.Event()
+    release_search = threading.Event()
+    futures = []
+    used = []
+
+    def slow_search(db_name, query, top_k=None):
+        search_started.set()
+        release_search.wait(2)
+        return {"files": [{"file": "phase-1 doc", "score": 0.99}]}
+
+    def classify(text):
+        # 第一阶段检索必须在意图审查得出结论之前就已发出
+        assert search_started.wait(2)
+        return "malicious", "local"
+
+    submit = app.pipeline_executor.submit
+
+    def recording_submit(*args, **kwargs):
+        future = submit(*args, **kwargs)
+        futures.append(future)
+        return future
+
+    monkeypatch.setattr(app.retriever, "search", slow_search)
+    monkeypatch.setattr(app.pipeline_executor, "submit", recording_submit)
+    monkeypatch.setattr(app, "classify_intent", classify)
+    monkeypatch.setattr(app, "first_phase_documents", lambda *args: used.append(args))
+    monkeypatch.setattr(app, "config", app.config._replace(SPECULATIVE_INTENT=True))
+
+    state, error = app.prepare_chat_turn({"message": "如何入侵别人的服务器"})
+    release_search.set()
+
+    assert state is None and error[1] == 403
+    assert len(futures) == 1
+    futures[0].result(timeout=2)      # 检索已在执行，无法取消；它的结果被丢弃
+    assert used == []
+    conversations, _ = app.conversation_store.list_conversations()
+    assert conversations == []
@@ -0,0 +1,86 @@
+import pytest
+
+from api_client import (CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, APIClient, APIError, CircuitBreaker,
+                        CircuitOpenError)
+
+
+def test_circuit_breaker_opens_and_recovers():
+    breaker = CircuitBreaker("search", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.opened_at -= 60
+    assert breaker.before_call() is True   # 探测请求
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()              # 探测进行中，其余请求仍被拒绝
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    assert breaker.stats()["rejected"] == 2
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker("search", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    assert breaker.opened_count == 2
+
+
+def test_retryable_errors():
+    assert APIError("timeout", "search").retryable
+    assert APIError("busy", "search", 503).retryable
+    assert APIError("slow down", "search", 429).retryable
+    assert not APIError("bad request", "search", 400).retryable
+
+
+def _half_open(reset_timeout=60):
+    breaker = CircuitBreaker("search", failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.opened_at -= reset_timeout
+    assert breaker.before_call() is True
+    return breaker
+
+
+def test_released_probe_lets_next_call_probe():
+    breaker = _half_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.release_probe()
+
+    assert breaker.before_call() is True
+    assert breaker.state == CIRCUIT_HALF_OPEN
+
+
+def test_stale_probe_is_taken_over():
+    breaker = _half_open(reset_timeout=0.05)
+    breaker._probe_started -= 0.05
+    assert breaker.before_call() is True
+
+
+class _Abandoned(BaseException):
+    pass
+
+
+def test_abandoned_request_releases_probe(monkeypatch):
+    client = APIClient()
+    breaker = client.breakers["search"]
+    breaker.failure_threshold = 1
+    breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout
+
+    def abandon(*args, **kwargs):
+        raise _Abandoned()
+
+    monkeypatch.setattr(client.session, "post", abandon)
+    with pytest.raises(_Abandoned):
+        client._post("search", "http://upstream/search", {})
+
+    assert breaker.before_call() is True
+
@@ -0,0 +1,85 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conversation_store import MemoryConversationStore, SQLiteConversationStore, prepare_spill_dir
+
+
+def _spill_files(store):
+    return sorted(os.listdir(store.spill_dir))
+
+
+def test_spill_and_reload(tmp_path):
+    store = MemoryConversationStore(max_bytes=2000, spill_dir=str(tmp_path))
+    first, _ = store.get_or_create(None, "first")
+    store.append_turn(first, "q" * 300, "a" * 300)
+    second, _ = store.get_or_create(None, "second")
+    store.append_turn(second, "q" * 600, "a" * 600)
+
+    assert _spill_files(store) == [f"{first}.json.z"]
+    assert store.get_messages(first)[0]["content"] == "q" * 300
+    assert store.stats()["reloaded"] == 1
+
+
+def test_clear_removes_spill_files(tmp_path):
+    store = MemoryConversationStore(max_bytes=1000, spill_dir=str(tmp_path))
+    for i in range(5):
+        conversation_id, _ = store.get_or_create(None, f"conv {i}")
+        store.append_turn(conversation_id, "q" * 300, "a" * 300)
+    assert _spill_files(store)
+
+    store.clear()
+
+    assert _spill_files(store) == []
+    assert store.list_conversations() == ([], None)
+
+
+def test_startup_removes_stale_spill_files(tmp_path):
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                          capture_output=True, text=True).stdout.strip()
+    stale_dir = tmp_path / f"proc-{dead}"
+    stale_dir.mkdir()
+    (stale_dir / "old.json.z").write_bytes(b"x")
+    (tmp_path / "legacy.json.z").write_bytes(b"x")
+    own_dir = tmp_path / f"proc-{os.getpid()}"
+    own_dir.mkdir()
+    (own_dir / "reused-pid.json.z").write_bytes(b"x")
+
+    spill_dir = prepare_spill_dir(str(tmp_path))
+
+    assert spill_dir == str(own_dir)
+    assert os.listdir(spill_dir) == []
+    assert not stale_dir.exists()
+    assert not (tmp_path / "legacy.json.z").exists()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="liveness check is disabled on Windows")
+def test_startup_keeps_live_sibling_directories(tmp_path):
+    sibling = tmp_path / f"proc-{os.getppid()}"
+    sibling.mkdir()
+    (sibling / "live.json.z").write_bytes(b"x")
+
+    prepare_spill_dir(str(tmp_path))
+
+    assert (sibling / "live.json.z").exists()
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda tmp_path: MemoryConversationStore(spill_dir=str(tmp_path / "spill")),
+    lambda tmp_path: SQLiteConversationStore(str(tmp_path / "conversations.db")),
+])
+def test_history_pagination_orders_by_activity(tmp_path, make_store):
+    store = make_store(tmp_path)
+    ids = [store.get_or_create(None, f"conv {i}")[0] for i in range(3)]
+    store.append_turn(ids[0], "q", "a")
+
+    page, cursor = store.list_conversations(limit=2)
+    assert [c["id"] for c in page] == [ids[0], ids[2]]
+    rest, cursor = store.list_conversations(limit=2, before=cursor)
+    assert [c["id"] for c in rest] == [ids[1]] and cursor is None
+
+    messages = store.get_message_page(ids[0], limit=1)
+    assert messages["messages"] == [{"role": "assistant", "content": "a"}]
+    assert messages["total"] == 2 and messages["next_before"] == 1
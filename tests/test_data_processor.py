@@ -0,0 +1,40 @@
+from data_processor import cited_context, estimate_tokens, files_to_citations, merge_results, pack_context
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("防火墙") == 3
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_pack_context_respects_budget_and_keeps_relevance_order():
+    items = [
+        {"file": "a" * 40, "score": 0.9},
+        {"file": "b" * 400, "score": 0.8},
+        {"file": "c" * 40, "score": 0.7},
+    ]
+    packed = pack_context(items, max_tokens=25, count_tokens=estimate_tokens, truncate=False)
+    assert packed.tokens <= 25
+    assert [doc["score"] for doc in packed.docs] == [0.9, 0.7]
+    assert packed.dropped == 1 and packed.truncated == 0
+
+
+def test_pack_context_truncates_at_sentence_boundary():
+    long_doc = "第一句话。" * 50
+    packed = pack_context([{"file": long_doc, "score": 1.0}], max_tokens=100, count_tokens=estimate_tokens,
+                          truncate=True)
+    assert packed.truncated == 1
+    assert packed.contents[0].endswith("。")
+    assert 64 <= packed.tokens <= 100
+
+
+def test_citation_ids_match_cited_context():
+    items = [{"file": "正文一", "metadata": {"source": "a.json"}}, {"file": "正文二", "id": "doc-2"}]
+    packed = pack_context(items, max_tokens=100, count_tokens=estimate_tokens)
+    citations = files_to_citations({"results": packed.docs}, snippet_length=2)
+    assert cited_context(packed) == "[1] 正文一\n\n[2] 正文二"
+    assert [(c["id"], c["file_id"], c["snippet"]) for c in citations] == [(1, "a.json", "正文…"), (2, "doc-2", "正文…")]
+
+
+def test_merge_results_dedupes_by_content_keeping_best_score():
+    merged = merge_results([[{"file": "x", "score": 0.2}, {"file": "y"}], [{"file": "x", "score": 0.5}]])
+    assert merged == [{"file": "x", "score": 0.5}, {"file": "y"}]
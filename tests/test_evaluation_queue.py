@@ -0,0 +1,56 @@
+import threading
+
+from evaluation_queue import STATUS_DONE, STATUS_FAILED, STATUS_PENDING, EvaluationQueue
+
+
+def _wait_for(queue, evaluation_id):
+    queue._queue.join()
+    return queue.get(evaluation_id)
+
+
+def test_evaluation_runs_in_background():
+    def evaluate(response, question, context, client=None):
+        return response, {"total_score": 90, "question": question}
+
+    queue = EvaluationQueue(workers=1, max_queue=4, evaluate=evaluate)
+    evaluation_id = queue.submit("q", "ctx", "answer")
+
+    entry = _wait_for(queue, evaluation_id)
+    assert entry["status"] == STATUS_DONE
+    assert entry["evaluation"] == {"total_score": 90, "question": "q"}
+    assert queue.stats()["completed"] == 1
+
+
+def test_failed_evaluation_is_reported():
+    def evaluate(*args, **kwargs):
+        raise RuntimeError("upstream down")
+
+    queue = EvaluationQueue(workers=1, max_queue=4, evaluate=evaluate)
+    entry = _wait_for(queue, queue.submit("q", "ctx", "answer"))
+    assert entry["status"] == STATUS_FAILED and "upstream down" in entry["error"]
+
+
+def test_full_queue_drops_without_blocking():
+    release = threading.Event()
+
+    def evaluate(*args, **kwargs):
+        release.wait(2)
+        return None, {}
+
+    queue = EvaluationQueue(workers=1, max_queue=1, evaluate=evaluate)
+    ids = [queue.submit("q", "ctx", str(i)) for i in range(4)]
+    release.set()
+
+    assert ids[0] is not None and None in ids
+    assert queue.stats()["dropped"] >= 1
+    assert queue.get(ids[0])["status"] in (STATUS_PENDING, STATUS_DONE)
+
+
+def test_results_are_bounded():
+    queue = EvaluationQueue(workers=1, max_queue=8, max_results=2,
+                            evaluate=lambda *args, **kwargs: (None, {}))
+    ids = [queue.submit("q", "ctx", str(i)) for i in range(3)]
+    queue._queue.join()
+
+    assert queue.get(ids[0]) is None
+    assert queue.get(ids[2])["status"] == STATUS_DONE
@@ -0,0 +1,33 @@
+import json
+
+from guard import InjectionScanner
+from ingestion import iter_json_documents
+
+
+def _write(path, payload):
+    path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+
+
+def test_bad_item_does_not_drop_rest_of_file(tmp_path, monkeypatch):
+    _write(tmp_path / "a.json", [{"content": "one"}, {"content": "two"}, {"content": "three"}])
+    scanner = InjectionScanner()
+    original = scanner.tag_documents
+
+    def flaky_tag(docs):
+        if docs[0]["file"] == "two":
+            raise RuntimeError("boom")
+        return original(docs)
+
+    monkeypatch.setattr(scanner, "tag_documents", flaky_tag)
+    stats = {}
+    docs = list(iter_json_documents(str(tmp_path), stats, scanner))
+
+    assert [doc["file"] for doc in docs] == ["one", "three"]
+    assert stats["failed_items"] == 1
+
+
+def test_string_metadata_is_ingested(tmp_path):
+    _write(tmp_path / "a.json", [{"content": "abc", "metadata": "src.json"}, {"content": "def"}])
+    docs = list(iter_json_documents(str(tmp_path), {}, InjectionScanner()))
+    assert [doc["file"] for doc in docs] == ["abc", "def"]
+    assert docs[0]["metadata"] == "src.json"
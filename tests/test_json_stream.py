@@ -0,0 +1,95 @@
+import json
+import random
+import threading
+
+import pytest
+
+import ingestion
+from ingestion import iter_json_items, prefetch
+
+
+@pytest.fixture(autouse=True)
+def builtin_parser(monkeypatch):
+    # 始终测试内置的增量解析（安装了 ijson 时也是）
+    monkeypatch.setattr(ingestion, "ijson", None)
+
+
+def _parse(tmp_path, text, chunk_size):
+    path = tmp_path / "items.json"
+    path.write_text(text, encoding="utf-8")
+    return [item for _, item in iter_json_items(str(path), chunk_size)]
+
+
+def _random_value(rng, depth=0):
+    kind = rng.randrange(8 if depth < 2 else 5)
+    if kind == 0:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.uniform(-1e6, 1e6) * 10 ** rng.randint(-30, 30)
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return "".join(rng.choice('ab"\\\n,]}[ 密码é') for _ in range(rng.randrange(6)))
+    if kind == 4:
+        return rng.choice([0, -0.0, 1.5, 1e-7, 12345678901234567890])
+    if kind == 5:
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    return {f"k{i}": _random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+@pytest.mark.parametrize("text,chunk_size", [("[1.5]", 1), ("[94174.30575123118]", 2), ("[1e-5, -2E+3]", 1)])
+def test_number_split_at_chunk_boundary(tmp_path, text, chunk_size):
+    assert _parse(tmp_path, text, chunk_size) == json.loads(text)
+
+
+def test_matches_json_load_at_every_chunk_size(tmp_path):
+    rng = random.Random(20261018)
+    for _ in range(150):
+        items = [_random_value(rng) for _ in range(rng.randrange(6))]
+        text = json.dumps(items, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+        for chunk_size in (1, 2, 3, 5, 8, 64):
+            assert _parse(tmp_path, text, chunk_size) == json.loads(text), (text, chunk_size)
+
+
+def test_single_object_is_parsed_whole(tmp_path):
+    path = tmp_path / "doc.json"
+    path.write_text('  {"content": "abc"}', encoding="utf-8")
+    assert list(iter_json_items(str(path), 4)) == [(None, {"content": "abc"})]
+
+
+@pytest.mark.parametrize("text", ["[1, 2", '[{"a": 1}, {"b": ]'])
+def test_malformed_array_raises(tmp_path, text):
+    with pytest.raises(json.JSONDecodeError):
+        _parse(tmp_path, text, 3)
+
+
+def test_prefetch_preserves_order_and_reraises():
+    def source():
+        yield from range(5)
+        raise ValueError("bad file")
+
+    received = []
+    with pytest.raises(ValueError):
+        for item in prefetch(source(), maxsize=2):
+            received.append(item)
+    assert received == [0, 1, 2, 3, 4]
+
+
+def test_prefetch_stops_producer_when_consumer_exits():
+    produced = []
+    finished = threading.Event()
+
+    def source():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield i
+        finally:
+            finished.set()
+
+    stream = prefetch(source(), maxsize=2)
+    assert next(stream) == 0
+    stream.close()
+
+    assert finished.wait(2)
+    assert len(produced) < 1000
@@ -0,0 +1,36 @@
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_technical_terms_and_cjk_bigrams():
+    tokens = tokenize("CVE-2021-44228 漏洞")
+    assert "cve-2021-44228" in tokens and "44228" in tokens
+    assert "漏洞" in tokens
+    assert tokenize("锁") == ["锁"]
+
+
+def test_bm25_ranks_exact_identifier_first():
+    index = LexicalIndex()
+    added = index.add_documents([
+        {"file": "CVE-2021-44228 是 Log4j 远程代码执行漏洞"},
+        {"file": "CVE-2021-44229 是另一个漏洞"},
+        {"file": "防火墙按规则过滤流量"},
+        {"file": "防火墙按规则过滤流量"},
+    ])
+    assert added == 3 and len(index) == 3
+
+    files = index.search("CVE-2021-44228", top_k=2)["files"]
+    assert files[0]["file"].startswith("CVE-2021-44228")
+    assert files[0]["bm25"] > files[1]["bm25"]
+    assert index.search("不存在的词")["files"] == []
+
+
+def test_rrf_merges_fields_and_orders_by_fused_rank():
+    vector = [{"file": "a", "score": 0.9}, {"file": "b", "score": 0.8}]
+    lexical = [{"file": "b", "bm25": 3.0}, {"file": "c", "bm25": 1.0}]
+
+    fused = reciprocal_rank_fusion([vector, lexical], k=60)
+
+    assert [doc["file"] for doc in fused] == ["b", "a", "c"]
+    assert fused[0]["score"] == 0.8 and fused[0]["bm25"] == 3.0
+    assert fused[0]["rrf_score"] == 1 / 62 + 1 / 61
+    assert len(reciprocal_rank_fusion([vector, lexical], limit=1)) == 1
@@ -0,0 +1,32 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_load_corpus_does_not_import_the_web_app(tmp_path):
+    corpus_dir = tmp_path / "json_files"
+    corpus_dir.mkdir()
+    (corpus_dir / "a.json").write_text(json.dumps([
+        {"context": "c", "question": "q", "answer": "a"},
+        {"content": "防火墙的作用", "metadata": {"source": "manual"}},
+    ], ensure_ascii=False), encoding="utf-8")
+    extra = tmp_path / "extra.json"
+    extra.write_text(json.dumps([{"file": "extra doc", "metadata": {}}]), encoding="utf-8")
+
+    script = (
+        "import sys, local_index\n"
+        f"docs = local_index.load_corpus({str(corpus_dir)!r}, extra_files=[{str(extra)!r}])\n"
+        "assert 'app' not in sys.modules\n"
+        "print(len(docs))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, capture_output=True, text=True,
+                            env={**os.environ, "PYTHONPATH": ROOT, "RETRIEVAL_BACKEND": "local"})
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "5"
@@ -0,0 +1,111 @@
+import json
+
+from guard import InjectionScanner
+from ingestion import (STATUS_FAILED, STATUS_IN_FLIGHT, STATUS_UPLOADED, IngestionManifest, document_hash,
+                       iter_json_documents, legacy_document_hash)
+
+
+def _documents(directory, items):
+    directory.mkdir(exist_ok=True)
+    (directory / "a.json").write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+    return list(iter_json_documents(str(directory), {}, InjectionScanner()))
+
+
+def _manifest(tmp_path):
+    return IngestionManifest.load("db", path=str(tmp_path / "manifest.json"), base_url="http://upstream")
+
+
+def _upload_all(manifest, docs, status=STATUS_UPLOADED):
+    pending, _ = manifest.pending(docs)
+    manifest.mark([h for h, _ in pending], status)
+    return pending
+
+
+def test_hash_ignores_position_and_scan_verdict(tmp_path):
+    cqa = {"context": "防火墙按规则过滤流量", "question": "防火墙的作用", "answer": "隔离网络"}
+    before = _documents(tmp_path / "before", [cqa])
+    after = _documents(tmp_path / "after", [{"content": "新条目"}, cqa])
+
+    assert [document_hash(d) for d in before] == [document_hash(d) for d in after[1:]]
+    untagged = {**before[0], "metadata": {k: v for k, v in before[0]["metadata"].items() if k != "injection_scan"}}
+    assert document_hash(untagged) == document_hash(before[0])
+    assert len({document_hash(d) for d in before}) == 3
+
+
+def test_resume_uploads_only_new_and_failed(tmp_path):
+    docs = _documents(tmp_path / "json_files", [{"content": "one"}, {"content": "two"}])
+    manifest = _manifest(tmp_path)
+    pending, _ = manifest.pending(docs)
+    manifest.mark([pending[0][0]], STATUS_UPLOADED)
+    manifest.mark([pending[1][0]], STATUS_FAILED, error="503")
+
+    # 不调用 compact()，模拟崩溃：清单从日志恢复
+    reloaded = _manifest(tmp_path)
+    docs = _documents(tmp_path / "json_files", [{"content": "zero"}, {"content": "one"}, {"content": "two"}])
+    pending, skipped = reloaded.pending(docs)
+
+    assert [doc["file"] for _, doc in pending] == ["zero", "two"]
+    assert skipped == 1
+
+
+def test_compact_survives_reload(tmp_path):
+    docs = _documents(tmp_path / "json_files", [{"content": "one"}])
+    manifest = _manifest(tmp_path)
+    _upload_all(manifest, docs)
+    manifest.compact()
+
+    assert not (tmp_path / "manifest.json.log").exists()
+    assert _manifest(tmp_path).pending(docs) == ([], 1)
+
+
+def test_manifest_for_other_database_is_ignored(tmp_path):
+    docs = _documents(tmp_path / "json_files", [{"content": "one"}])
+    manifest = _manifest(tmp_path)
+    _upload_all(manifest, docs)
+    manifest.compact()
+
+    other = IngestionManifest.load("other", path=str(tmp_path / "manifest.json"), base_url="http://upstream")
+    assert len(other.pending(docs)[0]) == 1
+
+
+def test_legacy_manifest_entries_are_adopted(tmp_path):
+    docs = _documents(tmp_path / "json_files", [{"content": "one"}, {"content": "two"}])
+    manifest = _manifest(tmp_path)
+    manifest.mark([legacy_document_hash(docs[0])], STATUS_UPLOADED)
+
+    pending, skipped = manifest.pending(docs)
+
+    assert [doc["file"] for _, doc in pending] == ["two"]
+    assert skipped == 1
+    assert manifest.status(document_hash(docs[0])) == STATUS_UPLOADED
+
+
+def test_duplicates_dedupe_through_manifest_state(tmp_path):
+    docs = _documents(tmp_path / "json_files", [{"content": "one"}, {"content": "one"}, {"content": "two"}])
+    manifest = _manifest(tmp_path)
+    counts = {}
+
+    pending = list(manifest.iter_pending(docs, counts))
+
+    assert [doc["file"] for _, doc in pending] == ["one", "two"]
+    assert counts == {"seen": 3, "pending": 2}
+    assert manifest.status(pending[0][0]) == STATUS_IN_FLIGHT
+
+
+def test_failed_documents_are_yielded_again_on_retry_pass(tmp_path):
+    docs = _documents(tmp_path / "json_files", [{"content": "one"}, {"content": "two"}])
+    manifest = _manifest(tmp_path)
+    first = list(manifest.iter_pending(docs))
+    manifest.mark([first[0][0]], STATUS_UPLOADED)
+    manifest.mark([first[1][0]], STATUS_FAILED, error="503")
+
+    assert [doc["file"] for _, doc in manifest.iter_pending(docs)] == ["two"]
+
+
+def test_in_flight_entries_are_not_persisted(tmp_path):
+    docs = _documents(tmp_path / "json_files", [{"content": "one"}])
+    manifest = _manifest(tmp_path)
+    list(manifest.iter_pending(docs))
+    manifest.compact()
+
+    assert len(_manifest(tmp_path).pending(docs)[0]) == 1
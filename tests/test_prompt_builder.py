@@ -0,0 +1,23 @@
+from data_processor import estimate_tokens
+from prompt_builder import PromptStats, build_chat_prompt
+
+
+def test_prompt_contains_each_document_once_with_citation_hint():
+    citations = [{"id": 1, "file_id": "a", "snippet": "正文一", "link": "#file-a"}]
+    prompt = build_chat_prompt([], "什么是防火墙", "[1] 正文一", citations)
+    assert prompt.count("正文一") == 1
+    assert "[编号]" in prompt
+
+
+def test_prompt_keeps_only_recent_history():
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"msg-{i}"} for i in range(14)]
+    prompt = build_chat_prompt(history, "q", "", [])
+    assert "msg-3" not in prompt and "msg-4" in prompt and "msg-13" in prompt
+
+
+def test_prompt_stats_reports_average_and_max():
+    stats = PromptStats()
+    stats.record("防火墙")
+    stats.record("防火墙是什么")
+    assert stats.stats() == {"prompts": 2, "avg_prompt_tokens": (estimate_tokens("防火墙") + estimate_tokens("防火墙是什么")) / 2,
+                             "max_prompt_tokens": estimate_tokens("防火墙是什么")}
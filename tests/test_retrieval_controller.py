@@ -0,0 +1,24 @@
+from retrieval_controller import (PATH_EARLY_EXIT, PATH_NO_DOCS, PATH_TWO_PHASE, RetrievalController,
+                                  doc_score)
+
+
+def test_doc_score_fields():
+    assert doc_score({"score": 0.9}) == 0.9
+    assert doc_score({"similarity": 1}) == 1.0
+    assert doc_score({"distance": 0.25}) == 0.75
+    assert doc_score({"file": "x"}) is None
+
+
+def test_early_exit_needs_score_and_margin():
+    controller = RetrievalController(min_score=0.8, min_margin=0.1, enabled=True)
+
+    assert controller.decide([{"score": 0.9}, {"score": 0.7}]) == (PATH_EARLY_EXIT, 0.9)
+    assert controller.decide([{"score": 0.9}, {"score": 0.85}])[0] == PATH_TWO_PHASE
+    assert controller.decide([{"score": 0.7}])[0] == PATH_TWO_PHASE
+    assert controller.decide([]) == (PATH_NO_DOCS, None)
+    assert controller.stats() == {PATH_EARLY_EXIT: 1, PATH_TWO_PHASE: 2, PATH_NO_DOCS: 1}
+
+
+def test_disabled_controller_always_runs_two_phases():
+    controller = RetrievalController(min_score=0.0, min_margin=0.0, enabled=False)
+    assert controller.decide([{"score": 1.0}])[0] == PATH_TWO_PHASE
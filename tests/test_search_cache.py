@@ -0,0 +1,35 @@
+import time
+
+from search_cache import SearchCache
+
+
+def test_lru_eviction_and_stats():
+    cache = SearchCache(maxsize=2, ttl=60)
+    cache.put(("db", "a"), 1)
+    cache.put(("db", "b"), 2)
+    assert cache.get(("db", "a")) == 1      # a 变为最近使用
+    cache.put(("db", "c"), 3)
+
+    assert cache.get(("db", "b")) is None
+    assert cache.get(("db", "a")) == 1 and cache.get(("db", "c")) == 3
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 1}
+
+
+def test_expired_entries_are_dropped():
+    cache = SearchCache(maxsize=4, ttl=0.01)
+    cache.put(("db", "a"), 1)
+    time.sleep(0.02)
+    assert cache.get(("db", "a")) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_by_database():
+    cache = SearchCache(maxsize=4, ttl=60)
+    cache.put(("db1", "q"), 1)
+    cache.put(("db2", "q"), 2)
+
+    cache.invalidate("db1")
+    assert cache.get(("db1", "q")) is None and cache.get(("db2", "q")) == 2
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,22 @@
+from api_client import APIClient
+from data_processor import merge_results
+
+
+def test_search_many_keeps_order_and_merges_by_best_score(monkeypatch):
+    client = APIClient()
+    responses = {
+        "a": {"files": [{"file": "x", "score": 0.5}, {"file": "y", "score": 0.9}]},
+        "b": {"files": [{"file": "x", "score": 0.8}]},
+        "c": {"files": []},
+    }
+    monkeypatch.setattr(client, "search", lambda db_name, query, top_k=None, expr=None: responses[query])
+
+    out = client.search_many("db", ["a", "b", "c"])
+
+    assert out["results"] == [responses["a"], responses["b"], responses["c"]]
+    assert [(doc["file"], doc["score"]) for doc in out["merged"]] == [("y", 0.9), ("x", 0.8)]
+
+
+def test_merge_results_keeps_unscored_documents_after_scored():
+    merged = merge_results([[{"file": "plain"}, {"file": "a", "score": 0.1}], [{"file": "plain"}]])
+    assert [doc["file"] for doc in merged] == ["a", "plain"]
@@ -0,0 +1,125 @@
+import io
+import json
+
+import pytest
+import requests
+
+import app
+from api_client import APIClient, _extract_stream_text
+
+
+class _BrokenRaw(io.BytesIO):
+    """上游在输出一部分后断开连接"""
+
+    def read(self, *args):
+        data = super().read(*args)
+        if not data:
+            raise requests.ConnectionError("connection reset by upstream")
+        return data
+
+
+def _response(body: bytes, content_type: str, raw_class=io.BytesIO) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers["Content-Type"] = content_type
+    resp.raw = raw_class(body)
+    return resp
+
+
+def _stream_client(monkeypatch, client, response):
+    payloads = []
+
+    def fake_post(endpoint, url, payload, stream=False):
+        payloads.append(payload)
+        return response
+
+    monkeypatch.setattr(client, "_post", fake_post)
+    return payloads
+
+
+SSE_BODY = (
+    'data: {"response": "网络"}\n\n'
+    ': keep-alive\n\n'
+    'data: {"content": "安全"}\n\n'
+    'data: {"delta": "需要"}\n\n'
+    'data: 纵深防御\n\n'
+    'data: [DONE]\n\n'
+    'data: {"response": "之后的内容"}\n\n'
+).encode("utf-8")
+
+
+def test_extract_stream_text_fields():
+    assert _extract_stream_text('{"response": "a"}') == "a"
+    assert _extract_stream_text('{"content": "b"}') == "b"
+    assert _extract_stream_text('{"delta": "c"}') == "c"
+    assert _extract_stream_text('{"other": 1}') == ""
+    assert _extract_stream_text("plain") == "plain"
+
+
+def test_sse_stream_stops_at_done(monkeypatch):
+    client = APIClient()
+    payloads = _stream_client(monkeypatch, client, _response(SSE_BODY, "text/event-stream"))
+
+    assert list(client.dialogue_stream("q")) == ["网络", "安全", "需要", "纵深防御"]
+    assert payloads[0]["stream"] is True
+
+
+def test_json_fallback_yields_whole_answer(monkeypatch):
+    client = APIClient()
+    body = json.dumps({"response": "完整回答"}, ensure_ascii=False).encode("utf-8")
+    _stream_client(monkeypatch, client, _response(body, "application/json; charset=utf-8"))
+
+    assert list(client.dialogue_stream("q")) == ["完整回答"]
+
+
+def test_chunked_plain_text_fallback(monkeypatch):
+    client = APIClient()
+    _stream_client(monkeypatch, client, _response("分块的纯文本".encode("utf-8"), "text/plain"))
+
+    assert "".join(client.dialogue_stream("q")) == "分块的纯文本"
+
+
+@pytest.fixture
+def flask_client(monkeypatch):
+    monkeypatch.setattr(app, "classify_intent", lambda text: ("benign", "local"))
+    monkeypatch.setattr(app, "config", app.config._replace(SPECULATIVE_INTENT=False, ANSWER_CACHE_ENABLED=False))
+    monkeypatch.setattr(app.retriever, "search",
+                        lambda db_name, query, top_k=None: {"files": [{"file": "纵深防御是多层防护", "score": 0.9}]})
+    monkeypatch.setattr(app, "two_phase_retrieval", lambda user_input, docs: docs)
+    app.conversation_store.clear()
+    yield app.app.test_client()
+    app.conversation_store.clear()
+
+
+def _events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chat_stream_event_order(flask_client, monkeypatch):
+    _stream_client(monkeypatch, app.client, _response(SSE_BODY, "text/event-stream"))
+
+    events = _events(flask_client.post("/chat/stream", json={"message": "什么是纵深防御"}).get_data(as_text=True))
+
+    names = [name for name, _ in events]
+    assert names[0] == "meta" and names[-1] == "done"
+    assert set(names[1:-1]) == {"token"}
+    assert "".join(data["text"] for name, data in events if name == "token") == "网络安全需要纵深防御"
+    conversation_id = events[0][1]["conversation_id"]
+    assert events[-1][1]["conversation_id"] == conversation_id
+    assert app.conversation_store.message_count(conversation_id) == 2
+
+
+def test_chat_stream_upstream_error_mid_stream(flask_client, monkeypatch):
+    body = 'data: {"response": "网络"}\n\n'.encode("utf-8")
+    _stream_client(monkeypatch, app.client, _response(body, "text/event-stream", _BrokenRaw))
+
+    events = _events(flask_client.post("/chat/stream", json={"message": "什么是纵深防御"}).get_data(as_text=True))
+
+    assert [name for name, _ in events][0] == "meta"
+    assert events[-1][0] == "error" and "connection reset" in events[-1][1]["error"]
+    assert "done" not in [name for name, _ in events]
+    assert app.conversation_store.message_count(events[0][1]["conversation_id"]) == 0
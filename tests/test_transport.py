@@ -0,0 +1,62 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from transport import PooledTransport
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sequential_requests_reuse_one_connection(server_url):
+    transport = PooledTransport(pool_size=4, pool_block=False)
+    for _ in range(5):
+        assert transport.session().get(server_url, timeout=5).text == "ok"
+
+    stats = transport.stats()
+    assert stats["checkouts"] == 5 and stats["new_connections"] == 1
+    assert stats["in_use"] == 0
+
+
+def test_threads_share_the_pool(server_url):
+    transport = PooledTransport(pool_size=2, pool_block=True)
+    sessions = []
+
+    def worker():
+        session = transport.session()
+        sessions.append(session)
+        for _ in range(3):
+            session.get(server_url, timeout=5)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = transport.stats()
+    assert len({id(s) for s in sessions}) == 4
+    assert stats["checkouts"] == 12
+    assert stats["new_connections"] <= 2 and stats["peak_in_use"] <= 2
@@ -0,0 +1,63 @@
+import threading
+
+from ingestion import AdaptiveUploader, document_size
+
+
+def _items(n, size=100):
+    return [(f"h{i}", {"file": "x" * size, "metadata": {"i": i}}) for i in range(n)]
+
+
+def _uploader(upload, **kwargs):
+    options = dict(batch_bytes=1000, min_batch_bytes=100, max_batch_bytes=10000, max_batch_docs=100,
+                   concurrency=2, min_concurrency=1, max_concurrency=8, target_latency=10.0,
+                   progress_interval=3600)
+    options.update(kwargs)
+    return AdaptiveUploader(upload, **options)
+
+
+def test_batches_respect_byte_limit_and_keep_every_document():
+    batches = []
+    lock = threading.Lock()
+
+    def upload(batch, batch_index):
+        with lock:
+            batches.append(batch)
+        return len(batch)
+
+    items = _items(40)
+    uploader = _uploader(upload, max_batch_bytes=1000)
+    assert uploader.run(items) == 40
+
+    assert len(batches) > 1
+    assert all(sum(document_size(doc) for _, doc in batch) <= 1000 for batch in batches)
+    assert sorted(h for batch in batches for h, _ in batch) == sorted(h for h, _ in items)
+
+
+def test_oversized_document_gets_its_own_batch():
+    sizes = []
+    uploader = _uploader(lambda batch, index: sizes.append(len(batch)) or len(batch), concurrency=1,
+                         max_concurrency=1)
+    uploader.run(_items(1, size=5000) + _items(2))
+    assert sizes[0] == 1
+
+
+def test_failures_halve_concurrency_and_batch_bytes():
+    uploader = _uploader(lambda batch, index: 0, concurrency=8, batch_bytes=4000)
+    assert uploader.run(_items(20)) == 0
+    assert uploader.concurrency < 8 and uploader.batch_bytes < 4000
+    assert uploader.stats()["failed_batches"] == uploader.stats()["batches"]
+
+
+def test_fast_success_grows_concurrency():
+    uploader = _uploader(lambda batch, index: len(batch), concurrency=2)
+    uploader.run(_items(50))
+    assert uploader.concurrency > 2 and uploader.batch_bytes > 1000
+
+
+def test_upload_exception_counts_as_failed_batch():
+    def upload(batch, index):
+        raise RuntimeError("connection reset")
+
+    uploader = _uploader(upload)
+    assert uploader.run(_items(3)) == 0
+    assert uploader.failed_batches == uploader.batches >= 1
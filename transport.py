@@ -0,0 +1,156 @@
+"""
+共享的 HTTP 传输层。
+
+所有模块（APIClient、批量评估、向量库上传）通过同一个 HTTPAdapter 访问上游，复用同一组
+keep-alive 连接池（每个 host 一个池，大小由 TRANSPORT_POOL_SIZE 配置）。
+requests.Session 本身不保证线程安全，因此每个线程使用自己的 Session，
+这些 Session 挂载的是同一个 adapter，连接池（urllib3 的池是线程安全的）在线程间共享。
+
+连接池的使用情况（新建连接数、取连接时池已耗尽的次数与等待时间、溢出后被丢弃的连接数）
+通过 stats() 暴露，用于判断池大小是否合适。
+"""
+import socket
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from config import config
+
+
+class PoolStats:
+    """连接池使用统计，线程安全"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.new_connections = 0
+        self.exhausted = 0          # 取连接时池中没有空闲连接的次数
+        self.wait_seconds = 0.0     # 阻塞模式下等待空闲连接的累计时间
+        self.max_wait_seconds = 0.0
+        self.discarded = 0          # 归还时池已满、被关闭的连接数（非阻塞模式下的溢出连接）
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def checkout(self, exhausted: bool, waited: float):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if exhausted:
+                self.exhausted += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def checkin(self, discarded: bool):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+            if discarded:
+                self.discarded += 1
+
+    def new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "new_connections": self.new_connections,
+                "reuse_ratio": round(1 - self.new_connections / self.checkouts, 3) if self.checkouts else 0.0,
+                "exhausted": self.exhausted,
+                "wait_ms_total": round(self.wait_seconds * 1000, 1),
+                "wait_ms_max": round(self.max_wait_seconds * 1000, 1),
+                "discarded": self.discarded,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+            }
+
+
+class _InstrumentedPoolMixin:
+    """在 urllib3 连接池取 / 还连接与新建连接处计数"""
+    pool_stats: PoolStats = None
+
+    def _get_conn(self, timeout=None):
+        exhausted = self.pool is not None and self.pool.empty()
+        started = time.monotonic()
+        conn = super()._get_conn(timeout=timeout)
+        self.pool_stats.checkout(exhausted, time.monotonic() - started if self.block else 0.0)
+        return conn
+
+    def _put_conn(self, conn):
+        discarded = self.pool is not None and self.pool.full()
+        super()._put_conn(conn)
+        self.pool_stats.checkin(discarded)
+
+    def _new_conn(self):
+        self.pool_stats.new_connection()
+        return super()._new_conn()
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """使用带统计的连接池的 HTTPAdapter，可选开启 TCP keep-alive 探测"""
+
+    def __init__(self, pool_stats: PoolStats, tcp_keepalive: bool = True, **kwargs):
+        self.pool_stats = pool_stats
+        self.tcp_keepalive = tcp_keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.tcp_keepalive:
+            pool_kwargs.setdefault("socket_options",
+                                   HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+        attrs = {"pool_stats": self.pool_stats}
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("InstrumentedHTTPConnectionPool", (_InstrumentedPoolMixin, HTTPConnectionPool), attrs),
+            "https": type("InstrumentedHTTPSConnectionPool", (_InstrumentedPoolMixin, HTTPSConnectionPool), attrs),
+        }
+
+
+class PooledTransport:
+    """共享连接池 + 线程本地 Session"""
+
+    def __init__(self, pool_size: int = None, pool_block: bool = None, max_hosts: int = None,
+                 tcp_keepalive: bool = None):
+        self.pool_size = pool_size if pool_size is not None else config.TRANSPORT_POOL_SIZE
+        self.pool_block = pool_block if pool_block is not None else config.TRANSPORT_POOL_BLOCK
+        self.pool_stats = PoolStats()
+        self.adapter = InstrumentedAdapter(
+            self.pool_stats,
+            tcp_keepalive=tcp_keepalive if tcp_keepalive is not None else config.TRANSPORT_TCP_KEEPALIVE,
+            pool_connections=max_hosts if max_hosts is not None else config.TRANSPORT_MAX_HOSTS,
+            pool_maxsize=self.pool_size,
+            pool_block=self.pool_block,
+        )
+        self._local = threading.local()
+
+    def session(self) -> requests.Session:
+        """当前线程的 Session（首次调用时创建），所有线程共享同一个 adapter 与连接池"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+        return session
+
+    def stats(self) -> Dict:
+        return {"pool_size": self.pool_size, "pool_block": self.pool_block, **self.pool_stats.snapshot()}
+
+
+_transport: Optional[PooledTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> PooledTransport:
+    """进程内共享的传输层（惰性创建）"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = PooledTransport()
+        return _transport